@@ -3,9 +3,30 @@
 
 import sys
 import os
+import re
+import csv
+import queue
+import argparse
+import hashlib
+import inspect
+import logging
+import functools
+import unicodedata
+import threading
+import time
+import json
+import asyncio
 import sqlite3
+import http.client
+import urllib.parse
+from http import HTTPStatus
 from pathlib import Path
 import datetime
+import decimal
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import Future, ThreadPoolExecutor
 import tkinter as tk
 from tkinter import messagebox, simpledialog, filedialog, scrolledtext, ttk, font
 from PIL import Image, ImageTk
@@ -72,8 +93,6 @@ def tela_boas_vindas():
     janela.bind('<Return>', lambda event: fechar_janela(janela))
     janela.mainloop()
 
-tela_boas_vindas()
-
 # Conectar ao banco de dados SQLite
 if getattr(sys, 'frozen', False):
     # Se o aplicativo está congelado com PyInstaller, o caminho é o diretório do executável
@@ -87,52 +106,552 @@ appdata_path = Path.home() / 'AppData' / 'Local' / 'GerenciadorDeEstoque'
 appdata_path.mkdir(parents=True, exist_ok=True)
 caminho_banco_de_dados = appdata_path / 'estoque_local.db'
 
-# Conectar ao banco de dados SQLite
-conexao = sqlite3.connect(str(caminho_banco_de_dados))
-cursor = conexao.cursor()
-
-# Criar a tabela de produtos, se ela não existir
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS produtos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    quantidade INTEGER NOT NULL,
-    preco_venda REAL NOT NULL,
-    caminho_imagem TEXT
-)
-''')
-conexao.commit()
-# Criar a tabela de movimentações, se ela não existir
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS movimentacoes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    produto_id INTEGER NOT NULL,
-    tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
-    quantidade INTEGER NOT NULL,
-    data_hora TEXT NOT NULL,
-    FOREIGN KEY (produto_id) REFERENCES produtos (id)
-)
-''')
-conexao.commit()
-# Criação da tabela de configurações, se ela não existir
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS configuracoes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    chave TEXT NOT NULL,
-    valor INTEGER NOT NULL
-)
-''')
-conexao.commit()
-# Criação da lista para melgor configuração de alerta do estoque baixo
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS alertas (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    produto_id INTEGER NOT NULL,
-    valor INTEGER NOT NULL,
-    FOREIGN KEY (produto_id) REFERENCES produtos (id)
-)
-''')
-conexao.commit()
+# Migrações do esquema do banco de dados
+# Cada função leva o banco de uma versão para a seguinte; a versão atual fica gravada em PRAGMA user_version,
+# então um estoque_local.db antigo é atualizado no lugar, uma migração por vez, sem perder dados
+def _migracao_tabelas_iniciais(cursor):
+    # Criar a tabela de produtos, se ela não existir
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS produtos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        quantidade INTEGER NOT NULL,
+        preco_venda REAL NOT NULL,
+        caminho_imagem TEXT
+    )
+    ''')
+    # Criar a tabela de movimentações, se ela não existir
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS movimentacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER NOT NULL,
+        tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
+        quantidade INTEGER NOT NULL,
+        data_hora TEXT NOT NULL,
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    )
+    ''')
+    # Criação da tabela de configurações, se ela não existir
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS configuracoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chave TEXT NOT NULL,
+        valor INTEGER NOT NULL
+    )
+    ''')
+    # Criação da lista para melgor configuração de alerta do estoque baixo
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alertas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER NOT NULL,
+        valor INTEGER NOT NULL,
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    )
+    ''')
+
+def _migracao_indices_e_unicidade(cursor):
+    # Bancos antigos podem ter o mesmo nome cadastrado mais de uma vez: junta as cópias no produto de menor id,
+    # somando as quantidades e levando junto as movimentações e os alertas
+    cursor.execute("CREATE TEMP TABLE produtos_duplicados (id_antigo INTEGER PRIMARY KEY, id_novo INTEGER NOT NULL)")
+    cursor.execute('''
+    INSERT INTO produtos_duplicados (id_antigo, id_novo)
+    SELECT p.id, g.id_novo
+    FROM produtos p
+    JOIN (SELECT nome, MIN(id) AS id_novo FROM produtos GROUP BY nome HAVING COUNT(*) > 1) g ON g.nome = p.nome
+    WHERE p.id <> g.id_novo
+    ''')
+    cursor.execute('''
+    UPDATE produtos SET quantidade = quantidade + (
+        SELECT SUM(p.quantidade) FROM produtos_duplicados d JOIN produtos p ON p.id = d.id_antigo WHERE d.id_novo = produtos.id
+    )
+    WHERE id IN (SELECT id_novo FROM produtos_duplicados)
+    ''')
+    for tabela in ('movimentacoes', 'alertas'):
+        cursor.execute(f'''
+        UPDATE {tabela} SET produto_id = (SELECT id_novo FROM produtos_duplicados WHERE id_antigo = {tabela}.produto_id)
+        WHERE produto_id IN (SELECT id_antigo FROM produtos_duplicados)
+        ''')
+    cursor.execute("DELETE FROM produtos WHERE id IN (SELECT id_antigo FROM produtos_duplicados)")
+    cursor.execute("DROP TABLE temp.produtos_duplicados")
+
+    # Mantém apenas um alerta por produto (o mais recente) e descarta alertas de produtos que não existem mais
+    cursor.execute("DELETE FROM alertas WHERE id NOT IN (SELECT MAX(id) FROM alertas GROUP BY produto_id)")
+    cursor.execute("DELETE FROM alertas WHERE produto_id NOT IN (SELECT id FROM produtos)")
+
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_nome ON produtos (nome)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alertas_produto ON alertas (produto_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_produto_data ON movimentacoes (produto_id, data_hora)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_data_hora ON movimentacoes (data_hora)")
+
+def _migracao_busca_textual(cursor):
+    # Índice de texto completo sobre o nome dos produtos: o tokenizador unicode61 remove os acentos,
+    # então "acucar" encontra "açúcar", e os índices de prefixo aceleram a busca enquanto o nome é digitado
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+        nome,
+        content='produtos',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''')
+    # Gatilhos que mantêm o índice em sincronia com a tabela de produtos
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_inserir AFTER INSERT ON produtos BEGIN
+        INSERT INTO produtos_fts (rowid, nome) VALUES (new.id, new.nome);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_apagar AFTER DELETE ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_atualizar AFTER UPDATE OF nome ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+        INSERT INTO produtos_fts (rowid, nome) VALUES (new.id, new.nome);
+    END
+    ''')
+    # Indexa os produtos que já existem
+    cursor.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')")
+
+def _migracao_estoque_baixo(cursor):
+    # Conjunto dos produtos que estão com a quantidade igual ou abaixo do limite de alerta, mantido pelo próprio
+    # banco: a lista de alertas passa a custar o número de produtos em alerta, e não o tamanho do catálogo
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS estoque_baixo (
+        produto_id INTEGER PRIMARY KEY,
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    )
+    ''')
+    # Mudou a quantidade do produto: reavalia só esse produto
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS estoque_baixo_quantidade AFTER UPDATE OF quantidade ON produtos BEGIN
+        DELETE FROM estoque_baixo WHERE produto_id = new.id;
+        INSERT INTO estoque_baixo (produto_id)
+        SELECT new.id FROM alertas WHERE produto_id = new.id AND new.quantidade <= valor;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS estoque_baixo_apagar_produto AFTER DELETE ON produtos BEGIN
+        DELETE FROM estoque_baixo WHERE produto_id = old.id;
+    END
+    ''')
+    # Criou, mudou ou removeu o limite de alerta
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS estoque_baixo_inserir_alerta AFTER INSERT ON alertas BEGIN
+        DELETE FROM estoque_baixo WHERE produto_id = new.produto_id;
+        INSERT INTO estoque_baixo (produto_id)
+        SELECT id FROM produtos WHERE id = new.produto_id AND quantidade <= new.valor;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS estoque_baixo_atualizar_alerta AFTER UPDATE ON alertas BEGIN
+        DELETE FROM estoque_baixo WHERE produto_id IN (old.produto_id, new.produto_id);
+        INSERT INTO estoque_baixo (produto_id)
+        SELECT id FROM produtos WHERE id = new.produto_id AND quantidade <= new.valor;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS estoque_baixo_apagar_alerta AFTER DELETE ON alertas BEGIN
+        DELETE FROM estoque_baixo WHERE produto_id = old.produto_id;
+    END
+    ''')
+    # Preenche com a situação atual
+    cursor.execute('''
+    INSERT OR IGNORE INTO estoque_baixo (produto_id)
+    SELECT p.id FROM produtos p JOIN alertas a ON a.produto_id = p.id WHERE p.quantidade <= a.valor
+    ''')
+
+def _migracao_resumo_diario(cursor):
+    # Resumo por produto, dia e tipo das movimentações que a compactação tirou da tabela movimentacoes
+    # (as linhas originais vão para o banco de arquivo)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS movimentacoes_resumo_diario (
+        produto_id INTEGER NOT NULL,
+        dia TEXT NOT NULL,  -- '%Y-%m-%d'
+        tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
+        quantidade INTEGER NOT NULL,
+        movimentacoes INTEGER NOT NULL,  -- quantas movimentações foram resumidas nesta linha
+        PRIMARY KEY (produto_id, dia, tipo),
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    ) WITHOUT ROWID
+    ''')
+
+def _migracao_vendas_diarias(cursor):
+    # Totais de vendas atualizados por gatilho na mesma transação que registra a saída, para que as análises
+    # de vendas não precisem ler as movimentações:
+    # - vendas_diarias: por produto e dia
+    # - vendas_mensais: por produto e mês, para que um período de um ano leia ~12 linhas por produto
+    # - vendas_totais_diarias: todos os produtos somados, por dia
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_diarias (
+        produto_id INTEGER NOT NULL,
+        dia TEXT NOT NULL,  -- '%Y-%m-%d'
+        quantidade INTEGER NOT NULL,
+        receita REAL NOT NULL,  -- quantidade vendida x preço de venda no momento da saída
+        PRIMARY KEY (produto_id, dia),
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendas_diarias_dia ON vendas_diarias (dia, produto_id, quantidade, receita)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_mensais (
+        produto_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,  -- '%Y-%m'
+        quantidade INTEGER NOT NULL,
+        receita REAL NOT NULL,
+        PRIMARY KEY (produto_id, mes),
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendas_mensais_mes ON vendas_mensais (mes, produto_id, quantidade, receita)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_totais_diarias (
+        dia TEXT PRIMARY KEY,  -- '%Y-%m-%d'
+        quantidade INTEGER NOT NULL,
+        receita REAL NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+    # Cada saída soma na linha do produto no dia; a linha do dia repassa a diferença para o mês e o total
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS vendas_diarias_saida AFTER INSERT ON movimentacoes WHEN new.tipo = 'saida' BEGIN
+        INSERT INTO vendas_diarias (produto_id, dia, quantidade, receita)
+        SELECT new.produto_id, substr(new.data_hora, 1, 10), new.quantidade, new.quantidade * preco_venda
+        FROM produtos WHERE id = new.produto_id
+        ON CONFLICT (produto_id, dia) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            receita = receita + excluded.receita;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS vendas_diarias_inserir AFTER INSERT ON vendas_diarias BEGIN
+        INSERT INTO vendas_mensais (produto_id, mes, quantidade, receita)
+        VALUES (new.produto_id, substr(new.dia, 1, 7), new.quantidade, new.receita)
+        ON CONFLICT (produto_id, mes) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            receita = receita + excluded.receita;
+        INSERT INTO vendas_totais_diarias (dia, quantidade, receita)
+        VALUES (new.dia, new.quantidade, new.receita)
+        ON CONFLICT (dia) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            receita = receita + excluded.receita;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS vendas_diarias_atualizar AFTER UPDATE ON vendas_diarias BEGIN
+        UPDATE vendas_mensais SET quantidade = quantidade + new.quantidade - old.quantidade,
+                                  receita = receita + new.receita - old.receita
+        WHERE produto_id = new.produto_id AND mes = substr(new.dia, 1, 7);
+        UPDATE vendas_totais_diarias SET quantidade = quantidade + new.quantidade - old.quantidade,
+                                         receita = receita + new.receita - old.receita
+        WHERE dia = new.dia;
+    END
+    ''')
+    # Quando um produto é apagado, as suas vendas saem também dos totais
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS vendas_diarias_apagar AFTER DELETE ON vendas_diarias BEGIN
+        UPDATE vendas_mensais SET quantidade = quantidade - old.quantidade, receita = receita - old.receita
+        WHERE produto_id = old.produto_id AND mes = substr(old.dia, 1, 7);
+        DELETE FROM vendas_mensais WHERE produto_id = old.produto_id AND mes = substr(old.dia, 1, 7) AND quantidade = 0;
+        UPDATE vendas_totais_diarias SET quantidade = quantidade - old.quantidade, receita = receita - old.receita
+        WHERE dia = old.dia;
+    END
+    ''')
+
+    # Preenche com as saídas já registradas (inclusive as resumidas pela compactação); como o preço da época
+    # não foi guardado, a receita do passado usa o preço de venda atual
+    cursor.execute('''
+    INSERT INTO vendas_diarias (produto_id, dia, quantidade, receita)
+    SELECT v.produto_id, v.dia, SUM(v.quantidade), SUM(v.quantidade) * p.preco_venda
+    FROM (
+        SELECT produto_id, substr(data_hora, 1, 10) AS dia, quantidade FROM movimentacoes WHERE tipo = 'saida'
+        UNION ALL
+        SELECT produto_id, dia, quantidade FROM movimentacoes_resumo_diario WHERE tipo = 'saida'
+    ) v
+    JOIN produtos p ON p.id = v.produto_id
+    GROUP BY v.produto_id, v.dia
+    ''')
+
+def _migracao_codigo_barras(cursor):
+    # Código de barras lido pelo leitor do caixa; é opcional, mas não pode se repetir entre produtos
+    cursor.execute("ALTER TABLE produtos ADD COLUMN codigo_barras TEXT")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_codigo_barras ON produtos (codigo_barras) WHERE codigo_barras IS NOT NULL")
+
+def _migracao_vendas(cursor):
+    # Uma venda agrupa os itens levados pelo cliente: cabeçalho em vendas, um item por produto em vendas_itens
+    # e, em movimentacoes, uma saída por item com o venda_id
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vendas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_hora TEXT NOT NULL,
+        total REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendas_data_hora ON vendas (data_hora)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_itens (
+        venda_id INTEGER NOT NULL,
+        produto_id INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL,
+        preco_unitario REAL NOT NULL,  -- preço de venda do produto no momento da venda
+        PRIMARY KEY (venda_id, produto_id),
+        FOREIGN KEY (venda_id) REFERENCES vendas (id),
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("ALTER TABLE movimentacoes ADD COLUMN venda_id INTEGER REFERENCES vendas (id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_venda ON movimentacoes (venda_id) WHERE venda_id IS NOT NULL")
+
+# Saldo de uma linha de movimentacoes (alias m): positivo nas entradas e negativo nas saídas
+SALDO_MOVIMENTACAO = "CASE m.tipo WHEN 'entrada' THEN m.quantidade ELSE -m.quantidade END"
+
+# A cada quantas movimentações de um produto é gravado um ponto de controle do estoque; a consulta do estoque
+# em uma data repassa no máximo cerca dessa quantidade de movimentações por produto
+INTERVALO_PONTOS_CONTROLE = 100
+
+def _migracao_pontos_controle(cursor):
+    # Quantidade de cada produto em momentos do histórico, para saber o estoque em uma data sem somar todas as
+    # movimentações desde o início: o ponto (data_hora, ultima_movimentacao_id) vale depois de todas as
+    # movimentações do produto com (data_hora, id) até esse par
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pontos_controle_estoque (
+        produto_id INTEGER NOT NULL,
+        data_hora TEXT NOT NULL,
+        ultima_movimentacao_id INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL,
+        PRIMARY KEY (produto_id, data_hora, ultima_movimentacao_id),
+        FOREIGN KEY (produto_id) REFERENCES produtos (id)
+    ) WITHOUT ROWID
+    ''')
+    # O índice por produto e data passa a cobrir tipo e quantidade: repassar as movimentações de um produto lê só
+    # o índice, sem buscar cada linha na tabela
+    cursor.execute("DROP INDEX IF EXISTS idx_movimentacoes_produto_data")
+    cursor.execute("CREATE INDEX idx_movimentacoes_produto_data ON movimentacoes (produto_id, data_hora, tipo, quantidade)")
+    _gerar_pontos_controle_historicos(cursor)
+
+def _gerar_pontos_controle_historicos(cursor, intervalo=INTERVALO_PONTOS_CONTROLE):
+    # Um ponto a cada 'intervalo' movimentações de cada produto, calculado de trás para frente a partir da
+    # quantidade atual: depois da movimentação k, o produto tinha a quantidade atual menos o saldo das
+    # movimentações posteriores a k. Lê todas as movimentações do banco principal uma vez (cerca de 7 s por
+    # milhão de movimentações); as duas janelas usam a mesma ordem, para que o SQLite ordene uma vez só
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO pontos_controle_estoque (produto_id, data_hora, ultima_movimentacao_id, quantidade)
+    SELECT h.produto_id, h.data_hora, h.id, p.quantidade - COALESCE(h.saldo_posterior, 0)
+    FROM (
+        SELECT m.produto_id, m.data_hora, m.id,
+               SUM({SALDO_MOVIMENTACAO}) OVER (historico ROWS BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING) AS saldo_posterior,
+               ROW_NUMBER() OVER historico AS posicao
+        FROM movimentacoes m
+        WINDOW historico AS (PARTITION BY m.produto_id ORDER BY m.data_hora, m.id)
+    ) h
+    JOIN produtos p ON p.id = h.produto_id
+    WHERE h.posicao % ? = 0
+    ''', (intervalo,))
+
+# Nome do banco de arquivo das movimentações compactadas, ao lado do banco principal
+NOME_BANCO_ARQUIVO = 'estoque_arquivo.db'
+
+# Expressões que convertem os valores antigos: preço REAL em reais para centavos e data_hora TEXT
+# ("%Y-%m-%d %H:%M:%S", no fuso local) para segundos desde 1970
+PARA_CENTAVOS = "CAST(round({} * 100) AS INTEGER)"
+PARA_SEGUNDOS = "CAST(strftime('%s', {}, 'utc') AS INTEGER)"
+
+def _reconstruir_tabela(cursor, tabela, definicao, selecao):
+    # O SQLite não muda o tipo de uma coluna: cria a tabela de novo com a definicao (o corpo do CREATE TABLE,
+    # depois do nome), copia as linhas com a selecao (as expressões do SELECT sobre a tabela antiga, na ordem
+    # das colunas) e recria os índices e gatilhos da tabela; o próximo id de AUTOINCREMENT é mantido
+    # Com legacy_alter_table, o RENAME não confere os gatilhos das outras tabelas, que continuam valendo
+    objetos = cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                             (tabela,)).fetchall()
+    sequencia = None
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+        sequencia = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,)).fetchone()
+    cursor.execute(f"CREATE TABLE {tabela}_nova {definicao}")
+    cursor.execute(f"INSERT INTO {tabela}_nova SELECT {selecao} FROM {tabela}")
+    cursor.execute(f"DROP TABLE {tabela}")
+    cursor.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+    for sql, in objetos:
+        cursor.execute(sql)
+    if sequencia:
+        cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (sequencia[0], tabela))
+
+def _migracao_valores_numericos(cursor):
+    # Datas e horas em inteiros (segundos desde 1970, UTC) e valores em dinheiro em inteiros (centavos):
+    # linhas e índices menores, comparações de inteiros nos intervalos de datas, nenhuma conversão de texto por
+    # linha nas listas e totais sem erro de arredondamento de float
+    # Os totais por dia (dia TEXT, '%Y-%m-%d') continuam como estão: o dia de cada movimentação é o do fuso local
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        _reconstruir_tabela(cursor, 'produtos', '''(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            preco_venda INTEGER NOT NULL,  -- centavos
+            caminho_imagem TEXT,
+            codigo_barras TEXT
+        )''', f"id, nome, quantidade, {PARA_CENTAVOS.format('preco_venda')}, caminho_imagem, codigo_barras")
+        # O gatilho das vendas por dia é trocado pelo que tira o dia do data_hora inteiro
+        cursor.execute("DROP TRIGGER vendas_diarias_saida")
+        _reconstruir_tabela(cursor, 'movimentacoes', '''(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
+            quantidade INTEGER NOT NULL,
+            data_hora INTEGER NOT NULL,  -- segundos desde 1970 (UTC)
+            venda_id INTEGER REFERENCES vendas (id),
+            FOREIGN KEY (produto_id) REFERENCES produtos (id)
+        )''', f"id, produto_id, tipo, quantidade, {PARA_SEGUNDOS.format('data_hora')}, venda_id")
+        cursor.execute('''
+        CREATE TRIGGER vendas_diarias_saida AFTER INSERT ON movimentacoes WHEN new.tipo = 'saida' BEGIN
+            INSERT INTO vendas_diarias (produto_id, dia, quantidade, receita)
+            SELECT new.produto_id, date(new.data_hora, 'unixepoch', 'localtime'), new.quantidade, new.quantidade * preco_venda
+            FROM produtos WHERE id = new.produto_id
+            ON CONFLICT (produto_id, dia) DO UPDATE SET
+                quantidade = quantidade + excluded.quantidade,
+                receita = receita + excluded.receita;
+        END
+        ''')
+        _reconstruir_tabela(cursor, 'vendas', '''(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data_hora INTEGER NOT NULL,  -- segundos desde 1970 (UTC)
+            total INTEGER NOT NULL  -- centavos
+        )''', f"id, {PARA_SEGUNDOS.format('data_hora')}, {PARA_CENTAVOS.format('total')}")
+        _reconstruir_tabela(cursor, 'vendas_itens', '''(
+            venda_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            preco_unitario INTEGER NOT NULL,  -- centavos; preço de venda do produto no momento da venda
+            PRIMARY KEY (venda_id, produto_id),
+            FOREIGN KEY (venda_id) REFERENCES vendas (id),
+            FOREIGN KEY (produto_id) REFERENCES produtos (id)
+        ) WITHOUT ROWID''', f"venda_id, produto_id, quantidade, {PARA_CENTAVOS.format('preco_unitario')}")
+        for tabela, chave in (('vendas_diarias', 'dia'), ('vendas_mensais', 'mes')):
+            _reconstruir_tabela(cursor, tabela, f'''(
+                produto_id INTEGER NOT NULL,
+                {chave} TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                receita INTEGER NOT NULL,  -- centavos
+                PRIMARY KEY (produto_id, {chave}),
+                FOREIGN KEY (produto_id) REFERENCES produtos (id)
+            ) WITHOUT ROWID''', f"produto_id, {chave}, quantidade, {PARA_CENTAVOS.format('receita')}")
+        _reconstruir_tabela(cursor, 'vendas_totais_diarias', '''(
+            dia TEXT PRIMARY KEY,  -- '%Y-%m-%d'
+            quantidade INTEGER NOT NULL,
+            receita INTEGER NOT NULL  -- centavos
+        ) WITHOUT ROWID''', f"dia, quantidade, {PARA_CENTAVOS.format('receita')}")
+        _reconstruir_tabela(cursor, 'pontos_controle_estoque', '''(
+            produto_id INTEGER NOT NULL,
+            data_hora INTEGER NOT NULL,  -- segundos desde 1970 (UTC)
+            ultima_movimentacao_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            PRIMARY KEY (produto_id, data_hora, ultima_movimentacao_id),
+            FOREIGN KEY (produto_id) REFERENCES produtos (id)
+        ) WITHOUT ROWID''', f"produto_id, {PARA_SEGUNDOS.format('data_hora')}, ultima_movimentacao_id, quantidade")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    # As estatísticas do ANALYZE das tabelas recriadas foram descartadas junto com elas
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        cursor.execute("ANALYZE")
+
+    # O banco de arquivo, se existir, tem as movimentações compactadas com data_hora em texto
+    caminho_banco = cursor.execute("PRAGMA database_list").fetchone()[2]
+    if caminho_banco:
+        _converter_banco_arquivo(Path(caminho_banco).with_name(NOME_BANCO_ARQUIVO))
+
+def _converter_banco_arquivo(caminho_arquivo):
+    # Converte o data_hora das movimentações arquivadas para inteiro, em uma conexão própria (um banco não pode
+    # ser anexado no meio da transação da migração). Se a migração do banco principal falhar depois disso, a
+    # próxima tentativa encontra o arquivo já convertido e não faz nada
+    if not caminho_arquivo.exists():
+        return
+    conexao = sqlite3.connect(str(caminho_arquivo), timeout=TEMPO_ESPERA_BLOQUEIO)
+    try:
+        colunas = {coluna[1]: coluna[2] for coluna in conexao.execute("PRAGMA table_info(movimentacoes)")}
+        if colunas.get('data_hora', 'INTEGER').upper() == 'INTEGER':
+            return
+        copia = sqlite3.connect(f"{caminho_arquivo}.bak")
+        conexao.backup(copia)
+        copia.close()
+        venda_id = 'venda_id' if 'venda_id' in colunas else 'NULL'
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN")
+        _reconstruir_tabela(cursor, 'movimentacoes', '''(
+            id INTEGER PRIMARY KEY,
+            produto_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
+            quantidade INTEGER NOT NULL,
+            data_hora INTEGER NOT NULL,  -- segundos desde 1970 (UTC)
+            venda_id INTEGER
+        )''', f"id, produto_id, tipo, quantidade, {PARA_SEGUNDOS.format('data_hora')}, {venda_id}")
+        conexao.commit()
+    except Exception:
+        conexao.rollback()
+        raise
+    finally:
+        conexao.close()
+
+# Lista ordenada das migrações: a posição + 1 é a versão do esquema que cada uma produz
+MIGRACOES = [
+    _migracao_tabelas_iniciais,
+    _migracao_indices_e_unicidade,
+    _migracao_busca_textual,
+    _migracao_estoque_baixo,
+    _migracao_resumo_diario,
+    _migracao_vendas_diarias,
+    _migracao_codigo_barras,
+    _migracao_vendas,
+    _migracao_pontos_controle,
+    _migracao_valores_numericos,
+]
+
+def migrar_banco_de_dados(conexao):
+    versao_atual = conexao.execute("PRAGMA user_version").fetchone()[0]
+    if versao_atual >= len(MIGRACOES):
+        return
+
+    # Antes de alterar um banco que já tem dados, guarda uma cópia dele ao lado do arquivo original
+    caminho_arquivo = conexao.execute("PRAGMA database_list").fetchone()[2]
+    possui_tabelas = conexao.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] > 0
+    if caminho_arquivo and possui_tabelas:
+        copia = sqlite3.connect(f"{caminho_arquivo}.v{versao_atual}.bak")
+        conexao.backup(copia)
+        copia.close()
+
+    # Cada migração roda em sua própria transação junto com a troca da versão: ou ela é aplicada por inteiro, ou nada muda
+    for versao, migracao in enumerate(MIGRACOES[versao_atual:], start=versao_atual + 1):
+        cursor = conexao.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migracao(cursor)
+            cursor.execute(f"PRAGMA user_version = {versao}")
+            conexao.commit()
+        except Exception:
+            conexao.rollback()
+            raise
+
+# Tempo (em segundos) que uma conexão espera por um bloqueio antes de desistir com "database is locked"
+TEMPO_ESPERA_BLOQUEIO = 10.0
+
+# Conectar ao banco de dados SQLite, já com o esquema na versão mais recente
+# A conexão de escrita coloca o banco em modo WAL: leitores não bloqueiam o escritor e vice-versa,
+# o que permite abrir o aplicativo em mais de um terminal apontando para o mesmo arquivo
+# Com somente_leitura=True, abre uma conexão separada só para consultas
+def conectar_banco_de_dados(caminho_banco=caminho_banco_de_dados, somente_leitura=False):
+    if somente_leitura:
+        uri = f"{Path(caminho_banco).resolve().as_uri()}?mode=ro"
+        conexao = sqlite3.connect(uri, uri=True, timeout=TEMPO_ESPERA_BLOQUEIO)
+    else:
+        conexao = sqlite3.connect(str(caminho_banco), timeout=TEMPO_ESPERA_BLOQUEIO)
+        conexao.execute("PRAGMA journal_mode = WAL")
+    # Em WAL, synchronous=NORMAL continua seguro contra corrupção e evita um fsync a cada commit
+    conexao.execute("PRAGMA synchronous = NORMAL")
+    # Cache de páginas de ~16 MB por conexão
+    conexao.execute("PRAGMA cache_size = -16000")
+    if not somente_leitura:
+        migrar_banco_de_dados(conexao)
+    return conexao
 
 # Função para centralizar a janela
 def centralizar_janela(janela):
@@ -143,16 +662,404 @@ def centralizar_janela(janela):
     y = (janela.winfo_screenheight() // 2) - (altura // 2)
     janela.geometry(f'+{x}+{y}')
 
-def formatar_preco_para_float(valor):
-        # Remove pontos dos milhares
-        valor_sem_pontos = valor.replace('.', '')
-        # Substitui vírgula por ponto para a conversão em float
-        valor_formatado = valor_sem_pontos.replace(',', '.')
-        return float(valor_formatado)
+# No banco, os valores em dinheiro são inteiros em centavos e as datas e horas (data_hora) são inteiros com os
+# segundos desde 1970 (UTC); a conversão para reais e para datas no fuso local acontece só na interface e nos
+# relatórios, com as funções abaixo
+
+def converter_preco_para_centavos(valor):
+    # Converte um preço digitado ("1.234,56") para centavos, sem passar por float
+    # Remove pontos dos milhares e substitui vírgula por ponto
+    valor_formatado = valor.strip().replace('.', '').replace(',', '.')
+    try:
+        reais = decimal.Decimal(valor_formatado)
+    except decimal.InvalidOperation:
+        raise ValueError(f"Preço inválido: '{valor}'.") from None
+    if not reais.is_finite():
+        raise ValueError(f"Preço inválido: '{valor}'.")
+    return int((reais * 100).to_integral_value(decimal.ROUND_HALF_UP))
+
+def converter_preco_csv_para_centavos(valor):
+    # Converte o preço de um arquivo CSV para centavos. Planilhas e sistemas exportam tanto "12.50" quanto
+    # "12,50", então o separador decimal pode ser ponto ou vírgula, com até duas casas; valores ambíguos, com
+    # os dois separadores ou com separador de milhares ("1.250", "1.234,56"), são recusados
+    valor_formatado = valor.strip()
+    if not re.fullmatch(r'-?\d+(?:[.,]\d{1,2})?', valor_formatado):
+        raise ValueError(f"Preço inválido: '{valor}'.")
+    return int((decimal.Decimal(valor_formatado.replace(',', '.')) * 100).to_integral_value(decimal.ROUND_HALF_UP))
+
+def centavos_para_reais(centavos):
+    # Valor numérico em reais, para as células das planilhas exportadas
+    return centavos / 100
+
+def converter_data_para_banco(data, fim_do_dia=False):
+    # Converte uma data digitada (dd/mm/aaaa) para o data_hora do banco, à meia-noite no fuso local
+    # Com fim_do_dia=True, devolve o início do dia seguinte, para usar como limite exclusivo de um período
+    dia = datetime.datetime.strptime(data, '%d/%m/%Y')
+    if fim_do_dia:
+        dia += datetime.timedelta(days=1)
+    return int(dia.timestamp())
+
+def converter_data_para_dia(data, fim_do_dia=False):
+    # Converte uma data digitada (dd/mm/aaaa) para '%Y-%m-%d', o formato dos totais por dia (dia TEXT)
+    dia = datetime.datetime.strptime(data, '%d/%m/%Y').date()
+    if fim_do_dia:
+        dia += datetime.timedelta(days=1)
+    return dia.isoformat()
+
+def formatar_data_hora(data_hora, formato='%d/%m/%Y %H:%M'):
+    # Formata um data_hora do banco no fuso local
+    return time.strftime(formato, time.localtime(data_hora))
+
+def normalizar_nome_produto(nome):
+    # Chave dos nomes no cache do catálogo; os nomes são gravados sem espaços nas pontas
+    return nome.strip()
+
+def dobrar_texto(texto):
+    # Minúsculas e sem acentos, como o índice de texto compara ("Café" e "cafe" ficam iguais)
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto.casefold()) if not unicodedata.combining(c))
+
+def montar_consulta_textual(texto):
+    # Converte o texto digitado em uma consulta FTS5: cada palavra vira um prefixo e todas precisam aparecer no nome
+    palavras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+def formatar_preco_para_edicao(centavos):
+    # Formata um valor em centavos com vírgula para decimais e ponto para milhares ("1.234,56"), como é digitado
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{'-' if centavos < 0 else ''}{reais:,}".replace(',', '.') + f",{resto:02d}"
 
-def formatar_valor_para_exibicao(valor):
-    # Formata o valor para incluir dois decimais, vírgula para decimais e ponto para milhares
-    return f"R$ {valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')    
+def formatar_valor_para_exibicao(centavos):
+    return f"R$ {formatar_preco_para_edicao(centavos)}"
+
+class ExportacaoCancelada(Exception):
+    pass
+
+class EstoqueInsuficiente(ValueError):
+    # Venda recusada porque algum item não tem estoque suficiente; itens_sem_estoque lista
+    # (produto_id, nome, quantidade_pedida, quantidade_disponivel) de cada um desses itens
+    def __init__(self, itens_sem_estoque):
+        self.itens_sem_estoque = itens_sem_estoque
+        descricao = "; ".join(f"{nome}: pedido {pedida}, em estoque {disponivel}" for _, nome, pedida, disponivel in itens_sem_estoque)
+        super().__init__(f"Não há quantidade suficiente no estoque para: {descricao}")
+
+def _formatar_celula_csv(valor):
+    # Números com vírgula decimal, no mesmo formato que a importação de CSV e o Excel em português esperam
+    if isinstance(valor, float):
+        return f"{valor:.2f}".replace('.', ',')
+    return valor
+
+def _gravar_relatorio_csv(linhas, caminho_destino, ao_progredir=None, cancelado=None):
+    linhas_gravadas = 0
+    with open(caminho_destino, 'w', newline='', encoding='utf-8-sig') as arquivo:
+        escritor = csv.writer(arquivo, delimiter=';')
+        for linha in linhas:
+            escritor.writerow([_formatar_celula_csv(valor) for valor in linha])
+            linhas_gravadas += 1
+            if linhas_gravadas % 1000 == 0:
+                if cancelado is not None and cancelado.is_set():
+                    raise ExportacaoCancelada()
+                if ao_progredir:
+                    ao_progredir(linhas_gravadas)
+    return linhas_gravadas
+
+# Quantidade máxima de linhas de uma planilha do Excel
+LIMITE_LINHAS_XLSX = 1048576
+
+def _gravar_relatorio_xlsx(linhas, caminho_destino, titulo, ao_progredir=None, cancelado=None):
+    # O openpyxl só é necessário para exportar em XLSX, por isso é importado apenas aqui
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Para exportar em XLSX, instale o pacote openpyxl (pip install openpyxl).")
+    # No modo write_only as linhas vão direto para o arquivo, sem manter a planilha inteira na memória
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet(title=titulo[:31])
+    linhas_gravadas = 0
+    for linha in linhas:
+        if linhas_gravadas == LIMITE_LINHAS_XLSX:
+            raise ValueError("O relatório passa do limite de linhas de uma planilha XLSX; exporte em CSV.")
+        aba.append(linha)
+        linhas_gravadas += 1
+        if linhas_gravadas % 1000 == 0:
+            if cancelado is not None and cancelado.is_set():
+                raise ExportacaoCancelada()
+            if ao_progredir:
+                ao_progredir(linhas_gravadas)
+    planilha.save(caminho_destino)
+    return linhas_gravadas
+
+class CacheMiniaturas:
+    # Miniaturas das imagens dos produtos em dois níveis:
+    # - em disco, arquivos PNG já reduzidos na pasta AppData, identificados pelo caminho, data de modificação
+    #   e tamanho da imagem original (se a foto for trocada, a chave muda e uma nova miniatura é gerada)
+    # - na memória, um LRU limitado de PhotoImage, para que pesquisas repetidas não leiam nada do disco
+    def __init__(self, diretorio=appdata_path / 'miniaturas', tamanho=(100, 100), limite_memoria=256):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.tamanho = tamanho
+        self.limite_memoria = limite_memoria
+        self.imagens = OrderedDict()
+        self.acertos = 0
+        self.faltas = 0
+        # Threads que decodificam as imagens fora da thread do Tk
+        self.executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='miniaturas')
+
+    def chave(self, caminho_imagem):
+        informacoes = os.stat(caminho_imagem)
+        identificacao = f"{os.path.abspath(caminho_imagem)}|{informacoes.st_mtime_ns}|{informacoes.st_size}|{self.tamanho}"
+        return hashlib.sha1(identificacao.encode('utf-8')).hexdigest()
+
+    def carregar_miniatura(self, caminho_imagem, chave=None):
+        # Devolve a miniatura como imagem do PIL, lendo do disco ou gerando a partir da imagem original
+        # Não usa o Tk, então pode ser chamada fora da thread da interface
+        chave = chave or self.chave(caminho_imagem)
+        caminho_miniatura = self.diretorio / f"{chave}.png"
+        if caminho_miniatura.exists():
+            try:
+                with Image.open(caminho_miniatura) as miniatura:
+                    miniatura.load()
+                    return miniatura.copy()
+            except OSError:
+                pass  # Miniatura corrompida: gera de novo abaixo
+
+        with Image.open(caminho_imagem) as imagem:
+            # Em JPEG, draft faz o decodificador já ler a imagem numa escala reduzida, bem mais rápido
+            imagem.draft('RGB', self.tamanho)
+            imagem.thumbnail(self.tamanho)
+            miniatura = imagem if imagem.mode in ('RGB', 'RGBA', 'L', 'LA', 'P') else imagem.convert('RGB')
+            miniatura = miniatura.copy()
+        # Grava em um arquivo temporário e renomeia, para nunca deixar uma miniatura pela metade no cache
+        caminho_temporario = caminho_miniatura.with_name(f"{chave}.{threading.get_ident()}.tmp")
+        try:
+            miniatura.save(caminho_temporario, format='PNG')
+            os.replace(caminho_temporario, caminho_miniatura)
+        except OSError:
+            if caminho_temporario.exists():
+                os.remove(caminho_temporario)
+        return miniatura
+
+    def obter_da_memoria(self, caminho_imagem):
+        # Devolve o PhotoImage se ele já estiver no LRU, ou None; não lê nenhuma imagem
+        try:
+            chave = self.chave(caminho_imagem)
+        except OSError:
+            return None
+        imagem_tk = self.imagens.get(chave)
+        if imagem_tk is not None:
+            self.acertos += 1
+            self.imagens.move_to_end(chave)
+        return imagem_tk
+
+    def carregar_em_segundo_plano(self, caminho_imagem):
+        # Agenda a leitura da miniatura no pool de threads; o Future resulta em (chave, imagem do PIL)
+        def carregar():
+            chave = self.chave(caminho_imagem)
+            return chave, self.carregar_miniatura(caminho_imagem, chave)
+        self.faltas += 1
+        return self.executor.submit(carregar)
+
+    def obter(self, caminho_imagem):
+        # Devolve a miniatura pronta para exibir (ImageTk.PhotoImage); deve ser chamada na thread do Tk
+        chave = self.chave(caminho_imagem)
+        imagem_tk = self.imagens.get(chave)
+        if imagem_tk is not None:
+            self.acertos += 1
+            self.imagens.move_to_end(chave)
+            return imagem_tk
+        self.faltas += 1
+        return self.guardar(chave, self.carregar_miniatura(caminho_imagem, chave))
+
+    def guardar(self, chave, miniatura):
+        # Cria o PhotoImage e o coloca no LRU, descartando o menos usado quando passa do limite
+        imagem_tk = ImageTk.PhotoImage(miniatura)
+        self.imagens[chave] = imagem_tk
+        self.imagens.move_to_end(chave)
+        while len(self.imagens) > self.limite_memoria:
+            self.imagens.popitem(last=False)
+        return imagem_tk
+
+# Faixas dos histogramas de tempo, em milissegundos (o último intervalo é "acima de 5000 ms")
+FAIXAS_HISTOGRAMA_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+class Instrumentacao:
+    # Medição de desempenho para investigar lentidão relatada pelas lojas; desligada por padrão
+    # - tempo de cada método do Estoque e da AnaliseVendas (histograma por método)
+    # - consultas SQL de cada operação, capturadas por set_trace_callback; o tempo de uma consulta é o intervalo
+    #   até o início da próxima (ou até o fim do método), então inclui a leitura do resultado pelo Python
+    # - tempo das ações da interface, do clique até o Tk terminar de desenhar a janela
+    # - operações acima de limite_lento_ms vão para um log rotativo em AppData/logs, com as consultas que fizeram
+    # Desligada, as classes ficam com os métodos originais e a medição não custa nada; ativar() troca os métodos
+    # pelas versões medidas e desativar() os devolve
+
+    # Quantidade máxima de consultas diferentes guardadas nas estatísticas
+    LIMITE_CONSULTAS_DISTINTAS = 1000
+
+    def __init__(self, diretorio_logs=appdata_path / 'logs', limite_lento_ms=200):
+        self.diretorio_logs = Path(diretorio_logs)
+        self.limite_lento_ms = limite_lento_ms
+        self.ativa = False
+        self.trava = threading.Lock()
+        # Operações da thread atual em andamento: pilha de [nome, inicio, consultas]
+        self.local = threading.local()
+        self.operacoes = {}
+        self.consultas = {}
+        self.log = None
+        # (classe, nome do método, método original, versão medida), preenchida por instrumentar_metodos
+        self.metodos_medidos = []
+
+    def ativar(self, ativa=True):
+        self.ativa = ativa
+        for classe, nome, original, medido in self.metodos_medidos:
+            setattr(classe, nome, medido if ativa else original)
+
+    def zerar(self):
+        with self.trava:
+            self.operacoes.clear()
+            self.consultas.clear()
+
+    def caminho_log(self):
+        return self.diretorio_logs / 'operacoes_lentas.log'
+
+    def _obter_log(self):
+        if self.log is None:
+            self.diretorio_logs.mkdir(parents=True, exist_ok=True)
+            log = logging.getLogger('estoque.operacoes_lentas')
+            log.setLevel(logging.INFO)
+            log.propagate = False
+            if not log.handlers:
+                manipulador = RotatingFileHandler(self.caminho_log(), maxBytes=1024 * 1024, backupCount=5, encoding='utf-8')
+                manipulador.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(message)s'))
+                log.addHandler(manipulador)
+            self.log = log
+        return self.log
+
+    def registrar(self, nome, duracao_ms):
+        # Soma a duração ao histograma da operação
+        with self.trava:
+            estatistica = self.operacoes.get(nome)
+            if estatistica is None:
+                estatistica = self.operacoes[nome] = {'chamadas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                      'faixas': [0] * (len(FAIXAS_HISTOGRAMA_MS) + 1)}
+            estatistica['chamadas'] += 1
+            estatistica['total_ms'] += duracao_ms
+            estatistica['max_ms'] = max(estatistica['max_ms'], duracao_ms)
+            faixa = next((i for i, limite in enumerate(FAIXAS_HISTOGRAMA_MS) if duracao_ms < limite), len(FAIXAS_HISTOGRAMA_MS))
+            estatistica['faixas'][faixa] += 1
+        if duracao_ms >= self.limite_lento_ms:
+            self._obter_log().info(f"{nome}: {duracao_ms:.1f} ms")
+
+    def rastrear(self, sql):
+        # Chamada pelo SQLite no início de cada instrução, na thread da conexão; as instruções internas das tabelas
+        # virtuais (FTS5) chegam comentadas com "--" e ficam no tempo da instrução que as disparou
+        if not self.ativa or sql.startswith('--'):
+            return
+        pilha = getattr(self.local, 'pilha', None)
+        if pilha:
+            pilha[0][2].append((time.perf_counter(), sql))
+
+    def instalar_rastreamento(self, estoque):
+        # set_trace_callback só pode ser chamado na thread dona da conexão, então é instalado na primeira
+        # operação medida de cada Estoque, e não ao ligar a instrumentação
+        if not getattr(estoque, 'rastreamento_instalado', False):
+            estoque.conexao.set_trace_callback(self.rastrear)
+            if estoque.conexao_leitura is not estoque.conexao:
+                estoque.conexao_leitura.set_trace_callback(self.rastrear)
+            estoque.rastreamento_instalado = True
+
+    def executar_medido(self, nome, objeto, metodo, args, kwargs):
+        self.instalar_rastreamento(getattr(objeto, 'estoque', objeto))
+        pilha = getattr(self.local, 'pilha', None)
+        if pilha is None:
+            pilha = self.local.pilha = []
+        pilha.append([nome, time.perf_counter(), []])
+        try:
+            return metodo(objeto, *args, **kwargs)
+        finally:
+            nome, inicio, consultas = pilha.pop()
+            fim = time.perf_counter()
+            self.registrar(nome, (fim - inicio) * 1000)
+            # As consultas ficam com a operação mais externa, que as distribui quando termina
+            if pilha:
+                pilha[-1][2].extend(consultas)
+            elif consultas:
+                self._registrar_consultas(nome, inicio, fim, consultas)
+
+    def _registrar_consultas(self, nome, inicio, fim, consultas):
+        duracoes = []
+        for indice, (inicio_consulta, sql) in enumerate(consultas):
+            fim_consulta = consultas[indice + 1][0] if indice + 1 < len(consultas) else fim
+            duracoes.append(((fim_consulta - inicio_consulta) * 1000, sql))
+        with self.trava:
+            for duracao_ms, sql in duracoes:
+                chave = normalizar_sql(sql)
+                estatistica = self.consultas.get(chave)
+                if estatistica is None:
+                    if len(self.consultas) >= self.LIMITE_CONSULTAS_DISTINTAS:
+                        continue
+                    estatistica = self.consultas[chave] = {'execucoes': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                estatistica['execucoes'] += 1
+                estatistica['total_ms'] += duracao_ms
+                estatistica['max_ms'] = max(estatistica['max_ms'], duracao_ms)
+        if (fim - inicio) * 1000 >= self.limite_lento_ms:
+            mais_lentas = sorted(duracoes, key=lambda consulta: consulta[0], reverse=True)[:5]
+            self._obter_log().info(f"  consultas de {nome}: " + " | ".join(
+                f"{duracao_ms:.1f} ms {' '.join(sql.split())[:300]}" for duracao_ms, sql in mais_lentas))
+
+    def resumo_operacoes(self):
+        # (nome, chamadas, media_ms, max_ms, faixas), das operações com mais tempo total para as com menos
+        with self.trava:
+            linhas = [(nome, e['chamadas'], e['total_ms'] / e['chamadas'], e['max_ms'], list(e['faixas']))
+                      for nome, e in self.operacoes.items()]
+        return sorted(linhas, key=lambda linha: linha[1] * linha[2], reverse=True)
+
+    def consultas_mais_lentas(self, limite=50):
+        # (sql, execucoes, total_ms, media_ms, max_ms), das consultas com mais tempo total para as com menos
+        with self.trava:
+            linhas = [(sql, e['execucoes'], e['total_ms'], e['total_ms'] / e['execucoes'], e['max_ms'])
+                      for sql, e in self.consultas.items()]
+        return sorted(linhas, key=lambda linha: linha[2], reverse=True)[:limite]
+
+def normalizar_sql(sql):
+    # Agrupa as consultas que só diferem nos valores: troca textos e números por ? e junta os espaços
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", '?', sql)
+    return ' '.join(sql.split())
+
+instrumentacao = Instrumentacao()
+
+def instrumentar_metodos(classe):
+    # Decorador de classe: mede os métodos públicos com a instrumentação (geradores e gerenciadores de
+    # contexto ficam de fora, porque o trabalho deles acontece depois que a chamada retorna)
+    for nome, metodo in list(vars(classe).items()):
+        if nome.startswith('_') or not inspect.isfunction(metodo) or inspect.isgeneratorfunction(inspect.unwrap(metodo)):
+            continue
+        instrumentacao.metodos_medidos.append((classe, nome, metodo, _medir_metodo(f"{classe.__name__}.{nome}", metodo)))
+    return classe
+
+def _medir_metodo(nome, metodo):
+    @functools.wraps(metodo)
+    def medido(self, *args, **kwargs):
+        # Uma chamada pode começar logo depois de a instrumentação ser desligada em outra thread
+        if not instrumentacao.ativa:
+            return metodo(self, *args, **kwargs)
+        return instrumentacao.executar_medido(nome, self, metodo, args, kwargs)
+    return medido
+
+def acao_interface(nome):
+    # Decorador dos métodos da interface: mede do clique até o Tk terminar de processar o que a ação deixou
+    # pendente (desenho da janela incluído); o objeto decorado precisa ter self.master
+    def decorador(metodo):
+        @functools.wraps(metodo)
+        def medido(self, *args, **kwargs):
+            if not instrumentacao.ativa:
+                return metodo(self, *args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return metodo(self, *args, **kwargs)
+            finally:
+                self.master.after_idle(lambda: instrumentacao.registrar(f"interface.{nome}", (time.perf_counter() - inicio) * 1000))
+        return medido
+    return decorador
 
 class Produto:
     def __init__(self, nome, quantidade, preco_venda, caminho_imagem):
@@ -161,94 +1068,557 @@ class Produto:
         self.preco_venda = preco_venda
         self.caminho_imagem = caminho_imagem
 
+@instrumentar_metodos
 class Estoque:
-    def __init__(self):
-        self.conexao = conexao
-        self.cursor = cursor
+    def __init__(self, caminho_banco=caminho_banco_de_dados):
+        self.caminho_banco = caminho_banco
+        self.conexao = conectar_banco_de_dados(caminho_banco)
+        self.cursor = self.conexao.cursor()
+        # Conexão separada, só de leitura, para as consultas da interface (atualizações, pesquisas, listas);
+        # um banco em memória não pode ser compartilhado entre conexões, então usa a mesma
+        if str(caminho_banco) == ':memory:':
+            self.conexao_leitura = self.conexao
+        else:
+            self.conexao_leitura = conectar_banco_de_dados(caminho_banco, somente_leitura=True)
+        self.cursor_leitura = self.conexao_leitura.cursor()
+        # O banco de arquivo é anexado à conexão de leitura só quando alguém consulta o histórico arquivado
+        self.arquivo_anexado = False
+        # Profundidade de transacao() em andamento; só o nível mais externo faz o commit
+        self.nivel_transacao = 0
+        # Cache do catálogo para as buscas pontuais que a interface repete muito:
+        # id -> (id, nome, quantidade, preco_venda, caminho_imagem) e nome normalizado -> id
+        # Os métodos que alteram produtos invalidam as entradas afetadas; um rollback ou um commit feito por outra
+        # conexão (percebido pelo PRAGMA data_version) descarta o cache inteiro
+        self.catalogo = OrderedDict()
+        self.ids_por_nome = {}
+        self.ids_por_codigo_barras = {}
+        self.versao_catalogo = None
+        self.proxima_validacao_catalogo = 0.0
+        self.acertos_catalogo = 0
+        self.faltas_catalogo = 0
+
+    def fechar(self):
+        if self.conexao_leitura is not self.conexao:
+            self.conexao_leitura.close()
+        self.conexao.close()
+
+    @contextmanager
+    def transacao(self):
+        # Agrupa todas as alterações de uma operação em um único commit (um único fsync): se algo falhar no meio,
+        # nada é gravado. Chamadas aninhadas fazem parte da transação mais externa
+        if self.nivel_transacao:
+            self.nivel_transacao += 1
+            try:
+                yield self.cursor
+            finally:
+                self.nivel_transacao -= 1
+            return
+
+        self.nivel_transacao = 1
+        # IMMEDIATE reserva a escrita já no início, evitando falhas de bloqueio no meio da operação
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.cursor
+            self.conexao.commit()
+        except BaseException:
+            self.conexao.rollback()
+            self.invalidar_catalogo()
+            raise
+        finally:
+            self.nivel_transacao = 0
+
+    # Quantidade máxima de produtos guardados no cache do catálogo
+    LIMITE_CATALOGO = 10000
+    # Intervalo, em segundos, entre as verificações de alterações feitas por outras conexões; verificar a cada
+    # busca custaria tanto quanto a própria consulta que o cache evita
+    INTERVALO_VALIDACAO_CATALOGO = 0.5
+
+    def invalidar_catalogo(self, produto_id=None):
+        # Sem produto_id, descarta o cache inteiro
+        if produto_id is None:
+            self.catalogo.clear()
+            self.ids_por_nome.clear()
+            self.ids_por_codigo_barras.clear()
+            return
+        produto = self.catalogo.pop(int(produto_id), None)
+        if produto:
+            self.ids_por_nome.pop(normalizar_nome_produto(produto[1]), None)
+
+    def _validar_catalogo(self):
+        # data_version muda quando outra conexão (outra thread ou outro processo) confirma alterações no banco;
+        # as alterações feitas por esta conexão já são tratadas pela invalidação em cada método
+        agora = time.monotonic()
+        if agora < self.proxima_validacao_catalogo:
+            return
+        self.proxima_validacao_catalogo = agora + self.INTERVALO_VALIDACAO_CATALOGO
+        versao = self.conexao.execute("PRAGMA data_version").fetchone()[0]
+        if versao != self.versao_catalogo:
+            self.invalidar_catalogo()
+            self.versao_catalogo = versao
+
+    def _guardar_no_catalogo(self, produto):
+        self.catalogo[produto[0]] = produto
+        self.ids_por_nome[normalizar_nome_produto(produto[1])] = produto[0]
+        if len(self.catalogo) > self.LIMITE_CATALOGO:
+            _, removido = self.catalogo.popitem(last=False)
+            self.ids_por_nome.pop(normalizar_nome_produto(removido[1]), None)
+
+    def _produto_do_catalogo(self, produto_id=None, nome=None):
+        # Devolve a linha do produto pelo id ou pelo nome, consultando o banco só quando não está no cache
+        self._validar_catalogo()
+        if produto_id is None:
+            produto_id = self.ids_por_nome.get(nome)
+        if produto_id is not None and produto_id in self.catalogo:
+            self.acertos_catalogo += 1
+            self.catalogo.move_to_end(produto_id)
+            return self.catalogo[produto_id]
+
+        self.faltas_catalogo += 1
+        cursor = self.conexao.cursor()
+        if produto_id is not None:
+            cursor.execute("SELECT id, nome, quantidade, preco_venda, caminho_imagem FROM produtos WHERE id = ?", (produto_id,))
+        else:
+            cursor.execute("SELECT id, nome, quantidade, preco_venda, caminho_imagem FROM produtos WHERE nome = ?", (nome,))
+        produto = cursor.fetchone()
+        if produto:
+            self._guardar_no_catalogo(produto)
+        return produto
 
     def registrar_entrada(self, produto, quantidade):
-        self.cursor.execute('''
-            INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem)
-            VALUES (?, ?, ?, ?)
-        ''', (produto.nome, produto.quantidade, produto.preco_venda, produto.caminho_imagem))
-        self.conexao.commit()
-        produto_id = self.cursor.lastrowid 
-        data_hora_atual = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.cursor.execute('''
-            INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora)
-            VALUES (?, 'entrada', ?, ?)
-        ''', (produto.id, quantidade, data_hora_atual))
-        self.conexao.commit()    
-
-    def consultar_produto(self, query):
-        self.cursor.execute('''
-            SELECT * FROM produtos WHERE nome LIKE ?
-        ''', ('%' + query + '%',))
-        return self.cursor.fetchall()
+        with self.transacao():
+            self.cursor.execute('''
+                INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem)
+                VALUES (?, ?, ?, ?)
+            ''', (produto.nome, produto.quantidade, produto.preco_venda, produto.caminho_imagem))
+            produto_id = self.cursor.lastrowid
+            self.invalidar_catalogo(produto_id)
+            self.registrar_movimentacao(produto_id, 'entrada', quantidade)
+
+    def consultar_produto(self, query, limite=200):
+        # Busca pelo índice de texto completo, com os resultados mais relevantes primeiro
+        consulta = montar_consulta_textual(query)
+        if not consulta:
+            return []
+        self.cursor_leitura.execute('''
+            SELECT p.id, p.nome, p.quantidade, p.preco_venda, p.caminho_imagem
+            FROM produtos_fts
+            JOIN produtos p ON p.id = produtos_fts.rowid
+            WHERE produtos_fts MATCH ?
+            ORDER BY produtos_fts.rank
+            LIMIT ?
+        ''', (consulta, limite))
+        return self.cursor_leitura.fetchall()
     
     def registrar_saida(self, produto_id, quantidade_saida, event=None):
-        self.cursor.execute('''
-            UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade - ? >= 0
-        ''', (quantidade_saida, produto_id, quantidade_saida))
-        if self.cursor.rowcount == 0:
-            raise ValueError("Não há quantidade suficiente no estoque para essa saída.")
-        self.conexao.commit()
-        data_hora_atual = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.cursor.execute('''
-            INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora)
-            VALUES (?, 'saida', ?, ?)
-        ''', (produto_id, quantidade_saida, data_hora_atual))
-        self.conexao.commit()
-        
+        with self.transacao():
+            self.cursor.execute('''
+                UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade - ? >= 0
+            ''', (quantidade_saida, produto_id, quantidade_saida))
+            if self.cursor.rowcount == 0:
+                raise ValueError("Não há quantidade suficiente no estoque para essa saída.")
+            self.invalidar_catalogo(produto_id)
+            self.registrar_movimentacao(produto_id, 'saida', quantidade_saida)
 
-    def adicionar_ou_atualizar_produto(self, nome_produto, quantidade_nova, preco_venda, caminho_imagem):
-    # Verifica se o produto já existe no banco de dados
-        self.cursor.execute("SELECT id, quantidade FROM produtos WHERE nome = ?", (nome_produto,))
-        resultado = self.cursor.fetchone()
-    
-        if resultado:
-        # Se o produto já existe, atualiza a quantidade e registra a movimentação
-            produto_id, quantidade_atual = resultado
-            nova_quantidade = quantidade_atual + quantidade_nova
-            self.cursor.execute("UPDATE produtos SET quantidade = ?, preco_venda = ?, caminho_imagem = ? WHERE nome = ?", (nova_quantidade, preco_venda, caminho_imagem, nome_produto))
+    def registrar_saidas_por_codigo(self, leituras):
+        # Registra as saídas de um lote de leituras do leitor de código de barras em uma única transação
+        # leituras é uma lista de (codigo_barras, quantidade). Como em registrar_saida, o estoque não fica
+        # negativo, mas uma leitura recusada não desfaz as outras do lote
+        # Retorna, na ordem das leituras, (situacao, produto), com situacao 'registrada', 'sem_estoque' ou
+        # 'desconhecido' e produto (id, nome, quantidade, preco_venda, caminho_imagem) antes da saída, ou None
+        resultados = []
+        with self.transacao():
+            for codigo_barras, quantidade_saida in leituras:
+                produto = self.buscar_produto_por_codigo_barras(codigo_barras)
+                if produto is None:
+                    resultados.append(('desconhecido', None))
+                    continue
+                self.cursor.execute('''
+                    UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade - ? >= 0
+                ''', (quantidade_saida, produto[0], quantidade_saida))
+                if self.cursor.rowcount == 0:
+                    resultados.append(('sem_estoque', produto))
+                    continue
+                self.invalidar_catalogo(produto[0])
+                self.registrar_movimentacao(produto[0], 'saida', quantidade_saida)
+                resultados.append(('registrada', produto))
+        return resultados
+
+    def registrar_venda(self, itens):
+        # Registra uma venda inteira em uma única transação: itens é uma lista de (produto_id, quantidade), e o
+        # mesmo produto em mais de uma linha é somado. Os itens passam por uma tabela temporária (carrinho) e
+        # cada passo é um único comando para todos eles: conferir o estoque, gravar a venda, baixar as
+        # quantidades e registrar as saídas
+        # Se algum item não tiver estoque, nada é gravado e EstoqueInsuficiente lista esses itens
+        # Retorna o id da venda
+        if not itens:
+            raise ValueError("A venda não tem itens.")
+        if any(quantidade <= 0 for _, quantidade in itens):
+            raise ValueError("A quantidade de cada item deve ser maior que zero.")
+        data_hora_atual = int(time.time())
+        with self.transacao():
+            self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS carrinho (produto_id INTEGER PRIMARY KEY, quantidade INTEGER NOT NULL)")
+            # Uma venda que falhou já teve o carrinho desfeito pelo rollback; o DELETE é só por garantia
+            self.cursor.execute("DELETE FROM temp.carrinho")
+            self.cursor.executemany('''
+                INSERT INTO temp.carrinho (produto_id, quantidade) VALUES (?, ?)
+                ON CONFLICT (produto_id) DO UPDATE SET quantidade = quantidade + excluded.quantidade
+            ''', itens)
+            self.cursor.execute('''
+                SELECT c.produto_id, COALESCE(p.nome, 'Produto não encontrado'), c.quantidade, COALESCE(p.quantidade, 0)
+                FROM temp.carrinho c
+                LEFT JOIN produtos p ON p.id = c.produto_id
+                WHERE p.id IS NULL OR p.quantidade < c.quantidade
+                ORDER BY c.produto_id
+            ''')
+            itens_sem_estoque = self.cursor.fetchall()
+            if itens_sem_estoque:
+                raise EstoqueInsuficiente(itens_sem_estoque)
+
+            self.cursor.execute('''
+                INSERT INTO vendas (data_hora, total)
+                SELECT ?, SUM(c.quantidade * p.preco_venda) FROM temp.carrinho c JOIN produtos p ON p.id = c.produto_id
+            ''', (data_hora_atual,))
+            venda_id = self.cursor.lastrowid
+            self.cursor.execute('''
+                INSERT INTO vendas_itens (venda_id, produto_id, quantidade, preco_unitario)
+                SELECT ?, c.produto_id, c.quantidade, p.preco_venda FROM temp.carrinho c JOIN produtos p ON p.id = c.produto_id
+            ''', (venda_id,))
+            # A condição do estoque se repete na baixa, como em registrar_saida: a quantidade nunca fica negativa
+            self.cursor.execute('''
+                UPDATE produtos SET quantidade = quantidade - (SELECT quantidade FROM temp.carrinho WHERE produto_id = produtos.id)
+                WHERE id IN (SELECT produto_id FROM temp.carrinho)
+                  AND quantidade >= (SELECT quantidade FROM temp.carrinho WHERE produto_id = produtos.id)
+            ''')
+            if self.cursor.rowcount != len({produto_id for produto_id, _ in itens}):
+                raise ValueError("O estoque mudou durante a venda; tente novamente.")
+            self.cursor.execute('''
+                INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora, venda_id)
+                SELECT produto_id, 'saida', quantidade, ?, ? FROM temp.carrinho ORDER BY produto_id
+            ''', (data_hora_atual, venda_id))
+            self.cursor.execute("DELETE FROM temp.carrinho")
+            for produto_id, _ in itens:
+                self.invalidar_catalogo(produto_id)
+        return venda_id
+
+    def buscar_venda(self, venda_id):
+        # Retorna ((id, data_hora, total), [(produto_id, nome, quantidade, preco_unitario), ...]) ou None
+        self.cursor_leitura.execute("SELECT id, data_hora, total FROM vendas WHERE id = ?", (venda_id,))
+        venda = self.cursor_leitura.fetchone()
+        if venda is None:
+            return None
+        self.cursor_leitura.execute('''
+            SELECT i.produto_id, COALESCE(p.nome, 'Nome não encontrado'), i.quantidade, i.preco_unitario
+            FROM vendas_itens i
+            LEFT JOIN produtos p ON p.id = i.produto_id
+            WHERE i.venda_id = ?
+            ORDER BY p.nome
+        ''', (venda_id,))
+        return venda, self.cursor_leitura.fetchall()
+
+    def adicionar_ou_atualizar_produto(self, nome_produto, quantidade_nova, preco_venda, caminho_imagem, codigo_barras=None):
+        # Sem codigo_barras, o código de um produto que já existe não muda
+        with self.transacao():
+            # Verifica se o produto já existe no banco de dados
+            self.cursor.execute("SELECT id, quantidade FROM produtos WHERE nome = ?", (nome_produto,))
+            resultado = self.cursor.fetchone()
+
+            if resultado:
+                # Se o produto já existe, atualiza a quantidade e registra a movimentação
+                produto_id, quantidade_atual = resultado
+                nova_quantidade = quantidade_atual + quantidade_nova
+                self.cursor.execute("UPDATE produtos SET quantidade = ?, preco_venda = ?, caminho_imagem = ? WHERE id = ?", (nova_quantidade, preco_venda, caminho_imagem, produto_id))
+            else:
+                # Se o produto não existe, insere um novo registro e registra a movimentação
+                self.cursor.execute("INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem) VALUES (?, ?, ?, ?)", (nome_produto, quantidade_nova, preco_venda, caminho_imagem))
+                produto_id = self.cursor.lastrowid
+            if codigo_barras:
+                self._definir_codigo_barras(produto_id, codigo_barras)
+            self.invalidar_catalogo(produto_id)
             self.registrar_movimentacao(produto_id, 'entrada', quantidade_nova)
+
+    def _definir_codigo_barras(self, produto_id, codigo_barras):
+        try:
+            self.cursor.execute("UPDATE produtos SET codigo_barras = ? WHERE id = ?", (codigo_barras, produto_id))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"O código de barras {codigo_barras} já pertence a outro produto.") from None
+        # O código pode ter saído de outro produto ou mudado neste
+        self.ids_por_codigo_barras.clear()
+
+    def importar_produtos_csv(self, caminho_csv, tamanho_lote=5000, ao_progredir=None):
+        # Importa produtos e estoque inicial de um arquivo CSV, lendo o arquivo aos poucos
+        # Colunas: nome, quantidade, preco_venda e, opcionalmente, caminho_imagem (com ou sem linha de cabeçalho)
+        # Cada linha segue as regras de adicionar_ou_atualizar_produto: se o nome já existe, soma a quantidade e
+        # atualiza preço e imagem; senão, cadastra o produto. Toda linha gera uma movimentação de entrada
+        # As linhas são gravadas em lotes de tamanho_lote, cada lote em uma única transação
+        # ao_progredir(fracao_lida, importados, rejeitados) é chamada ao fim de cada lote
+        # Retorna (quantidade_importada, rejeitados), onde rejeitados é uma lista de (numero_da_linha, motivo)
+        tamanho_arquivo = max(os.path.getsize(caminho_csv), 1)
+        importados = 0
+        rejeitados = []
+        with open(caminho_csv, newline='', encoding='utf-8-sig') as arquivo:
+            amostra = arquivo.read(4096)
+            arquivo.seek(0)
+            try:
+                dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+            except csv.Error:
+                dialeto = csv.excel
+            leitor = csv.reader(arquivo, dialeto)
+
+            colunas = {'nome': 0, 'quantidade': 1, 'preco_venda': 2, 'caminho_imagem': 3}
+            lote = []
+            for numero_linha, linha in enumerate(leitor, start=1):
+                if not any(campo.strip() for campo in linha):
+                    continue
+                if numero_linha == 1 and 'nome' in [campo.strip().lower() for campo in linha]:
+                    # Linha de cabeçalho: usa a posição de cada coluna pelo nome
+                    cabecalho = [campo.strip().lower() for campo in linha]
+                    colunas = {coluna: cabecalho.index(coluna) for coluna in colunas if coluna in cabecalho}
+                    if not {'nome', 'quantidade', 'preco_venda'} <= colunas.keys():
+                        raise ValueError("O cabeçalho do CSV precisa ter as colunas nome, quantidade e preco_venda.")
+                    continue
+
+                try:
+                    lote.append(self._validar_linha_csv(linha, colunas))
+                except ValueError as e:
+                    rejeitados.append((numero_linha, str(e)))
+
+                if len(lote) >= tamanho_lote:
+                    importados += self._gravar_lote_produtos(lote)
+                    lote = []
+                    if ao_progredir:
+                        ao_progredir(arquivo.buffer.tell() / tamanho_arquivo, importados, len(rejeitados))
+            if lote:
+                importados += self._gravar_lote_produtos(lote)
+        if ao_progredir:
+            ao_progredir(1.0, importados, len(rejeitados))
+        return importados, rejeitados
+
+    def _validar_linha_csv(self, linha, colunas):
+        def campo(coluna):
+            posicao = colunas.get(coluna)
+            return linha[posicao].strip() if posicao is not None and posicao < len(linha) else ''
+
+        nome = campo('nome')
+        if not nome:
+            raise ValueError("Nome do produto vazio.")
+        try:
+            quantidade = int(campo('quantidade'))
+        except ValueError:
+            raise ValueError(f"Quantidade inválida: '{campo('quantidade')}'.")
+        if quantidade < 0:
+            raise ValueError("A quantidade não pode ser negativa.")
+        try:
+            preco_venda = converter_preco_csv_para_centavos(campo('preco_venda'))
+        except ValueError:
+            raise ValueError(f"Preço de venda inválido: '{campo('preco_venda')}'.")
+        if preco_venda < 0:
+            raise ValueError("O preço de venda não pode ser negativo.")
+        return nome, quantidade, preco_venda, campo('caminho_imagem')
+
+    def _gravar_lote_produtos(self, lote):
+        data_hora_atual = int(time.time())
+        with self.transacao():
+            self.cursor.executemany('''
+                INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem) VALUES (?, ?, ?, ?)
+                ON CONFLICT (nome) DO UPDATE SET quantidade = quantidade + excluded.quantidade,
+                                                 preco_venda = excluded.preco_venda,
+                                                 caminho_imagem = excluded.caminho_imagem
+            ''', lote)
+            self.cursor.executemany('''
+                INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora)
+                SELECT id, 'entrada', ?, ? FROM produtos WHERE nome = ?
+            ''', ((quantidade, data_hora_atual, nome) for nome, quantidade, preco_venda, caminho_imagem in lote))
+            # Um lote pode tocar milhares de produtos: é mais simples descartar o cache do que procurar cada um
+            self.invalidar_catalogo()
+        return len(lote)
+
+    # Relatórios disponíveis para exportação: tipo -> título
+    RELATORIOS = {
+        'valorizacao': "Valorização do estoque",
+        'movimentacoes': "Movimentações por período",
+        'estoque_baixo': "Produtos com estoque baixo",
+        'estoque_em_data': "Estoque em uma data",
+    }
+
+    def iterar_relatorio(self, tipo, data_inicio=None, data_fim=None, tamanho_bloco=1000):
+        # Gera as linhas de um relatório, começando pelo cabeçalho, lendo o banco em blocos de tamanho_bloco
+        # para que mesmo milhões de movimentações usem memória constante
+        # Usa um cursor próprio, então pode rodar junto com outras consultas; data_fim é exclusiva
+        cursor = self.conexao_leitura.cursor()
+        if tipo == 'valorizacao':
+            cabecalho = ("ID", "Nome", "Quantidade", "Preço de venda", "Valor em estoque")
+            cursor.execute("SELECT id, nome, quantidade, preco_venda, quantidade * preco_venda FROM produtos ORDER BY nome")
+        elif tipo == 'movimentacoes':
+            cabecalho = ("ID", "Data e hora", "ID do produto", "Nome", "Tipo", "Quantidade")
+            condicoes = []
+            parametros = []
+            if data_inicio is not None:
+                condicoes.append("m.data_hora >= ?")
+                parametros.append(data_inicio)
+            if data_fim is not None:
+                condicoes.append("m.data_hora < ?")
+                parametros.append(data_fim)
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            cursor.execute(f'''
+                SELECT m.id, m.data_hora, m.produto_id, COALESCE(p.nome, 'Nome não encontrado'), m.tipo, m.quantidade
+                FROM movimentacoes m
+                LEFT JOIN produtos p ON p.id = m.produto_id
+                {where}
+                ORDER BY m.data_hora, m.id
+            ''', parametros)
+        elif tipo == 'estoque_baixo':
+            cabecalho = ("ID", "Nome", "Quantidade atual", "Limite de alerta")
+            cursor.execute('''
+                SELECT p.id, p.nome, p.quantidade, a.valor
+                FROM estoque_baixo e
+                JOIN produtos p ON p.id = e.produto_id
+                JOIN alertas a ON a.produto_id = e.produto_id
+                ORDER BY p.quantidade - a.valor, p.nome
+            ''')
+        elif tipo == 'estoque_em_data':
+            # Estoque de cada produto em data_fim (antes das movimentações desse instante em diante)
+            if data_fim is None:
+                raise ValueError("Informe a data do estoque.")
+            cabecalho = ("ID", "Nome", "Quantidade")
+            cursor.execute(*self._consulta_estoque_em(data_fim))
         else:
-        # Se o produto não existe, insere um novo registro e registra a movimentação
-            self.cursor.execute("INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem) VALUES (?, ?, ?, ?)", (nome_produto, quantidade_nova, preco_venda, caminho_imagem))
-            produto_id = self.cursor.lastrowid
-            self.registrar_movimentacao(produto_id, 'entrada', quantidade_nova)
-        self.conexao.commit()
+            raise ValueError(f"Relatório desconhecido: {tipo}")
 
-    def atualizar_quantidade_produto(self, produto_id, quantidade_adicional):
         try:
+            yield cabecalho
+            while True:
+                linhas = cursor.fetchmany(tamanho_bloco)
+                if not linhas:
+                    break
+                yield from linhas
+        finally:
+            cursor.close()
+
+    def exportar_relatorio(self, tipo, caminho_destino, data_inicio=None, data_fim=None, ao_progredir=None, cancelado=None):
+        # Grava um relatório em CSV ou XLSX, conforme a extensão de caminho_destino, uma linha por vez
+        # ao_progredir(linhas_gravadas) é chamada a cada 1000 linhas; se cancelado (um threading.Event) for
+        # acionado, a exportação para e o arquivo parcial é apagado. Retorna a quantidade de linhas gravadas
+        linhas = self.iterar_relatorio(tipo, data_inicio, data_fim)
+        if tipo == 'valorizacao':
+            linhas = self._acrescentar_total_valorizacao(linhas)
+        linhas_formatadas = self._formatar_linhas_relatorio(tipo, linhas)
+        try:
+            if str(caminho_destino).lower().endswith('.xlsx'):
+                linhas_gravadas = _gravar_relatorio_xlsx(linhas_formatadas, caminho_destino, self.RELATORIOS[tipo], ao_progredir, cancelado)
+            else:
+                linhas_gravadas = _gravar_relatorio_csv(linhas_formatadas, caminho_destino, ao_progredir, cancelado)
+        except BaseException:
+            if os.path.exists(caminho_destino):
+                os.remove(caminho_destino)
+            raise
+        finally:
+            linhas_formatadas.close()
+            linhas.close()
+        return linhas_gravadas
+
+    def _acrescentar_total_valorizacao(self, linhas):
+        total = 0
+        for linha in linhas:
+            yield linha
+            if isinstance(linha[4], int):
+                total += linha[4]
+        yield ("", "Total", "", "", total)
+
+    # Colunas de cada relatório que saem do banco em centavos e em segundos desde 1970
+    COLUNAS_VALOR_RELATORIO = {'valorizacao': (3, 4)}
+    COLUNAS_DATA_HORA_RELATORIO = {'movimentacoes': (1,)}
+
+    def _formatar_linhas_relatorio(self, tipo, linhas):
+        # Converte os valores para reais e as datas para texto no fuso local, só na hora de gravar o arquivo
+        colunas_valor = self.COLUNAS_VALOR_RELATORIO.get(tipo, ())
+        colunas_data_hora = self.COLUNAS_DATA_HORA_RELATORIO.get(tipo, ())
+        if not colunas_valor and not colunas_data_hora:
+            yield from linhas
+            return
+        yield next(linhas)
+        for linha in linhas:
+            linha = list(linha)
+            for coluna in colunas_valor:
+                if isinstance(linha[coluna], int):
+                    linha[coluna] = centavos_para_reais(linha[coluna])
+            for coluna in colunas_data_hora:
+                linha[coluna] = formatar_data_hora(linha[coluna], '%Y-%m-%d %H:%M:%S')
+            yield linha
+
+    def atualizar_quantidade_produto(self, produto_id, quantidade_adicional):
+        # Retorna False se o produto não existe; outros erros do banco chegam a quem chamou, como em registrar_saida
+        with self.transacao():
             # Busca o produto pelo ID para obter a quantidade atual
             self.cursor.execute("SELECT quantidade FROM produtos WHERE id = ?", (produto_id,))
             resultado = self.cursor.fetchone()
-            if resultado:
-                quantidade_atual = resultado[0]
-                nova_quantidade = quantidade_atual + quantidade_adicional
-                # Atualiza a quantidade do produto no banco de dados
-                self.cursor.execute("UPDATE produtos SET quantidade = ? WHERE id = ?", (nova_quantidade, produto_id))
-                self.conexao.commit()
-                # Registra a movimentação de entrada
-                self.registrar_movimentacao(produto_id, 'entrada', quantidade_adicional)
-                return True
-            else:
-                print(f"Produto com ID {produto_id} não encontrado.")
+            if not resultado:
                 return False
-        except Exception as e:
-            print(f"Erro ao atualizar o produto: {e}")
-            return False    
+            nova_quantidade = resultado[0] + quantidade_adicional
+            # Atualiza a quantidade do produto no banco de dados
+            self.cursor.execute("UPDATE produtos SET quantidade = ? WHERE id = ?", (nova_quantidade, produto_id))
+            self.invalidar_catalogo(produto_id)
+            # Registra a movimentação de entrada
+            self.registrar_movimentacao(produto_id, 'entrada', quantidade_adicional)
+            return True
 
-    def buscar_produtos_por_nome(self, nome_produto):
-        self.cursor.execute("SELECT id, nome, quantidade FROM produtos WHERE nome LIKE ?", ('%' + nome_produto + '%',))
-        return self.cursor.fetchall()
+    def buscar_produtos_por_nome(self, nome_produto, limite=200):
+        consulta = montar_consulta_textual(nome_produto)
+        if not consulta:
+            return []
+        self.cursor_leitura.execute('''
+            SELECT p.id, p.nome, p.quantidade
+            FROM produtos_fts
+            JOIN produtos p ON p.id = produtos_fts.rowid
+            WHERE produtos_fts MATCH ?
+            ORDER BY produtos_fts.rank
+            LIMIT ?
+        ''', (consulta, limite))
+        return self.cursor_leitura.fetchall()
     
+    def sugerir_produtos(self, texto, limite=10):
+        # Sugestões para a busca enquanto se digita: precisa responder em poucos milissegundos a cada tecla
+        # Ordenar todo o resultado por relevância (rank) custa dezenas de milissegundos com prefixos curtos em
+        # 100 mil produtos, então busca só alguns candidatos pelo índice, sem ordenar, e ordena aqui:
+        # nomes que começam com o texto digitado primeiro, depois os mais curtos
+        # Os candidatos sem ordem podem deixar de fora justamente o nome que começa com o texto (com muitos
+        # "Biscoito de arroz", "Arroz" não viria), então primeiro vêm os nomes cuja primeira palavra começa como
+        # o texto (consulta ^ do FTS5), e só se faltarem sugestões os que têm as palavras em qualquer posição
+        # Um texto só com dígitos também sugere o produto com esse ID, em primeiro lugar
+        # Retorna (id, nome, quantidade, preco_venda)
+        texto = texto.strip()
+        sugestoes = []
+        if texto.isdigit():
+            produto = self._produto_do_catalogo(int(texto))
+            if produto:
+                sugestoes.append(produto[:4])
+        consulta = montar_consulta_textual(texto)
+        if not consulta:
+            return sugestoes
+        candidatos = {}
+        for consulta_fts in ('^' + consulta, consulta):
+            self.cursor_leitura.execute('''
+                SELECT p.id, p.nome, p.quantidade, p.preco_venda
+                FROM produtos_fts
+                JOIN produtos p ON p.id = produtos_fts.rowid
+                WHERE produtos_fts MATCH ?
+                LIMIT ?
+            ''', (consulta_fts, limite * 5))
+            for produto in self.cursor_leitura.fetchall():
+                candidatos.setdefault(produto[0], produto)
+            if len(candidatos) >= limite:
+                break
+        if sugestoes:
+            candidatos.pop(sugestoes[0][0], None)
+        texto_dobrado = dobrar_texto(texto)
+        candidatos = sorted(candidatos.values(),
+                            key=lambda produto: (not dobrar_texto(produto[1]).startswith(texto_dobrado), len(produto[1]), produto[1]))
+        return (sugestoes + candidatos)[:limite]
+
     def buscar_todos_os_produtos(self):
-        self.cursor.execute('''
+        self.cursor_leitura.execute('''
             SELECT id, nome, quantidade FROM produtos
         ''')
-        return self.cursor.fetchall()
+        return self.cursor_leitura.fetchall()
     
     def buscar_produto_por_id(self, produto_id):    
         # Certifique-se de que produto_id é um inteiro
@@ -257,8 +1627,7 @@ class Estoque:
         except ValueError:
             return "ID de produto inválido"
 
-        self.cursor.execute("SELECT id, nome, quantidade, preco_venda, caminho_imagem FROM produtos WHERE id = ?", (produto_id_int,))
-        resultado = self.cursor.fetchone()
+        resultado = self._produto_do_catalogo(produto_id_int)
         return resultado if resultado else "Produto não encontrado"
 
 
@@ -269,44 +1638,364 @@ class Estoque:
         except ValueError:
             return "ID de produto inválido"
 
-        self.cursor.execute("SELECT nome FROM produtos WHERE id = ?", (produto_id_int,))
-        resultado = self.cursor.fetchone()
-        return resultado[0] if resultado else "Nome não encontrado" 
+        resultado = self._produto_do_catalogo(produto_id_int)
+        return resultado[1] if resultado else "Nome não encontrado"
     
     def buscar_id_produto_por_nome(self, nome_produto):
         # Certifique-se de que nome_produto é uma string
         if not isinstance(nome_produto, str):
             return "Nome de produto inválido"
 
-        self.cursor.execute("SELECT id FROM produtos WHERE nome = ?", (nome_produto,))
-        resultado = self.cursor.fetchone()
+        resultado = self._produto_do_catalogo(nome=normalizar_nome_produto(nome_produto))
         return resultado[0] if resultado else "Produto não encontrado"
 
-    def buscar_movimentacoes_recentes(self):
-        self.cursor.execute("SELECT * FROM movimentacoes ORDER BY data_hora DESC")
-        return self.cursor.fetchall()
+    def buscar_produto_por_codigo_barras(self, codigo_barras):
+        # Consultada a cada leitura no caixa, então o id do produto de cada código fica guardado junto com o
+        # cache do catálogo. Retorna (id, nome, quantidade, preco_venda, caminho_imagem) ou None
+        self._validar_catalogo()
+        produto_id = self.ids_por_codigo_barras.get(codigo_barras)
+        if produto_id is None:
+            resultado = self.conexao.execute("SELECT id FROM produtos WHERE codigo_barras = ?", (codigo_barras,)).fetchone()
+            if resultado is None:
+                return None
+            if len(self.ids_por_codigo_barras) >= self.LIMITE_CATALOGO:
+                self.ids_por_codigo_barras.clear()
+            produto_id = self.ids_por_codigo_barras[codigo_barras] = resultado[0]
+        return self._produto_do_catalogo(produto_id)
+
+    def buscar_pagina_movimentacoes(self, limite=200, apos=None, produto_id=None, data_inicio=None, data_fim=None, incluir_arquivadas=False):
+        # Busca uma página do histórico, da movimentação mais recente para a mais antiga
+        # A paginação é por chave (data_hora, id): 'apos' é o par (data_hora, id) da última linha da página anterior,
+        # assim cada página custa o mesmo, não importa quantas já foram carregadas
+        # data_inicio é inclusiva e data_fim é exclusiva, ambas em segundos desde 1970 (veja converter_data_para_banco)
+        # Com incluir_arquivadas, quando o banco principal acaba a página continua no banco de arquivo
+        movimentacoes = self._buscar_pagina_movimentacoes_em('main', limite, apos, produto_id, data_inicio, data_fim)
+        # O arquivo só guarda movimentações mais antigas que as do banco principal, então basta continuar nele
+        if incluir_arquivadas and len(movimentacoes) < limite and self.anexar_arquivo_leitura():
+            if movimentacoes:
+                apos = (movimentacoes[-1][5], movimentacoes[-1][0])
+            movimentacoes += self._buscar_pagina_movimentacoes_em('arquivo', limite - len(movimentacoes), apos, produto_id, data_inicio, data_fim)
+        return movimentacoes
+
+    def _buscar_pagina_movimentacoes_em(self, banco, limite, apos, produto_id, data_inicio, data_fim):
+        condicoes = []
+        parametros = []
+        if apos is not None:
+            condicoes.append("(m.data_hora, m.id) < (?, ?)")
+            parametros.extend(apos)
+        if produto_id is not None:
+            condicoes.append("m.produto_id = ?")
+            parametros.append(produto_id)
+        if data_inicio is not None:
+            condicoes.append("m.data_hora >= ?")
+            parametros.append(data_inicio)
+        if data_fim is not None:
+            condicoes.append("m.data_hora < ?")
+            parametros.append(data_fim)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        self.cursor_leitura.execute(f'''
+            SELECT m.id, m.produto_id, COALESCE(p.nome, 'Nome não encontrado'), m.tipo, m.quantidade, m.data_hora
+            FROM {banco}.movimentacoes m
+            LEFT JOIN main.produtos p ON p.id = m.produto_id
+            {where}
+            ORDER BY m.data_hora DESC, m.id DESC
+            LIMIT ?
+        ''', (*parametros, limite))
+        return self.cursor_leitura.fetchall()
+
+    def caminho_arquivo_movimentacoes(self):
+        # O banco de arquivo fica ao lado do banco principal
+        if str(self.caminho_banco) == ':memory:':
+            raise ValueError("Um banco em memória não tem arquivo de movimentações.")
+        return Path(self.caminho_banco).with_name(NOME_BANCO_ARQUIVO)
+
+    def anexar_arquivo_leitura(self):
+        # Anexa o banco de arquivo, só para leitura, à conexão de consultas; devolve False se ainda não houver arquivo
+        if not self.arquivo_anexado:
+            caminho_arquivo = self.caminho_arquivo_movimentacoes()
+            if not caminho_arquivo.exists():
+                return False
+            self.conexao_leitura.execute("ATTACH DATABASE ? AS arquivo", (f"{caminho_arquivo.resolve().as_uri()}?mode=ro",))
+            self.arquivo_anexado = True
+        return True
+
+    def obter_configuracao(self, chave, padrao=None):
+        self.cursor.execute("SELECT valor FROM configuracoes WHERE chave = ? ORDER BY id DESC LIMIT 1", (chave,))
+        resultado = self.cursor.fetchone()
+        return resultado[0] if resultado else padrao
+
+    def definir_configuracao(self, chave, valor):
+        with self.transacao():
+            self.cursor.execute("UPDATE configuracoes SET valor = ? WHERE chave = ?", (valor, chave))
+            if self.cursor.rowcount == 0:
+                self.cursor.execute("INSERT INTO configuracoes (chave, valor) VALUES (?, ?)", (chave, valor))
+
+    def compactar_movimentacoes(self, horizonte_dias=None):
+        # Move as movimentações anteriores ao horizonte (em dias completos, contados a partir de hoje) para o banco
+        # de arquivo e as substitui por linhas de resumo por produto, dia e tipo em movimentacoes_resumo_diario
+        # A quantidade em estoque fica em produtos.quantidade e não é alterada
+        # Sem horizonte_dias, usa o último horizonte configurado (365 dias por padrão) e o guarda nas configurações
+        # Retorna quantas movimentações foram arquivadas
+        if horizonte_dias is None:
+            horizonte_dias = self.obter_configuracao('horizonte_compactacao_dias', 365)
+        if horizonte_dias < 1:
+            raise ValueError("O horizonte de compactação deve ser de pelo menos um dia.")
+        self.definir_configuracao('horizonte_compactacao_dias', horizonte_dias)
+        limite = int(datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=horizonte_dias), datetime.time()).timestamp())
+
+        self.cursor.execute("ATTACH DATABASE ? AS arquivo", (str(self.caminho_arquivo_movimentacoes()),))
+        try:
+            # Primeiro copia as linhas para o arquivo e confirma; só depois as remove do banco principal
+            # Se algo falhar entre os dois passos, rodar de novo é seguro: o INSERT OR IGNORE não duplica linhas
+            with self.transacao():
+                self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS arquivo.movimentacoes (
+                    id INTEGER PRIMARY KEY,
+                    produto_id INTEGER NOT NULL,
+                    tipo TEXT NOT NULL,  -- 'entrada' ou 'saida'
+                    quantidade INTEGER NOT NULL,
+                    data_hora INTEGER NOT NULL,  -- segundos desde 1970 (UTC)
+                    venda_id INTEGER
+                )
+                ''')
+                # Arquivos criados antes das vendas não têm a coluna venda_id
+                colunas_arquivo = [coluna[1] for coluna in self.cursor.execute("PRAGMA arquivo.table_info(movimentacoes)").fetchall()]
+                if 'venda_id' not in colunas_arquivo:
+                    self.cursor.execute("ALTER TABLE arquivo.movimentacoes ADD COLUMN venda_id INTEGER")
+                self.cursor.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_movimentacoes_produto_data ON movimentacoes (produto_id, data_hora)")
+                self.cursor.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_movimentacoes_data_hora ON movimentacoes (data_hora)")
+                # Ponto de controle no limite da compactação para os produtos com movimentações arquivadas: o estoque
+                # em datas depois dele não precisa do arquivo. Vale antes das movimentações a partir do limite
+                self.cursor.execute(f'''
+                    INSERT OR IGNORE INTO main.pontos_controle_estoque (produto_id, data_hora, ultima_movimentacao_id, quantidade)
+                    SELECT p.id, :limite, 0,
+                           p.quantidade - COALESCE((SELECT SUM({SALDO_MOVIMENTACAO}) FROM main.movimentacoes m
+                                                    WHERE m.produto_id = p.id AND m.data_hora >= :limite), 0)
+                    FROM main.produtos p
+                    WHERE EXISTS (SELECT 1 FROM main.movimentacoes WHERE produto_id = p.id AND data_hora < :limite)
+                ''', {'limite': limite})
+                self.cursor.execute('''
+                    INSERT OR IGNORE INTO arquivo.movimentacoes (id, produto_id, tipo, quantidade, data_hora, venda_id)
+                    SELECT id, produto_id, tipo, quantidade, data_hora, venda_id FROM main.movimentacoes WHERE data_hora < ?
+                ''', (limite,))
+
+            with self.transacao():
+                # Resume e apaga apenas o que já está guardado no arquivo
+                self.cursor.execute('''
+                    CREATE TEMP TABLE movimentacoes_compactadas AS
+                    SELECT m.id, m.produto_id, m.tipo, m.quantidade, m.data_hora
+                    FROM main.movimentacoes m
+                    JOIN arquivo.movimentacoes a ON a.id = m.id
+                    WHERE m.data_hora < ?
+                ''', (limite,))
+                self.cursor.execute('''
+                    INSERT INTO main.movimentacoes_resumo_diario (produto_id, dia, tipo, quantidade, movimentacoes)
+                    SELECT produto_id, date(data_hora, 'unixepoch', 'localtime') AS dia, tipo, SUM(quantidade), COUNT(*)
+                    FROM temp.movimentacoes_compactadas
+                    WHERE true
+                    GROUP BY produto_id, dia, tipo
+                    ON CONFLICT (produto_id, dia, tipo) DO UPDATE SET
+                        quantidade = quantidade + excluded.quantidade,
+                        movimentacoes = movimentacoes + excluded.movimentacoes
+                ''')
+                self.cursor.execute("DELETE FROM main.movimentacoes WHERE id IN (SELECT id FROM temp.movimentacoes_compactadas)")
+                arquivadas = self.cursor.rowcount
+                self.cursor.execute("DROP TABLE temp.movimentacoes_compactadas")
+        finally:
+            self.cursor.execute("DETACH DATABASE arquivo")
+        return arquivadas
+
+    def buscar_resumo_diario_movimentacoes(self, produto_id, data_inicio=None, data_fim=None):
+        # Entradas e saídas do produto por dia, juntando os resumos da compactação com as movimentações que ainda
+        # estão no banco principal; data_inicio e data_fim no formato '%Y-%m-%d', a data final é exclusiva
+        # Retorna (dia, entradas, saidas) em ordem cronológica
+        self.cursor_leitura.execute('''
+            SELECT dia,
+                   SUM(CASE WHEN tipo = 'entrada' THEN quantidade ELSE 0 END),
+                   SUM(CASE WHEN tipo = 'saida' THEN quantidade ELSE 0 END)
+            FROM (
+                SELECT dia, tipo, quantidade FROM movimentacoes_resumo_diario WHERE produto_id = ?
+                UNION ALL
+                SELECT date(data_hora, 'unixepoch', 'localtime'), tipo, quantidade FROM movimentacoes WHERE produto_id = ?
+            )
+            WHERE dia >= COALESCE(?, dia) AND dia < COALESCE(?, '9999-12-31')
+            GROUP BY dia
+            ORDER BY dia
+        ''', (produto_id, produto_id, data_inicio, data_fim))
+        return self.cursor_leitura.fetchall()
+
+    def quantidade_em(self, produto_id, data_hora):
+        # Quantidade que o produto tinha em data_hora (segundos desde 1970), antes das movimentações desse instante
+        # em diante; None se o produto não existe
+        sql, parametros = self._consulta_estoque_em(data_hora, produto_id)
+        resultado = self.conexao_leitura.execute(sql, parametros).fetchone()
+        return resultado[2] if resultado else None
+
+    def estoque_em(self, data_hora):
+        # (id, nome, quantidade) de todos os produtos em data_hora, na ordem do nome; veja quantidade_em
+        sql, parametros = self._consulta_estoque_em(data_hora)
+        return self.conexao_leitura.execute(sql, parametros).fetchall()
+
+    def _consulta_estoque_em(self, data_hora, produto_id=None):
+        # Parte do ponto de controle mais próximo de data_hora e só repassa as movimentações entre os dois:
+        # - o último ponto antes de data_hora, somando as movimentações seguintes até data_hora
+        # - senão, o primeiro ponto depois, desfazendo as movimentações de data_hora até ele
+        # - senão, a quantidade atual, desfazendo as movimentações desde data_hora
+        # Movimentações de antes da última compactação estão no arquivo, que é consultado junto quando preciso
+        bancos = ['main']
+        if self._precisa_do_arquivo(data_hora):
+            bancos.append('arquivo')
+
+        def saldo(condicao):
+            return "(" + " + ".join(f"COALESCE((SELECT SUM({SALDO_MOVIMENTACAO}) FROM {banco}.movimentacoes m WHERE {condicao}), 0)"
+                              for banco in bancos) + ")"
+
+        filtro = "WHERE p.id = :produto_id" if produto_id is not None else ""
+        sql = f'''
+            SELECT p.id, p.nome, COALESCE(
+                (SELECT c.quantidade + {saldo("m.produto_id = c.produto_id AND (m.data_hora, m.id) > (c.data_hora, c.ultima_movimentacao_id) AND m.data_hora < :data_hora")}
+                 FROM pontos_controle_estoque c
+                 WHERE c.produto_id = p.id AND c.data_hora < :data_hora
+                 ORDER BY c.data_hora DESC, c.ultima_movimentacao_id DESC
+                 LIMIT 1),
+                (SELECT c.quantidade - {saldo("m.produto_id = c.produto_id AND m.data_hora >= :data_hora AND (m.data_hora, m.id) <= (c.data_hora, c.ultima_movimentacao_id)")}
+                 FROM pontos_controle_estoque c
+                 WHERE c.produto_id = p.id AND c.data_hora >= :data_hora
+                 ORDER BY c.data_hora, c.ultima_movimentacao_id
+                 LIMIT 1),
+                p.quantidade - {saldo("m.produto_id = p.id AND m.data_hora >= :data_hora")}
+            )
+            FROM produtos p
+            {filtro}
+            ORDER BY p.nome
+        '''
+        return sql, {'data_hora': data_hora, 'produto_id': produto_id}
+
+    def _precisa_do_arquivo(self, data_hora):
+        # As movimentações arquivadas são todas mais antigas que as do banco principal
+        primeira = self.conexao_leitura.execute("SELECT MIN(data_hora) FROM main.movimentacoes").fetchone()[0]
+        if primeira is not None and data_hora >= primeira:
+            return False
+        if self.conexao_leitura.execute("SELECT 1 FROM main.movimentacoes_resumo_diario LIMIT 1").fetchone() is None:
+            return False
+        if not self.anexar_arquivo_leitura():
+            raise ValueError("As movimentações dessa data foram compactadas e o arquivo de histórico não foi encontrado.")
+        return True
+
+    def atualizar_pontos_controle(self, intervalo=INTERVALO_PONTOS_CONTROLE):
+        # Grava um ponto de controle, com a quantidade atual, para cada produto que teve pelo menos 'intervalo'
+        # movimentações desde o seu último ponto. Retorna quantos pontos foram gravados
+        data_hora_atual = int(time.time())
+        with self.transacao():
+            # Todas as movimentações já gravadas têm id até este; as próximas do mesmo segundo ficam depois do ponto
+            self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'movimentacoes'")
+            resultado = self.cursor.fetchone()
+            ultima_movimentacao_id = resultado[0] if resultado else 0
+            self.cursor.execute('''
+                INSERT OR IGNORE INTO pontos_controle_estoque (produto_id, data_hora, ultima_movimentacao_id, quantidade)
+                SELECT p.id, ?, ?, p.quantidade
+                FROM produtos p
+                LEFT JOIN pontos_controle_estoque u ON u.produto_id = p.id
+                    AND (u.data_hora, u.ultima_movimentacao_id) = (
+                        SELECT data_hora, ultima_movimentacao_id FROM pontos_controle_estoque
+                        WHERE produto_id = p.id
+                        ORDER BY data_hora DESC, ultima_movimentacao_id DESC
+                        LIMIT 1)
+                WHERE (SELECT m.id FROM movimentacoes m
+                       WHERE m.produto_id = p.id
+                         AND (m.data_hora, m.id) > (COALESCE(u.data_hora, -1), COALESCE(u.ultima_movimentacao_id, 0))
+                       ORDER BY m.data_hora, m.id
+                       LIMIT 1 OFFSET ?) IS NOT NULL
+            ''', (data_hora_atual, ultima_movimentacao_id, intervalo - 1))
+            return self.cursor.rowcount
+
+    def reconstruir_pontos_controle(self, intervalo=INTERVALO_PONTOS_CONTROLE):
+        # Refaz os pontos de controle a partir das movimentações do banco principal, como a migração que os criou;
+        # os pontos de antes da última compactação são mantidos, porque as movimentações deles estão no arquivo
+        with self.transacao():
+            self.cursor.execute('''
+                DELETE FROM pontos_controle_estoque
+                WHERE (data_hora, ultima_movimentacao_id) >= (SELECT data_hora, id FROM movimentacoes ORDER BY data_hora, id LIMIT 1)
+            ''')
+            _gerar_pontos_controle_historicos(self.cursor, intervalo)
+
+    def buscar_alertas_estoque_baixo(self):
+        # Produtos em alerta, lidos do conjunto estoque_baixo que os gatilhos mantêm atualizado
+        # Retorna (produto_id, nome, quantidade_atual, limite_alerta)
+        self.cursor_leitura.execute('''
+            SELECT p.id, p.nome, p.quantidade, a.valor
+            FROM estoque_baixo e
+            JOIN produtos p ON p.id = e.produto_id
+            JOIN alertas a ON a.produto_id = e.produto_id
+            ORDER BY p.id
+        ''')
+        return self.cursor_leitura.fetchall()
+
+    def contar_alertas_estoque_baixo(self):
+        self.cursor_leitura.execute("SELECT COUNT(*) FROM estoque_baixo")
+        return self.cursor_leitura.fetchone()[0]
+
+    def buscar_feed_atualizacoes(self, desde_id=0, limite=None, crescente=False):
+        # Busca em duas consultas tudo o que a área de atualizações precisa, já com os dados do produto
+        # Retorna (alertas, movimentacoes):
+        #   alertas: (produto_id, nome, quantidade_atual, limite_alerta) dos produtos com estoque baixo
+        #   movimentacoes: (id, produto_id, nome, tipo, quantidade, data_hora, quantidade_atual, limite_alerta)
+        # Com desde_id, traz apenas as movimentações com id maior que ele (atualização incremental); com limite,
+        # só as 'limite' mais recentes delas. Com crescente, as movimentações vêm em ordem de id e o limite
+        # pega as primeiras depois de desde_id, para que quem busca em páginas não pule nenhuma
+        alertas = self.buscar_alertas_estoque_baixo()
+        ordem = "m.id" if crescente else "m.data_hora DESC, m.id DESC"
+        self.cursor_leitura.execute(f'''
+            SELECT m.id, m.produto_id, COALESCE(p.nome, 'Nome não encontrado'), m.tipo, m.quantidade, m.data_hora,
+                   COALESCE(p.quantidade, 0), a.valor
+            FROM movimentacoes m
+            LEFT JOIN produtos p ON p.id = m.produto_id
+            LEFT JOIN alertas a ON a.produto_id = m.produto_id
+            WHERE m.id > ?
+            ORDER BY {ordem}
+            LIMIT ?
+        ''', (desde_id, -1 if limite is None else limite))
+        movimentacoes = self.cursor_leitura.fetchall()
+        return alertas, movimentacoes
     
     def registrar_movimentacao(self, produto_id, tipo, quantidade):
-        data_hora_atual = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.cursor.execute('''
-            INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora)
-            VALUES (?, ?, ?, ?)
-        ''', (produto_id, tipo, quantidade, data_hora_atual))
-        self.conexao.commit()
+        data_hora_atual = int(time.time())
+        with self.transacao():
+            self.cursor.execute('''
+                INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora)
+                VALUES (?, ?, ?, ?)
+            ''', (produto_id, tipo, quantidade, data_hora_atual))
 
     def definir_limite_alerta(self, produto_id, limite):
-        # Verifica se já existe um limite de alerta configurado para o produto
-        self.cursor.execute("SELECT valor FROM alertas WHERE produto_id = ?", (produto_id,))
-        resultado = self.cursor.fetchone()
-        
-        if resultado:
-            # Se já existe, atualiza o valor
-            self.cursor.execute("UPDATE alertas SET valor = ? WHERE produto_id = ?", (limite, produto_id))
-        else:
-            # Se não existe, insere um novo registro
-            self.cursor.execute("INSERT INTO alertas (produto_id, valor) VALUES (?, ?)", (produto_id, limite))
-        
-        self.conexao.commit()
+        # Cada produto tem no máximo um limite de alerta: insere ou, se já existir, atualiza o valor
+        with self.transacao():
+            self.cursor.execute('''
+                INSERT INTO alertas (produto_id, valor) VALUES (?, ?)
+                ON CONFLICT (produto_id) DO UPDATE SET valor = excluded.valor
+            ''', (produto_id, limite))
+
+    def contar_produtos_por_nome(self, nome_produto):
+        # Quantos produtos a busca por nome encontra, sem o limite das listas de resultados
+        consulta = montar_consulta_textual(nome_produto)
+        if not consulta:
+            return 0
+        self.cursor_leitura.execute("SELECT COUNT(*) FROM produtos_fts WHERE produtos_fts MATCH ?", (consulta,))
+        return self.cursor_leitura.fetchone()[0]
+
+    def definir_limite_alerta_por_nome(self, nome_produto, limite):
+        # Define o mesmo limite de alerta para todos os produtos que a busca por nome encontra, em uma única
+        # instrução e uma única transação; os gatilhos atualizam o conjunto estoque_baixo
+        # Retorna quantos produtos foram alterados
+        consulta = montar_consulta_textual(nome_produto)
+        if not consulta:
+            raise ValueError("Digite parte do nome dos produtos.")
+        with self.transacao():
+            self.cursor.execute('''
+                INSERT INTO alertas (produto_id, valor)
+                SELECT rowid, ? FROM produtos_fts WHERE produtos_fts MATCH ?
+                ON CONFLICT (produto_id) DO UPDATE SET valor = excluded.valor
+            ''', (limite, consulta))
+            return self.cursor.rowcount
 
     def buscar_limite_alerta(self, produto_id):
         # Implementa a lógica para buscar o limite de alerta do produto no banco de dados
@@ -316,17 +2005,680 @@ class Estoque:
 
     def buscar_quantidade_atual_por_id(self, produto_id):
         # Implementa a lógica para buscar a quantidade atual do produto no banco de dados
-        cursor = self.conexao.cursor()
-        cursor.execute("SELECT quantidade FROM produtos WHERE id = ?", (produto_id,))
-        resultado = cursor.fetchone()
-        return resultado[0] if resultado else 0      
+        resultado = self._produto_do_catalogo(produto_id)
+        return resultado[2] if resultado else 0      
 
     def apagar_produto(self, produto_id):
-        # Primeiro, apaga as movimentações relacionadas ao produto
-        self.cursor.execute("DELETE FROM movimentacoes WHERE produto_id = ?", (produto_id,))
-        # Depois, apaga o produto
-        self.cursor.execute("DELETE FROM produtos WHERE id = ?", (produto_id,))
-        self.conexao.commit()    
+        # O cache do catálogo usa o id como inteiro; um id em texto apagaria o produto e deixaria a linha no cache
+        produto_id = int(produto_id)
+        with self.transacao():
+            # Primeiro, apaga as movimentações relacionadas ao produto
+            self.cursor.execute("DELETE FROM movimentacoes WHERE produto_id = ?", (produto_id,))
+            self.cursor.execute("DELETE FROM movimentacoes_resumo_diario WHERE produto_id = ?", (produto_id,))
+            self.cursor.execute("DELETE FROM vendas_diarias WHERE produto_id = ?", (produto_id,))
+            self.cursor.execute("DELETE FROM alertas WHERE produto_id = ?", (produto_id,))
+            self.cursor.execute("DELETE FROM pontos_controle_estoque WHERE produto_id = ?", (produto_id,))
+            # As vendas (vendas e vendas_itens) ficam como estão: o que foi vendido não muda com o produto apagado
+            # Depois, apaga o produto
+            self.cursor.execute("DELETE FROM produtos WHERE id = ?", (produto_id,))
+            self.invalidar_catalogo(produto_id)
+            self.ids_por_codigo_barras.clear()
+
+def dividir_periodo_em_meses(data_inicio, data_fim):
+    # Divide o período [data_inicio, data_fim) ('%Y-%m-%d') em meses completos e nos dias soltos das pontas
+    # Retorna (periodos_de_dias, periodo_de_meses): periodos_de_dias é uma lista de (inicio, fim) em dias e
+    # periodo_de_meses é (mes_inicio, mes_fim) em '%Y-%m', com o fim exclusivo, ou None se não houver mês completo
+    inicio = datetime.date.fromisoformat(data_inicio)
+    fim = datetime.date.fromisoformat(data_fim)
+    primeiro_mes = inicio if inicio.day == 1 else (inicio.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    ultimo_mes = fim.replace(day=1)
+    if primeiro_mes >= ultimo_mes:
+        return [(data_inicio, data_fim)], None
+    periodos_de_dias = [(str(inicio), str(primeiro_mes)), (str(ultimo_mes), str(fim))]
+    periodos_de_dias = [(de, ate) for de, ate in periodos_de_dias if de < ate]
+    return periodos_de_dias, (str(primeiro_mes)[:7], str(ultimo_mes)[:7])
+
+@instrumentar_metodos
+class AnaliseVendas:
+    # Consultas de vendas sobre os totais mantidos pelos gatilhos (vendas_diarias, vendas_mensais e
+    # vendas_totais_diarias), usando a conexão de leitura do estoque
+    # As datas são '%Y-%m-%d'; data_inicio é inclusiva e data_fim é exclusiva
+    def __init__(self, estoque):
+        self.estoque = estoque
+
+    def vendas_por_dia(self, data_inicio, data_fim, produto_id=None):
+        # Retorna (dia, quantidade, receita) de cada dia com vendas, em ordem cronológica
+        if produto_id is None:
+            cursor = self.estoque.conexao_leitura.execute('''
+                SELECT dia, quantidade, receita FROM vendas_totais_diarias
+                WHERE dia >= ? AND dia < ? AND quantidade <> 0
+                ORDER BY dia
+            ''', (data_inicio, data_fim))
+        else:
+            cursor = self.estoque.conexao_leitura.execute('''
+                SELECT dia, quantidade, receita FROM vendas_diarias
+                WHERE produto_id = ? AND dia >= ? AND dia < ?
+                ORDER BY dia
+            ''', (produto_id, data_inicio, data_fim))
+        return cursor.fetchall()
+
+    def _consulta_totais_por_produto(self, data_inicio, data_fim, produto_id=None):
+        # Monta uma subconsulta com (produto_id, quantidade, receita) no período, lendo os meses completos de
+        # vendas_mensais e só os dias das pontas de vendas_diarias
+        # Os índices (dia, produto_id, ...) e (mes, produto_id, ...) cobrem as leituras sem tocar nas tabelas
+        periodos_de_dias, periodo_de_meses = dividir_periodo_em_meses(data_inicio, data_fim)
+        filtro_produto = " AND produto_id = ?" if produto_id is not None else ""
+        extra = (produto_id,) if produto_id is not None else ()
+        partes = []
+        parametros = []
+        for de, ate in periodos_de_dias:
+            partes.append("SELECT produto_id, quantidade, receita FROM vendas_diarias "
+                          "WHERE dia >= ? AND dia < ?" + filtro_produto)
+            parametros.extend((de, ate, *extra))
+        if periodo_de_meses:
+            partes.append("SELECT produto_id, quantidade, receita FROM vendas_mensais "
+                          "WHERE mes >= ? AND mes < ?" + filtro_produto)
+            parametros.extend((*periodo_de_meses, *extra))
+        consulta = f'''
+            SELECT produto_id, SUM(quantidade) AS quantidade, SUM(receita) AS receita
+            FROM ({" UNION ALL ".join(partes)})
+            GROUP BY produto_id
+        '''
+        return consulta, parametros
+
+    def vendas_por_produto(self, data_inicio, data_fim, produto_id):
+        # Retorna (quantidade, receita) do produto no período
+        consulta, parametros = self._consulta_totais_por_produto(data_inicio, data_fim, produto_id)
+        cursor = self.estoque.conexao_leitura.execute(f"SELECT quantidade, receita FROM ({consulta})", parametros)
+        resultado = cursor.fetchone()
+        return resultado if resultado else (0, 0)
+
+    def mais_vendidos(self, data_inicio, data_fim, limite=10, ordenar_por='quantidade'):
+        # Produtos que mais venderam no período, por quantidade ou por receita
+        # Retorna (produto_id, nome, quantidade, receita)
+        if ordenar_por not in ('quantidade', 'receita'):
+            raise ValueError("ordenar_por deve ser 'quantidade' ou 'receita'.")
+        consulta, parametros = self._consulta_totais_por_produto(data_inicio, data_fim)
+        cursor = self.estoque.conexao_leitura.execute(f'''
+            SELECT v.produto_id, p.nome, v.quantidade, v.receita
+            FROM ({consulta}) v
+            JOIN produtos p ON p.id = v.produto_id
+            WHERE v.quantidade > 0
+            ORDER BY v.{ordenar_por} DESC
+            LIMIT ?
+        ''', (*parametros, limite))
+        return cursor.fetchall()
+
+    def menos_vendidos(self, data_inicio, data_fim, limite=10):
+        # Produtos parados: os que menos venderam no período, incluindo os que não venderam nada
+        # Retorna (produto_id, nome, quantidade, receita, quantidade_em_estoque)
+        consulta, parametros = self._consulta_totais_por_produto(data_inicio, data_fim)
+        cursor = self.estoque.conexao_leitura.execute(f'''
+            SELECT p.id, p.nome, COALESCE(v.quantidade, 0) AS vendido, COALESCE(v.receita, 0), p.quantidade
+            FROM produtos p
+            LEFT JOIN ({consulta}) v ON v.produto_id = p.id
+            ORDER BY vendido, p.quantidade DESC
+            LIMIT ?
+        ''', (*parametros, limite))
+        return cursor.fetchall()
+
+def montar_linhas_feed(alertas, movimentacoes):
+    # Monta os textos da área de atualizações a partir de Estoque.buscar_feed_atualizacoes, sem usar o Tk
+    # Retorna (linhas_alerta, linhas_movimentacao); as movimentações vêm da mais antiga para a mais recente,
+    # cada uma como (id, tipo_movimentacao, tag, texto)
+    linhas_alerta = [f"Alerta de Estoque Baixo: {nome_produto}, Quantidade Atual: {quantidade_atual}\n"
+                     for produto_id, nome_produto, quantidade_atual, limite_alerta in alertas]
+    linhas_movimentacao = []
+    for mov_id, produto_id, nome_produto, tipo, quantidade, data_hora, quantidade_atual, limite_alerta in reversed(movimentacoes):
+        tipo_movimentacao = "Saída" if tipo.lower() == "saida" else "Entrada"
+        data_hora_formatada = formatar_data_hora(data_hora, '%d/%m/%Y : %H:%M')
+        linhas_movimentacao.append((mov_id, tipo_movimentacao, 'saida' if tipo_movimentacao == "Saída" else 'entrada',
+                                    f"ID: {produto_id},Nome: {nome_produto}, Quantidade: {quantidade}, Data e Hora: {data_hora_formatada}\n"))
+    return linhas_alerta, linhas_movimentacao
+
+def pesquisar_produtos(estoque, query):
+    # Pesquisa da tela principal, por ID ou por nome; roda no TrabalhadorBanco
+    if query.isdigit():
+        nome_produto = estoque.buscar_nome_produto_por_id(int(query))
+        if nome_produto == "Nome não encontrado":
+            return []
+        query = nome_produto
+    return estoque.consultar_produto(query)
+
+class TrabalhadorBanco:
+    # Thread que executa, em ordem, as operações de banco pedidas pela interface, com um Estoque próprio
+    # (uma conexão SQLite só pode ser usada pela thread que a criou). Assim a thread do Tk não fica parada
+    # esperando um fsync, um bloqueio de outro processo ou uma consulta grande
+    # executar() devolve um concurrent.futures.Future; quem usa o Tk não deve esperar por ele, e sim receber o
+    # resultado pelo after() (veja Aplicativo.no_banco)
+    # Com threads > 1, várias threads, cada uma com o seu Estoque, atendem a mesma fila (a ordem entre os pedidos
+    # deixa de ser garantida); abrir_estoque(caminho_banco) cria o Estoque de cada thread
+    def __init__(self, caminho_banco=caminho_banco_de_dados, threads=1, abrir_estoque=Estoque):
+        self.caminho_banco = caminho_banco
+        self.abrir_estoque = abrir_estoque
+        self.pedidos = queue.Queue()
+        self.threads = [threading.Thread(target=self._executar_pedidos, name='banco', daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def executar(self, operacao, *args, **kwargs):
+        # operacao é o nome de um método de Estoque ou uma função que recebe o Estoque como primeiro argumento
+        futuro = Future()
+        self.pedidos.put((futuro, operacao, args, kwargs))
+        return futuro
+
+    def fechar(self):
+        # Espera os pedidos já enfileirados terminarem antes de fechar a conexão
+        for _ in self.threads:
+            self.pedidos.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _executar_pedidos(self):
+        estoque = self.abrir_estoque(self.caminho_banco)
+        try:
+            while True:
+                pedido = self.pedidos.get()
+                if pedido is None:
+                    break
+                futuro, operacao, args, kwargs = pedido
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if callable(operacao):
+                        resultado = operacao(estoque, *args, **kwargs)
+                    else:
+                        resultado = getattr(estoque, operacao)(*args, **kwargs)
+                except BaseException as e:
+                    futuro.set_exception(e)
+                else:
+                    futuro.set_result(resultado)
+        finally:
+            estoque.fechar()
+
+# Porta padrão do servidor de estoque (--servidor) e do modo cliente (--cliente)
+PORTA_SERVIDOR = 8765
+
+# Campos das linhas trocadas pela API JSON, na ordem das tuplas devolvidas pelo Estoque
+CAMPOS_PRODUTO = ('id', 'nome', 'quantidade', 'preco_venda', 'caminho_imagem')
+CAMPOS_SUGESTAO = CAMPOS_PRODUTO[:4]
+CAMPOS_ALERTA = ('produto_id', 'nome', 'quantidade', 'limite_alerta')
+CAMPOS_MOVIMENTACAO = ('id', 'produto_id', 'nome', 'tipo', 'quantidade', 'data_hora', 'quantidade_atual', 'limite_alerta')
+CAMPOS_ITEM_SEM_ESTOQUE = ('produto_id', 'nome', 'quantidade_pedida', 'quantidade_disponivel')
+
+def linha_para_json(campos, linha):
+    return dict(zip(campos, linha)) if linha is not None else None
+
+def json_para_linha(campos, objeto):
+    return tuple(objeto[campo] for campo in campos) if objeto is not None else None
+
+class ErroRequisicao(Exception):
+    # Requisição recusada pelo servidor antes de chegar ao banco; status é o código HTTP da resposta
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def _ler_inteiro(dados, nome, padrao=None, minimo=None, maximo=None):
+    # Lê um inteiro de um corpo JSON ou da query string (onde chega como texto)
+    valor = dados.get(nome, padrao)
+    if valor is None:
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' é obrigatório.")
+    if isinstance(valor, str) and re.fullmatch(r'-?\d+', valor.strip()):
+        valor = int(valor)
+    if not isinstance(valor, int) or isinstance(valor, bool):
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' deve ser um número inteiro.")
+    if minimo is not None and valor < minimo:
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' deve ser no mínimo {minimo}.")
+    if maximo is not None and valor > maximo:
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' deve ser no máximo {maximo}.")
+    return valor
+
+def _ler_texto(dados, nome, padrao=None):
+    valor = dados.get(nome, padrao)
+    if not isinstance(valor, str):
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' deve ser um texto.")
+    return valor
+
+def _ler_pares(dados, nome, nome_chave, ler_chave):
+    # Lista de pares [chave, quantidade], como os itens de uma venda ou as leituras do leitor
+    valor = dados.get(nome)
+    if not isinstance(valor, list) or not all(isinstance(par, list) and len(par) == 2 for par in valor):
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"O campo '{nome}' deve ser uma lista de pares [{nome_chave}, quantidade].")
+    return [(ler_chave({nome_chave: chave}, nome_chave), _ler_inteiro({'quantidade': quantidade}, 'quantidade', minimo=1))
+            for chave, quantidade in valor]
+
+def _consultar(estoque, metodo, *args):
+    # As gravações chegam por outra conexão (a da thread de gravação): o cache do catálogo desta confere o
+    # data_version já nesta consulta, sem esperar o intervalo normal
+    estoque.proxima_validacao_catalogo = 0.0
+    return getattr(estoque, metodo)(*args)
+
+def _gravar_e_buscar_produto(estoque, metodo, produto_id, *args):
+    # Grava e devolve o produto como ficou, na mesma thread (e conexão) da gravação
+    resultado = getattr(estoque, metodo)(produto_id, *args)
+    return resultado, estoque._produto_do_catalogo(produto_id)
+
+def _registrar_saida_e_buscar_produto(estoque, produto_id, quantidade_saida):
+    # Sem o produto, registrar_saida não distingue "não existe" de "sem estoque"; retorna None se ele não existe
+    if estoque._produto_do_catalogo(produto_id) is None:
+        return None
+    estoque.registrar_saida(produto_id, quantidade_saida)
+    return estoque._produto_do_catalogo(produto_id)
+
+def _adicionar_e_buscar_produto(estoque, nome_produto, *args):
+    estoque.adicionar_ou_atualizar_produto(nome_produto, *args)
+    return estoque._produto_do_catalogo(nome=normalizar_nome_produto(nome_produto))
+
+class ServidorEstoque:
+    # Servidor HTTP com uma API JSON sobre o Estoque, para que vários caixas da rede local (no modo cliente,
+    # --cliente) trabalhem sobre o mesmo banco. Só usa a biblioteca padrão: o asyncio atende as conexões
+    # (HTTP/1.1 com keep-alive) e o banco fica em dois TrabalhadorBanco:
+    # - consultas: várias threads, cada uma com a sua conexão, atendendo a mesma fila (o WAL deixa ler em paralelo)
+    # - gravações: uma thread só; o SQLite grava uma transação por vez, e a fila evita que as threads disputem
+    #   o bloqueio de escrita até o TEMPO_ESPERA_BLOQUEIO
+    # Valores em centavos e data_hora em segundos desde 1970 (UTC), como no banco. Erros voltam como
+    # {"erro": mensagem}: 400 para requisições inválidas, 404, 409 quando o estoque recusa a operação (com
+    # itens_sem_estoque em uma venda) e 500
+    #
+    #   GET  /produtos?busca=&limite=            {"produtos": [...]}
+    #   GET  /produtos/sugestoes?texto=&limite=  {"produtos": [...]}, sem caminho_imagem
+    #   GET  /produtos/<id>                      {"produto": {...}}
+    #   POST /produtos                           {"nome", "quantidade", "preco_venda", "caminho_imagem"?, "codigo_barras"?}
+    #   POST /produtos/<id>/entrada              {"quantidade"}
+    #   POST /produtos/<id>/saida                {"quantidade"}
+    #   POST /saidas/codigos                     {"leituras": [[codigo_barras, quantidade], ...]}
+    #   POST /vendas                             {"itens": [[produto_id, quantidade], ...]}
+    #   GET  /alertas                            {"alertas": [...]}
+    #   GET  /movimentacoes?desde_id=&limite=    {"alertas": [...], "movimentacoes": [...]}, as mais recentes primeiro;
+    #        &ordem=id                           em ordem de id, para buscar em páginas a partir do maior id recebido
+    TAMANHO_MAXIMO_CORPO = 1024 * 1024
+    MAXIMO_CABECALHOS = 100
+    # Segundos que uma conexão pode ficar parada entre requisições
+    TEMPO_OCIOSO = 60
+    LIMITE_PRODUTOS = 1000
+    LIMITE_MOVIMENTACOES = 1000
+    # Intervalo entre as atualizações dos pontos de controle do estoque (uma hora), como na interface
+    INTERVALO_PONTOS_CONTROLE = 60 * 60
+
+    def __init__(self, caminho_banco=caminho_banco_de_dados, host='127.0.0.1', porta=PORTA_SERVIDOR, threads_consulta=4):
+        self.caminho_banco = caminho_banco
+        self.host = host
+        self.porta = porta
+        self.threads_consulta = threads_consulta
+        self.servidor = None
+        self.conexoes = set()
+        self.rotas = [(metodo, re.compile(padrao), tratador) for metodo, padrao, tratador in (
+            ('GET', r'/produtos', self.buscar_produtos),
+            ('GET', r'/produtos/sugestoes', self.sugerir_produtos),
+            ('GET', r'/produtos/(\d+)', self.buscar_produto),
+            ('POST', r'/produtos', self.adicionar_produto),
+            ('POST', r'/produtos/(\d+)/entrada', self.registrar_entrada),
+            ('POST', r'/produtos/(\d+)/saida', self.registrar_saida),
+            ('POST', r'/saidas/codigos', self.registrar_saidas_por_codigo),
+            ('POST', r'/vendas', self.registrar_venda),
+            ('GET', r'/alertas', self.buscar_alertas),
+            ('GET', r'/movimentacoes', self.buscar_movimentacoes),
+        )]
+
+    async def iniciar(self):
+        # Abre o banco uma vez antes das threads, para que as migrações não rodem em várias ao mesmo tempo
+        Estoque(self.caminho_banco).fechar()
+        self.consultas = TrabalhadorBanco(self.caminho_banco, threads=self.threads_consulta)
+        self.gravacoes = TrabalhadorBanco(self.caminho_banco)
+        self.servidor = await asyncio.start_server(self._atender_conexao, self.host, self.porta)
+        # Com porta 0, o sistema escolhe uma porta livre
+        self.porta = self.servidor.sockets[0].getsockname()[1]
+        self.tarefa_pontos_controle = asyncio.create_task(self._atualizar_pontos_controle())
+
+    async def fechar(self):
+        self.servidor.close()
+        # Conexões keep-alive paradas não terminariam sozinhas antes do TEMPO_OCIOSO
+        for escritor in list(self.conexoes):
+            escritor.close()
+        await self.servidor.wait_closed()
+        self.tarefa_pontos_controle.cancel()
+        # Espera as gravações já recebidas terminarem
+        await asyncio.to_thread(self.consultas.fechar)
+        await asyncio.to_thread(self.gravacoes.fechar)
+
+    async def _atualizar_pontos_controle(self):
+        while True:
+            try:
+                await asyncio.wrap_future(self.gravacoes.executar('atualizar_pontos_controle'))
+            except Exception:
+                logging.getLogger('estoque.servidor').exception("Erro ao atualizar os pontos de controle do estoque")
+            await asyncio.sleep(self.INTERVALO_PONTOS_CONTROLE)
+
+    def consultar(self, metodo, *args):
+        return asyncio.wrap_future(self.consultas.executar(_consultar, metodo, *args))
+
+    def gravar(self, operacao, *args):
+        return asyncio.wrap_future(self.gravacoes.executar(operacao, *args))
+
+    async def _atender_conexao(self, leitor, escritor):
+        self.conexoes.add(escritor)
+        try:
+            while await self._atender_requisicao(leitor, escritor):
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.conexoes.discard(escritor)
+            escritor.close()
+
+    async def _atender_requisicao(self, leitor, escritor):
+        # Lê e responde uma requisição; retorna se a conexão continua aberta para a próxima
+        try:
+            linha = await asyncio.wait_for(leitor.readline(), self.TEMPO_OCIOSO)
+        except ValueError:
+            # Linha maior que o limite do StreamReader
+            await self._responder(escritor, HTTPStatus.REQUEST_URI_TOO_LONG, {'erro': "Requisição muito longa."}, False)
+            return False
+        if not linha:
+            return False
+        partes = linha.decode('latin-1').split()
+        if len(partes) != 3 or not partes[2].startswith('HTTP/1.'):
+            await self._responder(escritor, HTTPStatus.BAD_REQUEST, {'erro': "Requisição HTTP inválida."}, False)
+            return False
+        metodo, alvo, versao = partes
+
+        cabecalhos = {}
+        while True:
+            linha = await asyncio.wait_for(leitor.readline(), self.TEMPO_OCIOSO)
+            if linha in (b'\r\n', b'\n', b''):
+                break
+            if len(cabecalhos) >= self.MAXIMO_CABECALHOS:
+                await self._responder(escritor, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, {'erro': "Cabeçalhos demais."}, False)
+                return False
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        conexao = cabecalhos.get('connection', '').lower()
+        manter_aberta = conexao != 'close' if versao == 'HTTP/1.1' else conexao == 'keep-alive'
+
+        if 'transfer-encoding' in cabecalhos:
+            await self._responder(escritor, HTTPStatus.LENGTH_REQUIRED, {'erro': "Envie o corpo com Content-Length."}, False)
+            return False
+        try:
+            tamanho = int(cabecalhos.get('content-length', 0))
+        except ValueError:
+            tamanho = -1
+        if not 0 <= tamanho <= self.TAMANHO_MAXIMO_CORPO:
+            status = HTTPStatus.REQUEST_ENTITY_TOO_LARGE if tamanho > 0 else HTTPStatus.BAD_REQUEST
+            await self._responder(escritor, status, {'erro': "Content-Length inválido ou grande demais."}, False)
+            return False
+        corpo = await asyncio.wait_for(leitor.readexactly(tamanho), self.TEMPO_OCIOSO) if tamanho else b''
+
+        status, resposta = await self._tratar(metodo, alvo, corpo)
+        await self._responder(escritor, status, resposta, manter_aberta)
+        return manter_aberta
+
+    async def _tratar(self, metodo, alvo, corpo):
+        url = urllib.parse.urlsplit(alvo)
+        parametros = {chave: valores[-1] for chave, valores in urllib.parse.parse_qs(url.query).items()}
+        metodos_da_rota = []
+        for metodo_rota, padrao, tratador in self.rotas:
+            encontrado = padrao.fullmatch(url.path)
+            if encontrado:
+                if metodo_rota == metodo:
+                    break
+                metodos_da_rota.append(metodo_rota)
+        else:
+            if metodos_da_rota:
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'erro': f"Use {' ou '.join(metodos_da_rota)} em {url.path}."}
+            return HTTPStatus.NOT_FOUND, {'erro': f"Caminho não encontrado: {url.path}"}
+
+        inicio = time.perf_counter()
+        try:
+            dados = json.loads(corpo) if corpo else {}
+            if not isinstance(dados, dict):
+                raise ErroRequisicao(HTTPStatus.BAD_REQUEST, "O corpo da requisição deve ser um objeto JSON.")
+            return HTTPStatus.OK, await tratador(parametros, dados, *(int(grupo) for grupo in encontrado.groups()))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return HTTPStatus.BAD_REQUEST, {'erro': "O corpo da requisição não é um JSON válido."}
+        except ErroRequisicao as e:
+            return e.status, {'erro': str(e)}
+        except EstoqueInsuficiente as e:
+            return HTTPStatus.CONFLICT, {'erro': str(e),
+                                         'itens_sem_estoque': [linha_para_json(CAMPOS_ITEM_SEM_ESTOQUE, item) for item in e.itens_sem_estoque]}
+        except ValueError as e:
+            return HTTPStatus.CONFLICT, {'erro': str(e)}
+        except Exception:
+            logging.getLogger('estoque.servidor').exception("Erro em %s %s", metodo, url.path)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'erro': "Erro interno no servidor de estoque."}
+        finally:
+            if instrumentacao.ativa:
+                instrumentacao.registrar(f"servidor.{metodo} {padrao.pattern}", (time.perf_counter() - inicio) * 1000)
+
+    async def _responder(self, escritor, status, resposta, manter_aberta):
+        corpo = json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        escritor.write((f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                        "Content-Type: application/json; charset=utf-8\r\n"
+                        f"Content-Length: {len(corpo)}\r\n"
+                        f"Connection: {'keep-alive' if manter_aberta else 'close'}\r\n"
+                        "\r\n").encode('latin-1') + corpo)
+        await escritor.drain()
+
+    async def buscar_produtos(self, parametros, dados):
+        limite = _ler_inteiro(parametros, 'limite', 200, minimo=1, maximo=self.LIMITE_PRODUTOS)
+        produtos = await self.consultar('consultar_produto', _ler_texto(parametros, 'busca', ''), limite)
+        return {'produtos': [linha_para_json(CAMPOS_PRODUTO, produto) for produto in produtos]}
+
+    async def sugerir_produtos(self, parametros, dados):
+        limite = _ler_inteiro(parametros, 'limite', 10, minimo=1, maximo=self.LIMITE_PRODUTOS)
+        produtos = await self.consultar('sugerir_produtos', _ler_texto(parametros, 'texto', ''), limite)
+        return {'produtos': [linha_para_json(CAMPOS_SUGESTAO, produto) for produto in produtos]}
+
+    async def buscar_produto(self, parametros, dados, produto_id):
+        produto = await self.consultar('_produto_do_catalogo', produto_id)
+        if produto is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, "Produto não encontrado")
+        return {'produto': linha_para_json(CAMPOS_PRODUTO, produto)}
+
+    async def adicionar_produto(self, parametros, dados):
+        nome_produto = _ler_texto(dados, 'nome').strip()
+        if not nome_produto:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, "O campo 'nome' não pode ficar vazio.")
+        codigo_barras = dados.get('codigo_barras')
+        if codigo_barras is not None:
+            codigo_barras = _ler_texto(dados, 'codigo_barras').strip() or None
+        produto = await self.gravar(_adicionar_e_buscar_produto, nome_produto,
+                                    _ler_inteiro(dados, 'quantidade', minimo=0), _ler_inteiro(dados, 'preco_venda', minimo=0),
+                                    _ler_texto(dados, 'caminho_imagem', ''), codigo_barras)
+        return {'produto': linha_para_json(CAMPOS_PRODUTO, produto)}
+
+    async def registrar_entrada(self, parametros, dados, produto_id):
+        atualizado, produto = await self.gravar(_gravar_e_buscar_produto, 'atualizar_quantidade_produto', produto_id,
+                                                _ler_inteiro(dados, 'quantidade', minimo=1))
+        if not atualizado:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, "Produto não encontrado")
+        return {'produto': linha_para_json(CAMPOS_PRODUTO, produto)}
+
+    async def registrar_saida(self, parametros, dados, produto_id):
+        produto = await self.gravar(_registrar_saida_e_buscar_produto, produto_id, _ler_inteiro(dados, 'quantidade', minimo=1))
+        if produto is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, "Produto não encontrado")
+        return {'produto': linha_para_json(CAMPOS_PRODUTO, produto)}
+
+    async def registrar_saidas_por_codigo(self, parametros, dados):
+        resultados = await self.gravar('registrar_saidas_por_codigo', _ler_pares(dados, 'leituras', 'codigo_barras', _ler_texto))
+        return {'resultados': [{'situacao': situacao, 'produto': linha_para_json(CAMPOS_PRODUTO, produto)}
+                               for situacao, produto in resultados]}
+
+    async def registrar_venda(self, parametros, dados):
+        venda_id = await self.gravar('registrar_venda', _ler_pares(dados, 'itens', 'produto_id', _ler_inteiro))
+        return {'venda_id': venda_id}
+
+    async def buscar_alertas(self, parametros, dados):
+        alertas = await self.consultar('buscar_alertas_estoque_baixo')
+        return {'alertas': [linha_para_json(CAMPOS_ALERTA, alerta) for alerta in alertas]}
+
+    async def buscar_movimentacoes(self, parametros, dados):
+        desde_id = _ler_inteiro(parametros, 'desde_id', 0, minimo=0)
+        limite = _ler_inteiro(parametros, 'limite', self.LIMITE_MOVIMENTACOES, minimo=1, maximo=self.LIMITE_MOVIMENTACOES)
+        ordem = _ler_texto(parametros, 'ordem', 'recentes')
+        if ordem not in ('recentes', 'id'):
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, "O campo 'ordem' deve ser 'recentes' ou 'id'.")
+        alertas, movimentacoes = await self.consultar('buscar_feed_atualizacoes', desde_id, limite, ordem == 'id')
+        return {'alertas': [linha_para_json(CAMPOS_ALERTA, alerta) for alerta in alertas],
+                'movimentacoes': [linha_para_json(CAMPOS_MOVIMENTACAO, movimentacao) for movimentacao in movimentacoes]}
+
+def executar_servidor(host='0.0.0.0', porta=PORTA_SERVIDOR, caminho_banco=caminho_banco_de_dados):
+    # Roda o servidor até o Ctrl+C
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    async def servir():
+        servidor = ServidorEstoque(caminho_banco, host, porta)
+        await servidor.iniciar()
+        print(f"Servidor de estoque em http://{host}:{servidor.porta} (Ctrl+C para parar)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await servidor.fechar()
+
+    try:
+        asyncio.run(servir())
+    except KeyboardInterrupt:
+        pass
+
+class EstoqueRemoto:
+    # Cliente da API do ServidorEstoque, com os métodos do Estoque que a interface usa no modo cliente
+    # (--cliente URL) e as mesmas tuplas de retorno. Como o Estoque, cada instância deve ser usada por uma
+    # thread só: ela mantém uma conexão HTTP aberta entre as chamadas
+    # Falhas de rede e operações recusadas pelo servidor viram ValueError com a mensagem do erro
+    TEMPO_LIMITE = 10
+    # Conexões paradas há mais tempo que isto são reabertas antes do uso, pois o servidor pode tê-las fechado
+    # (veja ServidorEstoque.TEMPO_OCIOSO)
+    TEMPO_REAPROVEITAR = 30
+
+    def __init__(self, url):
+        partes = urllib.parse.urlsplit(url)
+        if partes.scheme != 'http' or not partes.hostname:
+            raise ValueError(f"Endereço de servidor inválido: {url} (use, por exemplo, http://192.168.0.10:{PORTA_SERVIDOR})")
+        # O TrabalhadorBanco abre o cliente da sua thread a partir de caminho_banco, como faria com o Estoque
+        self.caminho_banco = url
+        self.host = partes.hostname
+        self.porta = partes.port or PORTA_SERVIDOR
+        self.prefixo = partes.path.rstrip('/')
+        self.conexao = None
+        self.ultimo_uso = 0.0
+
+    def fechar(self):
+        if self.conexao is not None:
+            self.conexao.close()
+            self.conexao = None
+
+    def _requisitar(self, metodo, caminho, parametros=None, dados=None, nao_encontrado=False):
+        # Retorna o JSON da resposta; com nao_encontrado=True, um 404 retorna None em vez de levantar o erro
+        alvo = self.prefixo + caminho
+        if parametros:
+            alvo += '?' + urllib.parse.urlencode(parametros)
+        corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+        cabecalhos = {'Content-Type': 'application/json'} if corpo is not None else {}
+        for tentativa in range(2):
+            reaproveitada = self.conexao is not None and time.monotonic() - self.ultimo_uso < self.TEMPO_REAPROVEITAR
+            if not reaproveitada:
+                self.fechar()
+                self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=self.TEMPO_LIMITE)
+            try:
+                self.conexao.request(metodo, alvo, corpo, cabecalhos)
+                resposta = self.conexao.getresponse()
+                conteudo = resposta.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.fechar()
+                # O servidor pode ter fechado a conexão reaproveitada; só as consultas são repetidas, pois uma
+                # gravação pode ter sido feita antes da falha
+                if reaproveitada and metodo == 'GET' and tentativa == 0:
+                    continue
+                raise ValueError(f"Não foi possível falar com o servidor de estoque em {self.caminho_banco}: {e}") from e
+            break
+        self.ultimo_uso = time.monotonic()
+        if resposta.getheader('Connection', '').lower() == 'close':
+            self.fechar()
+
+        try:
+            resultado = json.loads(conteudo)
+        except ValueError:
+            raise ValueError(f"Resposta inválida do servidor de estoque (HTTP {resposta.status}).") from None
+        if resposta.status == HTTPStatus.NOT_FOUND and nao_encontrado:
+            return None
+        if resposta.status >= 400:
+            if 'itens_sem_estoque' in resultado:
+                raise EstoqueInsuficiente([json_para_linha(CAMPOS_ITEM_SEM_ESTOQUE, item) for item in resultado['itens_sem_estoque']])
+            raise ValueError(resultado.get('erro', f"Erro HTTP {resposta.status} no servidor de estoque."))
+        return resultado
+
+    def consultar_produto(self, query, limite=200):
+        resultado = self._requisitar('GET', '/produtos', {'busca': query, 'limite': limite})
+        return [json_para_linha(CAMPOS_PRODUTO, produto) for produto in resultado['produtos']]
+
+    def buscar_produtos_por_nome(self, nome_produto, limite=200):
+        return [produto[:3] for produto in self.consultar_produto(nome_produto, limite)]
+
+    def sugerir_produtos(self, texto, limite=10):
+        resultado = self._requisitar('GET', '/produtos/sugestoes', {'texto': texto, 'limite': limite})
+        return [json_para_linha(CAMPOS_SUGESTAO, produto) for produto in resultado['produtos']]
+
+    def buscar_produto_por_id(self, produto_id):
+        try:
+            produto_id_int = int(produto_id)
+        except ValueError:
+            return "ID de produto inválido"
+        resultado = self._requisitar('GET', f'/produtos/{produto_id_int}', nao_encontrado=True) if produto_id_int >= 0 else None
+        return json_para_linha(CAMPOS_PRODUTO, resultado['produto']) if resultado else "Produto não encontrado"
+
+    def buscar_nome_produto_por_id(self, produto_id):
+        produto = self.buscar_produto_por_id(produto_id)
+        if produto == "ID de produto inválido":
+            return produto
+        return produto[1] if produto != "Produto não encontrado" else "Nome não encontrado"
+
+    def adicionar_ou_atualizar_produto(self, nome_produto, quantidade_nova, preco_venda, caminho_imagem, codigo_barras=None):
+        self._requisitar('POST', '/produtos', dados={'nome': nome_produto, 'quantidade': quantidade_nova, 'preco_venda': preco_venda,
+                                                     'caminho_imagem': caminho_imagem, 'codigo_barras': codigo_barras})
+
+    def atualizar_quantidade_produto(self, produto_id, quantidade_adicional):
+        resultado = self._requisitar('POST', f'/produtos/{int(produto_id)}/entrada', dados={'quantidade': quantidade_adicional},
+                                     nao_encontrado=True)
+        return resultado is not None
+
+    def registrar_saida(self, produto_id, quantidade_saida, event=None):
+        self._requisitar('POST', f'/produtos/{int(produto_id)}/saida', dados={'quantidade': quantidade_saida})
+
+    def registrar_saidas_por_codigo(self, leituras):
+        resultado = self._requisitar('POST', '/saidas/codigos', dados={'leituras': [list(leitura) for leitura in leituras]})
+        return [(item['situacao'], json_para_linha(CAMPOS_PRODUTO, item['produto'])) for item in resultado['resultados']]
+
+    def registrar_venda(self, itens):
+        return self._requisitar('POST', '/vendas', dados={'itens': [list(item) for item in itens]})['venda_id']
+
+    def buscar_alertas_estoque_baixo(self):
+        return [json_para_linha(CAMPOS_ALERTA, alerta) for alerta in self._requisitar('GET', '/alertas')['alertas']]
+
+    def contar_alertas_estoque_baixo(self):
+        return len(self.buscar_alertas_estoque_baixo())
+
+    def buscar_feed_atualizacoes(self, desde_id=0, limite=None, crescente=False):
+        # O servidor devolve no máximo ServidorEstoque.LIMITE_MOVIMENTACOES movimentações por resposta. As
+        # 'limite' mais recentes cabem em uma resposta; para trazer todas sem pular nenhuma, as páginas vêm em
+        # ordem de id, cada uma a partir da maior já recebida, até uma incompleta
+        if limite is not None and not crescente and limite <= ServidorEstoque.LIMITE_MOVIMENTACOES:
+            resultado = self._requisitar('GET', '/movimentacoes', {'desde_id': desde_id, 'limite': limite})
+            return ([json_para_linha(CAMPOS_ALERTA, alerta) for alerta in resultado['alertas']],
+                    [json_para_linha(CAMPOS_MOVIMENTACAO, movimentacao) for movimentacao in resultado['movimentacoes']])
+        movimentacoes = []
+        while True:
+            resultado = self._requisitar('GET', '/movimentacoes', {'desde_id': desde_id, 'ordem': 'id',
+                                                                    'limite': ServidorEstoque.LIMITE_MOVIMENTACOES})
+            pagina = [json_para_linha(CAMPOS_MOVIMENTACAO, movimentacao) for movimentacao in resultado['movimentacoes']]
+            movimentacoes.extend(pagina)
+            if len(pagina) < ServidorEstoque.LIMITE_MOVIMENTACOES or (crescente and limite is not None and len(movimentacoes) >= limite):
+                break
+            desde_id = pagina[-1][0]
+        # Os alertas da última página são os mais atuais
+        alertas = [json_para_linha(CAMPOS_ALERTA, alerta) for alerta in resultado['alertas']]
+        if not crescente:
+            movimentacoes.sort(key=lambda movimentacao: (movimentacao[5], movimentacao[0]), reverse=True)
+        return alertas, movimentacoes[:limite]
 
 class DialogoAdicionarProduto(tk.Toplevel):
     def __init__(self, parent, estoque, app_parent, produto_id=None):
@@ -340,6 +2692,7 @@ class DialogoAdicionarProduto(tk.Toplevel):
         self.quantidade = tk.StringVar()
         self.preco_venda = tk.StringVar()
         self.caminho_imagem = tk.StringVar()
+        self.codigo_barras = tk.StringVar()
         self.entrada_nome_produto = tk.Entry(self, textvariable=self.nome)
         self.entrada_nome_produto.grid(row=0, column=1)
         self.bind('<Escape>', lambda event: self.destroy())
@@ -357,24 +2710,34 @@ class DialogoAdicionarProduto(tk.Toplevel):
         tk.Label(self, text="Caminho da imagem do produto:").grid(row=3, column=0)
         tk.Entry(self, textvariable=self.caminho_imagem).grid(row=3, column=1)
         tk.Button(self, text="Selecionar Imagem", command=self.selecionar_imagem).grid(row=3, column=2)
+
+        # O leitor de código de barras digita o código e um Enter, que aqui não deve salvar o produto
+        tk.Label(self, text="Código de barras (opcional):").grid(row=4, column=0)
+        entrada_codigo_barras = tk.Entry(self, textvariable=self.codigo_barras)
+        entrada_codigo_barras.grid(row=4, column=1)
+        entrada_codigo_barras.bind('<Return>', lambda event: 'break')
         # Botão Salvar
         botao_salvar = tk.Button(self, text="Salvar", command=self.salvar_produto)
-        botao_salvar.grid(row=4, column=1)
+        botao_salvar.grid(row=5, column=1)
         botao_salvar.bind('<Return>', self.salvar_produto)
         botao_salvar.focus_set()
 
         if produto_id is not None:
             # Se um produto_id foi fornecido, preencha os campos com as informações do produto para atualização
-            produto = self.estoque.buscar_produto_por_id(produto_id)
-            if produto:
-                self.nome.set(produto[1])
-                self.quantidade.set(produto[2])
-                self.preco_venda.set(produto[3])
-                self.caminho_imagem.set(produto[4])
-            else:
-                messagebox.showerror("Erro", "Produto não encontrado.")
-                self.destroy()
+            self.parent.consultar_estoque('buscar_produto_por_id', produto_id, ao_concluir=self.preencher_campos)
         self.grab_set()  # Mantém o foco na janela de diálogo
+
+    def preencher_campos(self, produto):
+        if not self.winfo_exists():
+            return
+        if produto:
+            self.nome.set(produto[1])
+            self.quantidade.set(produto[2])
+            self.preco_venda.set(formatar_preco_para_edicao(produto[3]))
+            self.caminho_imagem.set(produto[4])
+        else:
+            messagebox.showerror("Erro", "Produto não encontrado.")
+            self.destroy()
         
     def selecionar_imagem(self):
         self.update()  # Atualiza a janela principal antes de abrir o explorador de arquivos
@@ -389,20 +2752,29 @@ class DialogoAdicionarProduto(tk.Toplevel):
         try:
             nome=self.nome.get()
             quantidade=int(self.quantidade.get())
-            preco_venda = formatar_preco_para_float(self.preco_venda.get())
+            preco_venda = converter_preco_para_centavos(self.preco_venda.get())
             caminho_imagem=self.caminho_imagem.get()
-
-            # Adicionar ou atualizar o produto no estoque
-            self.estoque.adicionar_ou_atualizar_produto(nome, quantidade, preco_venda, caminho_imagem)
-            messagebox.showinfo("Sucesso", "Produto adicionado com sucesso!")
-            
-            # Limpa os campos para nova entrada
-            self.limpar_campos()
-            self.parent.atualizar_area_atualizacoes()
+            codigo_barras = self.codigo_barras.get().strip() or None
         except ValueError as e:
             messagebox.showerror("Erro", f"Ocorreu um erro ao adicionar o produto: {e}")
-        except Exception as e:
-            messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {e}")
+            return
+
+        # Adicionar ou atualizar o produto no estoque
+        self.parent.no_banco('adicionar_ou_atualizar_produto', nome, quantidade, preco_venda, caminho_imagem, codigo_barras,
+                             ao_concluir=self.produto_salvo, ao_falhar=self.erro_ao_salvar)
+
+    def produto_salvo(self, resultado):
+        messagebox.showinfo("Sucesso", "Produto adicionado com sucesso!")
+        # Limpa os campos para nova entrada
+        if self.winfo_exists():
+            self.limpar_campos()
+        self.parent.atualizar_area_atualizacoes()
+
+    def erro_ao_salvar(self, erro):
+        if isinstance(erro, ValueError):
+            messagebox.showerror("Erro", f"Ocorreu um erro ao adicionar o produto: {erro}")
+        else:
+            messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {erro}")
 
     def configurar_atualizacao_produto(self, produto_id):
         produto = self.estoque.buscar_produto_por_id(produto_id)
@@ -430,12 +2802,20 @@ class DialogoAdicionarProduto(tk.Toplevel):
     def salvar_atualizacao_produto(self, produto_id):
         try:
             quantidade_adicional = int(self.quantidade.get())
-            self.estoque.atualizar_quantidade_produto(produto_id, quantidade_adicional)
-            messagebox.showinfo("Sucesso", "Quantidade do produto atualizada com sucesso!")
-            self.app_parent.atualizar_area_atualizacoes()
-            self.destroy()
         except ValueError:
             messagebox.showerror("Erro", "Por favor, insira um número válido.")
+            return
+        self.parent.no_banco('atualizar_quantidade_produto', produto_id, quantidade_adicional,
+                             ao_concluir=self.quantidade_atualizada)
+
+    def quantidade_atualizada(self, atualizado):
+        if not atualizado:
+            messagebox.showerror("Erro", "Não foi possível atualizar a quantidade do produto.")
+            return
+        messagebox.showinfo("Sucesso", "Quantidade do produto atualizada com sucesso!")
+        self.parent.atualizar_area_atualizacoes()
+        if self.winfo_exists():
+            self.destroy()
 
     def configurar_adicao_produto(self):
         tk.Label(self, text="Nome do produto:").grid(row=0, column=0)
@@ -468,13 +2848,30 @@ class DialogoAdicionarProduto(tk.Toplevel):
         self.quantidade.set('')
         self.preco_venda.set('')
         self.caminho_imagem.set('')
+        self.codigo_barras.set('')
         self.entrada_nome_produto.focus_set()
     
 class Aplicativo:
-    def __init__(self, master):
+    def __init__(self, master, url_servidor=None):
+        # Com url_servidor (modo cliente), o estoque é o de um ServidorEstoque da rede local, e não o banco local
         self.master = master
-        self.master.title("Aplicativo de Estoque")
-        self.estoque = Estoque()
+        self.url_servidor = url_servidor
+        if url_servidor:
+            self.master.title(f"Aplicativo de Estoque - {url_servidor}")
+            self.estoque = EstoqueRemoto(url_servidor)
+        else:
+            self.master.title("Aplicativo de Estoque")
+            self.estoque = Estoque()
+        # Gravações e consultas que podem demorar rodam na thread do TrabalhadorBanco; as respostas voltam por
+        # esta fila e são tratadas na thread do Tk (veja no_banco)
+        self.trabalhador_banco = TrabalhadorBanco(self.estoque.caminho_banco, abrir_estoque=type(self.estoque))
+        self.respostas_banco = queue.Queue()
+        self.pedidos_pendentes = 0
+        self.indicador_agendado = None
+        self.master.protocol('WM_DELETE_WINDOW', self.fechar)
+        self.cache_miniaturas = CacheMiniaturas()
+        # Imagem vazia do tamanho de uma miniatura, usada como espaço reservado enquanto a imagem carrega
+        self.imagem_reservada = tk.PhotoImage(width=100, height=100)
 
         # Maximiza a janela ao abrir
         self.master.state('zoomed')
@@ -486,6 +2883,25 @@ class Aplicativo:
         largura_minima = min(800, largura_tela)
         altura_minima = min(600, altura_tela)
         self.master.minsize(largura_minima, altura_minima)
+
+        # Barra de menus
+        self.barra_menus = tk.Menu(self.master)
+        self.menu_arquivo = tk.Menu(self.barra_menus, tearoff=0)
+        self.menu_arquivo.add_command(label="Importar produtos (CSV)...", command=self.abrir_dialogo_importar)
+        self.menu_arquivo.add_separator()
+        self.menu_arquivo.add_command(label="Compactar histórico de movimentações...", command=self.compactar_historico)
+        self.barra_menus.add_cascade(label="Arquivo", menu=self.menu_arquivo)
+        self.menu_relatorios = tk.Menu(self.barra_menus, tearoff=0)
+        for tipo, titulo in Estoque.RELATORIOS.items():
+            self.menu_relatorios.add_command(label=f"{titulo}...", command=lambda tipo=tipo: self.abrir_dialogo_relatorio(tipo))
+        self.barra_menus.add_cascade(label="Relatórios", menu=self.menu_relatorios)
+        self.menu_diagnostico = tk.Menu(self.barra_menus, tearoff=0)
+        self.instrumentacao_ativa = tk.BooleanVar(value=instrumentacao.ativa)
+        self.menu_diagnostico.add_checkbutton(label="Medir desempenho", variable=self.instrumentacao_ativa,
+                                              command=lambda: instrumentacao.ativar(self.instrumentacao_ativa.get()))
+        self.menu_diagnostico.add_command(label="Abrir diagnóstico...", command=self.abrir_diagnostico)
+        self.barra_menus.add_cascade(label="Diagnóstico", menu=self.menu_diagnostico)
+        self.master.config(menu=self.barra_menus)
         
         # Configura o gerenciador de layout grid para a janela principal
         self.master.grid_rowconfigure(0, weight=1)
@@ -503,11 +2919,27 @@ class Aplicativo:
         self.botao_atualizacoes = tk.Button(self.frame_principal, text="Exibir Atualizações do Estoque", bg='#005b4f', fg='white', font=fonte_botao, command=self.toggle_atualizacoes_estoque)
         self.botao_atualizacoes.grid(row=0, column=0, sticky='ew', padx=10, pady=20, ipady=5)
         self.botao_atualizacoes.bind('<Return>', lambda event: self.toggle_atualizacoes_estoque())
+        # Contador de produtos com estoque baixo; clicar nele abre as atualizações do estoque
+        self.label_contador_alertas = tk.Label(self.frame_principal, font=fonte_botao, padx=10, cursor='hand2')
+        self.label_contador_alertas.grid(row=0, column=1, sticky='ew', padx=(0, 10), pady=20, ipady=5)
+        self.label_contador_alertas.bind('<Button-1>', lambda event: self.mostrar_atualizacoes_estoque())
         self.frame_principal.grid_rowconfigure(1, weight=1)
         self.frame_principal.grid_columnconfigure(0, weight=1)
         self.texto_atualizacoes = scrolledtext.ScrolledText(self.frame_principal, wrap=tk.WORD, font=('Arial', 16), state='disabled')
-        self.texto_atualizacoes.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+        self.texto_atualizacoes.grid(row=1, column=0, columnspan=2, sticky='nsew', padx=10, pady=10)
         self.texto_atualizacoes.grid_remove()
+        # Define as tags para as cores
+        self.texto_atualizacoes.tag_config('saida', foreground='red')
+        self.texto_atualizacoes.tag_config('entrada', foreground='green')
+        self.texto_atualizacoes.tag_config('alerta', foreground='red', background='yellow')
+        # Maior id de movimentação já exibido na área de atualizações e quantas movimentações ela mostra
+        self.ultimo_id_movimentacao = 0
+        self.movimentacoes_exibidas = 0
+        # Controle da busca do feed no trabalhador: uma por vez; a geração muda quando a área é reconstruída,
+        # para descartar uma resposta pedida antes disso
+        self.geracao_feed = 0
+        self.feed_em_andamento = False
+        self.feed_repetir = False
         
         # Cria um frame para a faixa lateral 
         self.frame_lateral = tk.Frame(master, bg='#E4E3E1')
@@ -520,6 +2952,10 @@ class Aplicativo:
         self.frame_lateral.grid_rowconfigure(3, weight=0)
         self.frame_lateral.grid_rowconfigure(4, weight=0)
         self.frame_lateral.grid_rowconfigure(5, weight=0) 
+        self.frame_lateral.grid_rowconfigure(6, weight=0)
+        self.frame_lateral.grid_rowconfigure(7, weight=0)
+        self.frame_lateral.grid_rowconfigure(8, weight=0)
+        self.frame_lateral.grid_rowconfigure(9, weight=0)
         self.frame_lateral.grid_columnconfigure(0, weight=1)
         
         # botão para Pesquisar produto
@@ -551,7 +2987,171 @@ class Aplicativo:
         self.botao_configurar_alerta = tk.Button(self.frame_lateral, text="➡  Alerta de Estoque Baixo", bg='#005b4f', fg='white', font=fonte_botao, command=self.configurar_alerta_produto)
         self.botao_configurar_alerta.grid(row=5, column=0, sticky='ew', padx=30, pady= 30, ipady=5)
         self.botao_configurar_alerta.bind('<Return>', lambda event: self.configurar_alerta_produto())
+
+        # Botão para abrir o histórico de movimentações
+        self.botao_historico = tk.Button(self.frame_lateral, text="➡  Histórico de Movimentações", bg='#005b4f', fg='white', font=fonte_botao, command=self.abrir_historico_movimentacoes)
+        self.botao_historico.grid(row=6, column=0, sticky='ew', padx=30, pady=(0, 30), ipady=5)
+        self.botao_historico.bind('<Return>', lambda event: self.abrir_historico_movimentacoes())
+
+        # Botão para abrir a análise de vendas
+        self.botao_analise_vendas = tk.Button(self.frame_lateral, text="➡  Análise de Vendas", bg='#005b4f', fg='white', font=fonte_botao, command=self.abrir_analise_vendas)
+        self.botao_analise_vendas.grid(row=7, column=0, sticky='ew', padx=30, pady=(0, 30), ipady=5)
+        self.botao_analise_vendas.bind('<Return>', lambda event: self.abrir_analise_vendas())
+
+        # Botão para abrir o modo leitor de código de barras
+        self.botao_modo_leitor = tk.Button(self.frame_lateral, text="➡  Modo Leitor (Caixa)", bg='#005b4f', fg='white', font=fonte_botao, command=self.abrir_modo_leitor)
+        self.botao_modo_leitor.grid(row=8, column=0, sticky='ew', padx=30, pady=(0, 30), ipady=5)
+        self.botao_modo_leitor.bind('<Return>', lambda event: self.abrir_modo_leitor())
+
+        # Botão para abrir o carrinho de uma venda com vários itens
+        self.botao_nova_venda = tk.Button(self.frame_lateral, text="➡  Nova Venda (Carrinho)", bg='#005b4f', fg='white', font=fonte_botao, command=self.abrir_dialogo_venda)
+        self.botao_nova_venda.grid(row=9, column=0, sticky='ew', padx=30, pady=(0, 30), ipady=5)
+        self.botao_nova_venda.bind('<Return>', lambda event: self.abrir_dialogo_venda())
+
+        # Indicador mostrado enquanto há operações de banco em andamento
+        self.frame_ocupado = tk.Frame(master)
+        self.frame_ocupado.grid(row=1, column=0, columnspan=2, sticky='ew')
+        self.label_ocupado = tk.Label(self.frame_ocupado, text="Aguarde...")
+        self.label_ocupado.pack(side=tk.LEFT, padx=10)
+        self.barra_ocupado = ttk.Progressbar(self.frame_ocupado, mode='indeterminate', length=200)
+        self.barra_ocupado.pack(side=tk.LEFT, pady=2)
+        self.frame_ocupado.grid_remove()
+
+        if url_servidor:
+            # O servidor só expõe as operações do caixa; o resto (e os pontos de controle) fica com quem tem o banco
+            for menu in ("Arquivo", "Relatórios"):
+                self.barra_menus.entryconfig(menu, state='disabled')
+            for botao in (self.botao_apagar, self.botao_configurar_alerta, self.botao_historico, self.botao_analise_vendas):
+                botao.config(state='disabled')
+
+        self.master.after(50, self.verificar_respostas_banco)
+        self.no_banco('contar_alertas_estoque_baixo', ao_concluir=self.atualizar_contador_alertas)
+        if not url_servidor:
+            self.atualizar_pontos_controle()
+
+    # Tempo até mostrar o indicador de operação em andamento; operações rápidas não o fazem piscar
+    ATRASO_INDICADOR_MS = 200
+
+    def no_banco(self, operacao, *args, ao_concluir=None, ao_falhar=None, descricao="Aguarde...", **kwargs):
+        # Executa a operação (nome de um método de Estoque ou função que recebe o Estoque) no TrabalhadorBanco
+        # ao_concluir(resultado) ou ao_falhar(erro) são chamadas depois, na thread do Tk; sem ao_falhar, o erro
+        # é mostrado em uma caixa de mensagem
+        futuro = self.trabalhador_banco.executar(operacao, *args, **kwargs)
+        # Com a instrumentação ligada, mede o tempo do pedido até a resposta chegar à thread do Tk
+        if instrumentacao.ativa:
+            nome = operacao if isinstance(operacao, str) else operacao.__name__
+            medicao = (f"banco.{nome}", time.perf_counter())
+        else:
+            medicao = None
+        self.pedidos_pendentes += 1
+        self.label_ocupado.config(text=descricao)
+        if self.indicador_agendado is None and not self.frame_ocupado.winfo_ismapped():
+            self.indicador_agendado = self.master.after(self.ATRASO_INDICADOR_MS, self.mostrar_indicador_ocupado)
+        futuro.add_done_callback(lambda futuro: self.respostas_banco.put((futuro, ao_concluir, ao_falhar, medicao)))
+        return futuro
+
+    def consultar_estoque(self, operacao, *args, ao_concluir, ao_falhar=None):
+        # Consultas curtas das janelas (buscar um produto, sugestões da busca): no banco local levam poucos
+        # milissegundos e rodam direto na thread do Tk, chamando ao_concluir na hora; no modo cliente cada uma é
+        # uma requisição ao servidor, que pode demorar, então vão para o TrabalhadorBanco como em no_banco
+        if self.url_servidor:
+            self.no_banco(operacao, *args, ao_concluir=ao_concluir, ao_falhar=ao_falhar)
+        else:
+            ao_concluir(getattr(self.estoque, operacao)(*args))
+
+    def verificar_respostas_banco(self):
+        try:
+            while True:
+                try:
+                    futuro, ao_concluir, ao_falhar, medicao = self.respostas_banco.get_nowait()
+                except queue.Empty:
+                    break
+                self.pedidos_pendentes -= 1
+                if medicao:
+                    nome, inicio = medicao
+                    instrumentacao.registrar(nome, (time.perf_counter() - inicio) * 1000)
+                # O trabalhador grava por outra conexão: o cache do catálogo desta confere o data_version na
+                # próxima busca, sem esperar o intervalo normal
+                self.estoque.proxima_validacao_catalogo = 0.0
+                erro = futuro.exception()
+                if erro is None:
+                    if ao_concluir:
+                        ao_concluir(futuro.result())
+                elif ao_falhar:
+                    ao_falhar(erro)
+                else:
+                    messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {erro}")
+        finally:
+            if self.pedidos_pendentes == 0:
+                self.esconder_indicador_ocupado()
+            self.master.after(50, self.verificar_respostas_banco)
+
+    def mostrar_indicador_ocupado(self):
+        self.indicador_agendado = None
+        if self.pedidos_pendentes:
+            self.frame_ocupado.grid()
+            self.barra_ocupado.start(15)
+            self.master.config(cursor='watch')
+
+    def esconder_indicador_ocupado(self):
+        if self.indicador_agendado is not None:
+            self.master.after_cancel(self.indicador_agendado)
+            self.indicador_agendado = None
+        if self.frame_ocupado.winfo_ismapped():
+            self.barra_ocupado.stop()
+            self.frame_ocupado.grid_remove()
+            self.master.config(cursor='')
+
+    # Intervalo entre as atualizações dos pontos de controle do estoque (uma hora)
+    INTERVALO_PONTOS_CONTROLE_MS = 60 * 60 * 1000
+
+    def atualizar_pontos_controle(self):
+        # Grava pontos de controle para os produtos com muitas movimentações desde o último, ao abrir e depois a
+        # cada hora, para que o estoque em uma data continue rápido
+        self.no_banco('atualizar_pontos_controle', descricao="Atualizando os pontos de controle do estoque...")
+        self.master.after(self.INTERVALO_PONTOS_CONTROLE_MS, self.atualizar_pontos_controle)
+
+    def fechar(self):
+        # Espera as gravações já enviadas ao trabalhador terminarem antes de fechar
+        self.trabalhador_banco.fechar()
+        self.estoque.fechar()
+        self.master.destroy()
         
+    @acao_interface('importar_produtos')
+    def abrir_dialogo_importar(self):
+        caminho_csv = filedialog.askopenfilename(
+            title="Selecione o arquivo CSV de produtos",
+            filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos", "*.*")]
+        )
+        if caminho_csv:
+            DialogoImportarProdutos(self.master, self.estoque, self, caminho_csv)
+
+    def compactar_historico(self):
+        horizonte_dias = simpledialog.askinteger(
+            "Compactar histórico", "Arquivar as movimentações com mais de quantos dias?",
+            initialvalue=self.estoque.obter_configuracao('horizonte_compactacao_dias', 365), minvalue=1, parent=self.master)
+        if horizonte_dias is None:
+            return
+        confirmacao = messagebox.askyesno(
+            "Confirmar",
+            f"As movimentações com mais de {horizonte_dias} dias serão movidas para o arquivo de histórico e resumidas por dia. "
+            "O estoque atual não muda. Deseja continuar?")
+        if not confirmacao:
+            return
+        self.no_banco('compactar_movimentacoes', horizonte_dias, ao_concluir=self.compactacao_concluida,
+                      ao_falhar=lambda e: messagebox.showerror("Erro", f"Ocorreu um erro ao compactar o histórico: {e}"),
+                      descricao="Compactando o histórico de movimentações...")
+
+    def compactacao_concluida(self, arquivadas):
+        messagebox.showinfo("Sucesso", f"{arquivadas} movimentações foram arquivadas.")
+        # As movimentações arquivadas saem da área de atualizações
+        self.exibir_atualizacoes_estoque()
+
+    @acao_interface('relatorio')
+    def abrir_dialogo_relatorio(self, tipo):
+        DialogoExportarRelatorio(self.master, self.estoque, tipo)
+
+    @acao_interface('adicionar_produto')
     def abrir_dialogo_adicionar(self):
         dialogo = DialogoAdicionarProduto(self.master, self.estoque, self)
         centralizar_janela(dialogo)  # Chama a função para centralizar e ajustar o tamanho
@@ -560,25 +3160,27 @@ class Aplicativo:
         query = simpledialog.askstring("Registrar Entrada de Produto", "Digite o nome ou ID do produto:")
         if query is None:
             return
-        produto_encontrado = None
         if query:
             # Verifica se a consulta é um número (ID)
             if query.isdigit():
                 produto_id = int(query)
-                produto_encontrado = self.estoque.buscar_produto_por_id(produto_id)
-                if produto_encontrado:
-                    self.mostrar_janela_selecao_para_atualizar([produto_encontrado])
-                else:
-                    messagebox.showinfo("Informação", "Nenhum produto encontrado.")
+                self.consultar_estoque('buscar_produto_por_id', produto_id, ao_concluir=self.produto_para_atualizar_encontrado)
             else:
                 # Assume que a consulta é um nome
-                produtos_encontrados = self.estoque.buscar_produtos_por_nome(query)
-                if len(produtos_encontrados) == 1:
-                    produto_encontrado = produtos_encontrados[0]
-                    self.mostrar_janela_selecao_para_atualizar([produto_encontrado])
-                elif len(produtos_encontrados) > 1:
-                    self.mostrar_janela_selecao_para_atualizar(produtos_encontrados, query)
-                    return
+                self.consultar_estoque('buscar_produtos_por_nome', query,
+                                       ao_concluir=lambda produtos_encontrados: self.produtos_para_atualizar_encontrados(produtos_encontrados, query))
+
+    def produto_para_atualizar_encontrado(self, produto_encontrado):
+        if produto_encontrado:
+            self.mostrar_janela_selecao_para_atualizar([produto_encontrado])
+        else:
+            messagebox.showinfo("Informação", "Nenhum produto encontrado.")
+
+    def produtos_para_atualizar_encontrados(self, produtos_encontrados, query):
+        if len(produtos_encontrados) == 1:
+            self.mostrar_janela_selecao_para_atualizar([produtos_encontrados[0]])
+        elif len(produtos_encontrados) > 1:
+            self.mostrar_janela_selecao_para_atualizar(produtos_encontrados, query)
         
     def mostrar_janela_selecao_para_atualizar(self, produtos, query=None):
         janela_selecao = tk.Toplevel(self.master)
@@ -609,12 +3211,17 @@ class Aplicativo:
         selecionado = lista_produtos.curselection()
         if selecionado:
             produto_id = lista_produtos.get(selecionado).split(" - ")[0].replace("ID: ", "")
-            produto = self.estoque.buscar_produto_por_id(produto_id)
-            if produto:
-                self.abrir_janela_atualizacao_quantidade(produto)
-                janela_selecao.destroy()
-            else:
-                messagebox.showinfo("Informação", "Produto não encontrado.", parent=janela_selecao)
+
+            def produto_encontrado(produto):
+                if not janela_selecao.winfo_exists():
+                    return
+                if produto:
+                    self.abrir_janela_atualizacao_quantidade(produto)
+                    janela_selecao.destroy()
+                else:
+                    messagebox.showinfo("Informação", "Produto não encontrado.", parent=janela_selecao)
+
+            self.consultar_estoque('buscar_produto_por_id', produto_id, ao_concluir=produto_encontrado)
         else:
             messagebox.showinfo("Informação", "Por favor, selecione um produto para atualizar.", parent=janela_selecao)
 
@@ -643,76 +3250,42 @@ class Aplicativo:
             nonlocal quantidade_entrada, dialogo_atualizar, produto
             try:
                 quantidade_adicional = int(quantidade_entrada.get())
-                self.estoque.atualizar_quantidade_produto(produto[0], quantidade_adicional)
-                messagebox.showinfo("Sucesso", "Quantidade do produto atualizada com sucesso!", parent=dialogo_atualizar)
-                dialogo_atualizar.destroy()
-                # Atualize a área de atualizações
-                self.atualizar_area_atualizacoes()
             except ValueError:
                 messagebox.showerror("Erro", "Por favor, insira um número válido.", parent=dialogo_atualizar)
+                return
+            self.no_banco('atualizar_quantidade_produto', produto[0], quantidade_adicional, ao_concluir=atualizacao_concluida)
+
+        def atualizacao_concluida(atualizado):
+            if not atualizado:
+                messagebox.showerror("Erro", "Não foi possível atualizar a quantidade do produto.", parent=dialogo_atualizar)
+                return
+            messagebox.showinfo("Sucesso", "Quantidade do produto atualizada com sucesso!", parent=dialogo_atualizar)
+            dialogo_atualizar.destroy()
+            # Atualize a área de atualizações
+            self.atualizar_area_atualizacoes()
         # Botão para confirmar a atualização
         tk.Button(dialogo_atualizar, text="Confirmar", command=confirmar_atualizacao).grid(row=4, column=1)
         dialogo_atualizar.bind('<Return>', confirmar_atualizacao)
 
+    @acao_interface('alerta_estoque')
     def configurar_alerta_produto(self):
-        janela_alerta_produto = tk.Toplevel(self.master)
-        janela_alerta_produto.title("Configurar Alerta de Estoque por Produto")
-        janela_alerta_produto.geometry('350x150')
-        centralizar_janela(janela_alerta_produto)
-        janela_alerta_produto.grab_set()
-        janela_alerta_produto.bind('<Escape>', lambda event: janela_alerta_produto.destroy())
-        janela_alerta_produto.focus_set()
-
-        tk.Label(janela_alerta_produto, text="Selecione o produto:").grid(row=0, column=0, pady=10)
-        tk.Label(janela_alerta_produto, text="Defina a quantidade mínima:").grid(row=1, column=0, pady=10)
+        DialogoAlertaEstoque(self.master, self.estoque, self)
 
-        lista_produtos = self.estoque.buscar_todos_os_produtos()
-        nomes_produtos = [produto[1] for produto in lista_produtos]  # Cria uma lista apenas com os nomes dos produtos
-
-        combo_produto = ttk.Combobox(janela_alerta_produto, values=nomes_produtos)
-        combo_produto.grid(row=0, column=1, pady=10)
-        combo_produto.current(0)  # Define o valor padrão como o primeiro produto da lista
-
-        spinbox_valor = tk.Spinbox(janela_alerta_produto, from_=0, to=1000, increment=1, wrap=True)
-        spinbox_valor.grid(row=1, column=1, pady=10)
-
-        botao_salvar = tk.Button(janela_alerta_produto, text="Salvar", command=lambda: self.salvar_limite_alerta(combo_produto.get(), spinbox_valor.get(), janela_alerta_produto))
-        botao_salvar.grid(row=2, column=0, columnspan=2, pady=10)
-
-
-    def salvar_limite_alerta(self, nome_produto, valor, janela_alerta_produto):
-        try:
-            produto_id = self.estoque.buscar_id_produto_por_nome(nome_produto)
-            valor_int = int(valor)
-            self.estoque.definir_limite_alerta(produto_id, valor_int)
-            messagebox.showinfo("Sucesso", f"Alerta de estoque baixo configurado para o produto {nome_produto} com o valor: {valor_int}", parent=janela_alerta_produto)
-            janela_alerta_produto.destroy()
-            self.exibir_atualizacoes_estoque()
-        except ValueError:
-            messagebox.showerror("Erro", "Por favor, insira um número válido.", parent=janela_alerta_produto)
-        
     def pesquisar_produto(self):
         query = simpledialog.askstring("Pesquisar produto", "Digite o nome ou ID do produto:")
         if query is not None and query.strip():
         # Verifica se a consulta é um número (ID)
-            if query.isdigit():
-                produto_id = int(query)
-                produto = self.estoque.buscar_nome_produto_por_id(produto_id)
-                if produto != "Nome não encontrado":
-                    produtos = self.estoque.consultar_produto(produto)
-                    self.mostrar_resultados(produtos)
-                else:
-                    messagebox.showinfo("Pesquisar produto", "Nenhum produto encontrado para a pesquisa.")
-            else:
-                 # Assume que a consulta é um nome
-                produtos = self.estoque.consultar_produto(query)
-                if produtos:
-                    self.mostrar_resultados(produtos)
-                else:
-                    messagebox.showinfo("Pesquisar produto", "Nenhum produto encontrado para a pesquisa.")
+            self.no_banco(pesquisar_produtos, query, ao_concluir=self.mostrar_resultados_pesquisa, descricao="Pesquisando...")
         elif query is None:
             pass  # Não faz nada se a caixa de diálogo for fechada sem entrada
+
+    def mostrar_resultados_pesquisa(self, produtos):
+        if produtos:
+            self.mostrar_resultados(produtos)
+        else:
+            messagebox.showinfo("Pesquisar produto", "Nenhum produto encontrado para a pesquisa.")
     
+    @acao_interface('resultados_pesquisa')
     def mostrar_resultados(self, produtos):
         janela_resultados = tk.Toplevel(self.master)
         janela_resultados.title("Resultados da Pesquisa")
@@ -721,6 +3294,9 @@ class Aplicativo:
     
         texto_resultados = scrolledtext.ScrolledText(janela_resultados, wrap=tk.WORD, font=('Arial', 16))
         texto_resultados.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        # Miniaturas que ainda estão sendo lidas em segundo plano: (future, label que vai recebê-la)
+        carregamentos_pendentes = []
     
         for id, nome, quantidade, preco_venda, caminho_imagem in produtos:
             preco_formatado = formatar_valor_para_exibicao(preco_venda)
@@ -735,60 +3311,157 @@ class Aplicativo:
             label_dados.pack(side=tk.LEFT, padx=5)
         
             if caminho_imagem:
-                try:
-                    imagem = Image.open(caminho_imagem)
-                    imagem.thumbnail((100, 100))  # Redimensiona a imagem para caber na janela
-                    imagem_tk = ImageTk.PhotoImage(imagem)
+                imagem_tk = self.cache_miniaturas.obter_da_memoria(caminho_imagem)
+                if imagem_tk is not None:
                     label_imagem = tk.Label(frame_produto, image=imagem_tk)
                     label_imagem.image = imagem_tk  # Salva uma referência para evitar que a imagem seja coletada pelo garbage collector
-                    label_imagem.pack(side=tk.LEFT, padx=5)
-                except Exception as e:
-                    texto_resultados.insert(tk.END, f"Erro ao carregar a imagem: {e}\n")
+                else:
+                    # Mostra um espaço reservado do tamanho da miniatura enquanto a imagem é lida em outra thread
+                    label_imagem = tk.Label(frame_produto, image=self.imagem_reservada, text="Carregando...", compound=tk.CENTER)
+                    carregamentos_pendentes.append((self.cache_miniaturas.carregar_em_segundo_plano(caminho_imagem), label_imagem))
+                label_imagem.pack(side=tk.LEFT, padx=5)
             texto_resultados.insert(tk.END, "\n")
         texto_resultados.config(state=tk.DISABLED)  # Desativa a edição do texto
 
+        if carregamentos_pendentes:
+            self.acompanhar_carregamento_miniaturas(janela_resultados, carregamentos_pendentes)
+
+    def acompanhar_carregamento_miniaturas(self, janela, carregamentos_pendentes):
+        # Verifica periodicamente, na thread do Tk, quais miniaturas ficaram prontas e as coloca no lugar
+        # dos espaços reservados; se a janela for fechada antes, cancela o que ainda não começou
+        agendamento = None
+
+        def verificar():
+            nonlocal agendamento
+            ainda_pendentes = []
+            for futuro, label_imagem in carregamentos_pendentes:
+                if not futuro.done():
+                    ainda_pendentes.append((futuro, label_imagem))
+                    continue
+                try:
+                    chave, miniatura = futuro.result()
+                    imagem_tk = self.cache_miniaturas.guardar(chave, miniatura)
+                    label_imagem.config(image=imagem_tk, text="")
+                    label_imagem.image = imagem_tk
+                except Exception:
+                    label_imagem.config(text="Imagem\nindisponível")
+            carregamentos_pendentes[:] = ainda_pendentes
+            agendamento = janela.after(30, verificar) if carregamentos_pendentes else None
+
+        def cancelar(event):
+            # O evento <Destroy> também chega para cada widget filho; só interessa o da janela
+            if event.widget is not janela:
+                return
+            if agendamento is not None:
+                janela.after_cancel(agendamento)
+            for futuro, label_imagem in carregamentos_pendentes:
+                futuro.cancel()
+
+        janela.bind('<Destroy>', cancelar, add='+')
+        agendamento = janela.after(30, verificar)
+
+    @acao_interface('registrar_saida')
     def abrir_dialogo_registrar_saida(self):
       DialogoRegistrarSaida(self.master, self.estoque, self)
 
+    @acao_interface('venda')
+    def abrir_dialogo_venda(self):
+        DialogoVenda(self.master, self.estoque, self)
+
+    @acao_interface('modo_leitor')
+    def abrir_modo_leitor(self):
+        JanelaModoLeitor(self.master, self)
+
+    @acao_interface('historico_movimentacoes')
+    def abrir_historico_movimentacoes(self):
+        JanelaHistoricoMovimentacoes(self.master, self.estoque)
+
+    @acao_interface('analise_vendas')
+    def abrir_analise_vendas(self):
+        JanelaAnaliseVendas(self.master, self.estoque)
+
+    def abrir_diagnostico(self):
+        JanelaDiagnostico(self.master, self.instrumentacao_ativa)
+
     def exibir_atualizacoes_estoque(self):
+        # Reconstrói a área de atualizações do zero (usado quando movimentações são apagadas)
         self.texto_atualizacoes.config(state='normal')
         self.texto_atualizacoes.delete('1.0', tk.END)
-        
-        # Define as tags para as cores
-        self.texto_atualizacoes.tag_config('saida', foreground='red')
-        self.texto_atualizacoes.tag_config('entrada', foreground='green')
-        self.texto_atualizacoes.tag_config('alerta', foreground='red', background='yellow') 
-        
-        # Busca o limite de alerta de estoque baixo do banco de dados
-        todos_os_produtos = self.estoque.buscar_todos_os_produtos()
-        alertas_estoque_baixo = []
-
-        # Verifica todos os produtos para identificar alertas de estoque baixo
-        for produto in todos_os_produtos:
-            produto_id, nome_produto, quantidade_atual = produto
-            limite_alerta = self.estoque.buscar_limite_alerta(produto_id)
-            if limite_alerta is not None and quantidade_atual <= limite_alerta:
-                alertas_estoque_baixo.append(f"Alerta de Estoque Baixo: {nome_produto}, Quantidade Atual: {quantidade_atual}\n")
+        self.texto_atualizacoes.config(state='disabled')
+        self.ultimo_id_movimentacao = 0
+        self.movimentacoes_exibidas = 0
+        self.geracao_feed += 1
+        self.atualizar_area_atualizacoes()
+
+    # A área de atualizações mostra só as movimentações mais recentes: com o histórico inteiro, abrir a área
+    # inseriria centenas de milhares de linhas de uma vez no ScrolledText, e ela cresceria sem limite
+    LIMITE_FEED = 500
+
+    def atualizar_area_atualizacoes(self):
+        # Busca no trabalhador só o que mudou desde a última movimentação exibida; se já houver uma busca em
+        # andamento, pede outra quando ela terminar, para nunca inserir a mesma movimentação duas vezes
+        if self.feed_em_andamento:
+            self.feed_repetir = True
+            return
+        self.feed_em_andamento = True
+        geracao = self.geracao_feed
+        self.no_banco('buscar_feed_atualizacoes', self.ultimo_id_movimentacao, self.LIMITE_FEED,
+                      ao_concluir=lambda feed: self.feed_recebido(geracao, feed),
+                      ao_falhar=lambda erro: self.feed_recebido(geracao, None, erro))
+
+    def feed_recebido(self, geracao, feed, erro=None):
+        self.feed_em_andamento = False
+        if erro is not None:
+            messagebox.showerror("Erro", f"Ocorreu um erro ao buscar as atualizações do estoque: {erro}")
+        elif geracao == self.geracao_feed:
+            self.exibir_feed(*feed)
+        if self.feed_repetir or geracao != self.geracao_feed:
+            self.feed_repetir = False
+            self.atualizar_area_atualizacoes()
+
+    def exibir_feed(self, alertas, movimentacoes):
+        # Atualiza a área de forma incremental: troca só o bloco de alertas e insere apenas as movimentações
+        # com id maior que a última já exibida
+        self.texto_atualizacoes.config(state='normal')
+
+        # Remove o bloco de alertas anterior, que fica sempre no topo da área de texto
+        faixas_alerta = self.texto_atualizacoes.tag_ranges('alerta')
+        if faixas_alerta:
+            self.texto_atualizacoes.delete('1.0', faixas_alerta[-1])
+
+        linhas_alerta, linhas_movimentacao = montar_linhas_feed(alertas, movimentacoes)
+
         # Insere os alertas de estoque baixo no topo da área de texto
-        for alerta in alertas_estoque_baixo:
-            self.texto_atualizacoes.insert('1.0', alerta, 'alerta')
-
-        movimentacoes = self.estoque.buscar_movimentacoes_recentes()
-        for mov in movimentacoes:
-            nome_produto = self.estoque.buscar_nome_produto_por_id(mov[1])
-            tipo_movimentacao = "Saída" if mov[2].lower() == "saida" else "Entrada"
-            data_hora_formatada = datetime.datetime.strptime(mov[4], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y : %H:%M')
-            quantidade_atual = self.estoque.buscar_quantidade_atual_por_id(mov[1])
-            self.texto_atualizacoes.insert(tk.END, f"{tipo_movimentacao}, ", 'saida' if tipo_movimentacao == "Saída" else 'entrada')
-            self.texto_atualizacoes.insert(tk.END, f"ID: {mov[1]},Nome: {nome_produto}, Quantidade: {mov[3]}, Data e Hora: {data_hora_formatada}\n")
-        
+        for linha in linhas_alerta:
+            self.texto_atualizacoes.insert('1.0', linha, 'alerta')
+
+        # As movimentações novas entram logo abaixo dos alertas; a mais recente fica por cima
+        posicao = self.texto_atualizacoes.index('alerta.last') if alertas else '1.0'
+        for mov_id, tipo_movimentacao, tag, linha in linhas_movimentacao:
+            self.texto_atualizacoes.insert(posicao, f"{tipo_movimentacao}, ", tag, linha, ())
+            self.ultimo_id_movimentacao = max(self.ultimo_id_movimentacao, mov_id)
+
+        # Acima do limite, as movimentações mais antigas (as últimas linhas) saem da área
+        self.movimentacoes_exibidas += len(linhas_movimentacao)
+        excesso = self.movimentacoes_exibidas - self.LIMITE_FEED
+        if excesso > 0:
+            self.texto_atualizacoes.delete(f'end - {excesso + 1} lines', 'end - 1 lines')
+            self.movimentacoes_exibidas = self.LIMITE_FEED
+
         # Desabilita a edição da área de texto após a atualização
         self.texto_atualizacoes.config(state='disabled')
-        self.botao_atualizacoes.config(text="Fechar Atualizações do Estoque")
+        self.atualizar_contador_alertas(len(alertas))
+
+    def atualizar_contador_alertas(self, quantidade_alertas):
+        if quantidade_alertas:
+            texto = "⚠ 1 produto com estoque baixo" if quantidade_alertas == 1 else f"⚠ {quantidade_alertas} produtos com estoque baixo"
+            self.label_contador_alertas.config(text=texto, bg='yellow', fg='red')
+        else:
+            self.label_contador_alertas.config(text="Nenhum alerta de estoque", bg='#f0f0f0', fg='#005b4f')
 
-    def atualizar_area_atualizacoes(self):
-        # Verifica se a área de atualizações está visível antes de atualizar
-        self.exibir_atualizacoes_estoque()
+    def mostrar_atualizacoes_estoque(self):
+        if not self.texto_atualizacoes.winfo_ismapped():
+            self.toggle_atualizacoes_estoque()
 
     def toggle_atualizacoes_estoque(self):
         if self.texto_atualizacoes.winfo_ismapped():
@@ -827,24 +3500,35 @@ class Aplicativo:
         query = simpledialog.askstring("Apagar Produto", "Digite o nome ou ID do produto a ser apagado:")
         if query is None:
             return
-        produtos_encontrados = []
-        if query:
-            # Verifica se a consulta é um número (ID)
-            if query.isdigit():
-                produto_id = int(query)
-                produto = self.estoque.buscar_produto_por_id(produto_id)
-                if produto != "Produto não encontrado":
-                    produtos_encontrados = [produto]
+
+        def produtos_encontrados(produtos):
+            if produtos:
+                self.mostrar_janela_selecao_para_apagar(produtos, query)
             else:
-                # Assume que a consulta é um nome
-                produtos_encontrados = self.estoque.buscar_produtos_por_nome(query)
-        if produtos_encontrados:
-            self.mostrar_janela_selecao_para_apagar(produtos_encontrados, query)
+                messagebox.showinfo("Informação", "Nenhum produto encontrado.")
+
+        if not query:
+            produtos_encontrados([])
+        # Verifica se a consulta é um número (ID)
+        elif query.isdigit():
+            produto_id = int(query)
+            self.consultar_estoque('buscar_produto_por_id', produto_id,
+                                   ao_concluir=lambda produto: produtos_encontrados([produto] if produto != "Produto não encontrado" else []))
         else:
-            messagebox.showinfo("Informação", "Nenhum produto encontrado.")
+            # Assume que a consulta é um nome
+            self.consultar_estoque('buscar_produtos_por_nome', query, ao_concluir=produtos_encontrados)
+
+    def produto_apagado(self, janela_selecao, nome_produto):
+        messagebox.showinfo("Sucesso", "Produto apagado com sucesso!", parent=janela_selecao)
+        self.exibir_lista_produtos(nome_produto)
+        self.exibir_atualizacoes_estoque()
 
     def exibir_lista_produtos(self, nome_produto):
-        produtos_encontrados = self.estoque.buscar_produtos_por_nome(nome_produto)
+        self.consultar_estoque('buscar_produtos_por_nome', nome_produto, ao_concluir=self.mostrar_lista_produtos)
+
+    def mostrar_lista_produtos(self, produtos_encontrados):
+        if not self.lista_produtos.winfo_exists():
+            return
         if produtos_encontrados:
             self.lista_produtos.delete(0, tk.END)
             # Insere os produtos atualizados na lista
@@ -884,124 +3568,1116 @@ class Aplicativo:
     def confirmar_e_apagar_produto(self, lista_produtos, janela_selecao, nome_produto, event=None):
         selecionado = lista_produtos.curselection()
         if selecionado:
-            produto_id = lista_produtos.get(selecionado).split(" - ")[0].replace("ID: ", "")
+            produto_id = int(lista_produtos.get(selecionado).split(" - ")[0].replace("ID: ", ""))
             confirmacao = messagebox.askyesno("Confirmar", "Tem certeza que deseja apagar o produto selecionado?", parent=janela_selecao)
             if confirmacao:
-                self.estoque.apagar_produto(produto_id)
-                messagebox.showinfo("Sucesso", "Produto apagado com sucesso!", parent=janela_selecao)
-                self.exibir_lista_produtos(nome_produto)
-                self.exibir_atualizacoes_estoque()  
+                self.no_banco('apagar_produto', produto_id,
+                              ao_concluir=lambda resultado: self.produto_apagado(janela_selecao, nome_produto))
         else:
             messagebox.showinfo("Informação", "Por favor, selecione um produto para apagar.", parent=janela_selecao)
             janela_selecao.update_idletasks()
             janela_selecao.destroy()   
 
-class DialogoRegistrarSaida(tk.Toplevel):
-    def __init__(self, parent, estoque, app_parent):
+class DialogoImportarProdutos(tk.Toplevel):
+    def __init__(self, parent, estoque, app_parent, caminho_csv):
         super().__init__(parent)
+        self.title("Importar Produtos")
+        self.geometry('600x400')
         self.estoque = estoque
         self.parent = app_parent
-        self.title("Registrar Saída de Produto")
-        self.bind('<Escape>', lambda event: self.destroy())
-        self.geometry('350x150') 
+        self.protocol("WM_DELETE_WINDOW", self.fechar)
+
+        tk.Label(self, text=f"Importando: {os.path.basename(caminho_csv)}").pack(padx=10, pady=(10, 5), anchor=tk.W)
+        self.barra_progresso = ttk.Progressbar(self, maximum=1.0)
+        self.barra_progresso.pack(fill=tk.X, padx=10)
+        self.label_situacao = tk.Label(self, text="Lendo o arquivo...")
+        self.label_situacao.pack(padx=10, pady=5, anchor=tk.W)
+        self.texto_rejeitados = scrolledtext.ScrolledText(self, wrap=tk.WORD, height=10, state='disabled')
+        self.texto_rejeitados.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.botao_fechar = tk.Button(self, text="Fechar", command=self.fechar, state='disabled')
+        self.botao_fechar.pack(pady=(0, 10))
         centralizar_janela(self)
+        self.grab_set()
 
-        tk.Label(self, text="Digite o Nome ou ID do produto:").grid(row=0, column=0)
-        self.entrada_nome_produto = tk.Entry(self)
-        self.entrada_nome_produto.grid(row=0, column=1)
-        self.entrada_nome_produto.focus_set()
-        self.entrada_nome_produto.bind('<Return>', lambda event: self.buscar_produto())
-        tk.Button(self, text="Buscar", command=self.buscar_produto).grid(row=0, column=2)
-    
-    
-    def buscar_produto(self):
-        query = self.entrada_nome_produto.get()
-        if query is not None and query.strip():
-            # Verifica se a consulta é um número (ID)
-            if query.isdigit():
-                produto_id = int(query)
-                produto = self.estoque.buscar_produto_por_id(produto_id)
-                if produto != "Nome não encontrado":
-                    produtos_encontrados = [produto]
-                    self.mostrar_produtos_encontrados(produtos_encontrados)
+        # A importação roda em outra thread, com a sua própria conexão; a janela só lê a fila de mensagens
+        self.mensagens = queue.Queue()
+        threading.Thread(target=self.importar, args=(caminho_csv,), daemon=True).start()
+        self.after(100, self.verificar_mensagens)
+
+    def importar(self, caminho_csv):
+        try:
+            estoque = Estoque(self.estoque.caminho_banco)
+            try:
+                resultado = estoque.importar_produtos_csv(
+                    caminho_csv, ao_progredir=lambda *progresso: self.mensagens.put(('progresso', progresso)))
+            finally:
+                estoque.fechar()
+            self.mensagens.put(('concluido', resultado))
+        except Exception as e:
+            self.mensagens.put(('erro', e))
+
+    def verificar_mensagens(self):
+        try:
+            while True:
+                tipo, conteudo = self.mensagens.get_nowait()
+                if tipo == 'progresso':
+                    fracao_lida, importados, quantidade_rejeitados = conteudo
+                    self.barra_progresso['value'] = fracao_lida
+                    self.label_situacao.config(text=f"{importados} linhas importadas, {quantidade_rejeitados} rejeitadas...")
+                elif tipo == 'concluido':
+                    self.finalizar(*conteudo)
+                    return
                 else:
-                    messagebox.showinfo("Informação", "Nenhum produto encontrado.")
-            else:
-                # Assume que a consulta é um nome
-                produtos_encontrados = self.estoque.buscar_produtos_por_nome(query)
-                if produtos_encontrados:
-                    self.mostrar_produtos_encontrados(produtos_encontrados)
+                    self.label_situacao.config(text="A importação foi interrompida.")
+                    self.botao_fechar.config(state='normal')
+                    messagebox.showerror("Erro", f"Ocorreu um erro ao importar os produtos: {conteudo}", parent=self)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.verificar_mensagens)
+
+    def finalizar(self, importados, rejeitados):
+        self.barra_progresso['value'] = 1.0
+        self.label_situacao.config(text=f"Importação concluída: {importados} linhas importadas, {len(rejeitados)} rejeitadas.")
+        if rejeitados:
+            self.texto_rejeitados.config(state='normal')
+            self.texto_rejeitados.insert(tk.END, "".join(f"Linha {numero_linha}: {motivo}\n" for numero_linha, motivo in rejeitados))
+            self.texto_rejeitados.config(state='disabled')
+        self.botao_fechar.config(state='normal')
+        self.botao_fechar.focus_set()
+        self.parent.atualizar_area_atualizacoes()
+
+    def fechar(self):
+        # Só permite fechar depois que a importação terminar
+        if str(self.botao_fechar['state']) == 'normal':
+            self.destroy()
+
+class DialogoExportarRelatorio(tk.Toplevel):
+    def __init__(self, parent, estoque, tipo):
+        super().__init__(parent)
+        self.estoque = estoque
+        self.tipo = tipo
+        self.title(Estoque.RELATORIOS[tipo])
+        self.bind('<Escape>', lambda event: self.fechar())
+        self.protocol("WM_DELETE_WINDOW", self.fechar)
+        self.cancelado = threading.Event()
+        self.exportando = False
+
+        linha = 0
+        if tipo == 'movimentacoes':
+            tk.Label(self, text="De (dd/mm/aaaa):").grid(row=0, column=0, padx=10, pady=5, sticky=tk.W)
+            self.entrada_data_inicio = tk.Entry(self, width=12)
+            self.entrada_data_inicio.grid(row=0, column=1, padx=10, pady=5)
+            tk.Label(self, text="Até (dd/mm/aaaa):").grid(row=1, column=0, padx=10, pady=5, sticky=tk.W)
+            self.entrada_data_fim = tk.Entry(self, width=12)
+            self.entrada_data_fim.grid(row=1, column=1, padx=10, pady=5)
+            self.entrada_data_inicio.focus_set()
+            linha = 2
+        elif tipo == 'estoque_em_data':
+            tk.Label(self, text="Estoque no fim do dia (dd/mm/aaaa):").grid(row=0, column=0, padx=10, pady=5, sticky=tk.W)
+            self.entrada_data_fim = tk.Entry(self, width=12)
+            self.entrada_data_fim.insert(0, datetime.date.today().strftime('%d/%m/%Y'))
+            self.entrada_data_fim.grid(row=0, column=1, padx=10, pady=5)
+            self.entrada_data_fim.focus_set()
+            linha = 1
+
+        self.barra_progresso = ttk.Progressbar(self, mode='indeterminate', length=300)
+        self.barra_progresso.grid(row=linha, column=0, columnspan=2, padx=10, pady=5)
+        self.label_situacao = tk.Label(self, text="Escolha Exportar para salvar em CSV ou XLSX.")
+        self.label_situacao.grid(row=linha + 1, column=0, columnspan=2, padx=10, pady=5)
+        self.botao_exportar = tk.Button(self, text="Exportar", command=self.exportar)
+        self.botao_exportar.grid(row=linha + 2, column=0, padx=10, pady=10)
+        tk.Button(self, text="Cancelar", command=self.fechar).grid(row=linha + 2, column=1, padx=10, pady=10)
+        centralizar_janela(self)
+
+    def exportar(self):
+        data_inicio = data_fim = None
+        if self.tipo == 'movimentacoes':
+            try:
+                if self.entrada_data_inicio.get().strip():
+                    data_inicio = converter_data_para_banco(self.entrada_data_inicio.get().strip())
+                if self.entrada_data_fim.get().strip():
+                    data_fim = converter_data_para_banco(self.entrada_data_fim.get().strip(), fim_do_dia=True)
+            except ValueError:
+                messagebox.showerror("Erro", "Por favor, insira as datas no formato dd/mm/aaaa.", parent=self)
+                return
+        elif self.tipo == 'estoque_em_data':
+            try:
+                data_fim = converter_data_para_banco(self.entrada_data_fim.get().strip(), fim_do_dia=True)
+            except ValueError:
+                messagebox.showerror("Erro", "Por favor, insira a data no formato dd/mm/aaaa.", parent=self)
+                return
+
+        caminho_destino = filedialog.asksaveasfilename(
+            parent=self,
+            title="Salvar relatório",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Planilha do Excel", "*.xlsx")]
+        )
+        if not caminho_destino:
+            return
+
+        self.exportando = True
+        self.botao_exportar.config(state='disabled')
+        self.barra_progresso.start()
+        self.label_situacao.config(text="Exportando...")
+        # A exportação roda em outra thread, com a sua própria conexão, para não travar a janela
+        self.mensagens = queue.Queue()
+        threading.Thread(target=self.gravar, args=(caminho_destino, data_inicio, data_fim), daemon=True).start()
+        self.after(100, self.verificar_mensagens)
+
+    def gravar(self, caminho_destino, data_inicio, data_fim):
+        try:
+            estoque = Estoque(self.estoque.caminho_banco)
+            try:
+                linhas_gravadas = estoque.exportar_relatorio(
+                    self.tipo, caminho_destino, data_inicio, data_fim,
+                    ao_progredir=lambda linhas: self.mensagens.put(('progresso', linhas)), cancelado=self.cancelado)
+            finally:
+                estoque.fechar()
+            self.mensagens.put(('concluido', (caminho_destino, linhas_gravadas)))
+        except ExportacaoCancelada:
+            self.mensagens.put(('cancelado', None))
+        except Exception as e:
+            self.mensagens.put(('erro', e))
+
+    def verificar_mensagens(self):
+        try:
+            while True:
+                tipo, conteudo = self.mensagens.get_nowait()
+                if tipo == 'progresso':
+                    self.label_situacao.config(text=f"Exportando... {conteudo} linhas gravadas")
+                    continue
+                self.exportando = False
+                self.barra_progresso.stop()
+                if tipo == 'concluido':
+                    caminho_destino, linhas_gravadas = conteudo
+                    # O cabeçalho não conta como linha do relatório
+                    messagebox.showinfo("Sucesso", f"Relatório salvo em {caminho_destino} ({linhas_gravadas - 1} linhas).", parent=self)
+                    self.destroy()
+                elif tipo == 'erro':
+                    self.botao_exportar.config(state='normal')
+                    self.label_situacao.config(text="A exportação falhou.")
+                    messagebox.showerror("Erro", f"Ocorreu um erro ao exportar o relatório: {conteudo}", parent=self)
                 else:
-                    messagebox.showinfo("Informação", "Nenhum produto encontrado.")
-        elif query is None:
-            pass  # Não faz nada se a caixa de diálogo for fechada sem entrada
-    
-    def mostrar_produtos_encontrados(self, produtos):
-        # Cria uma nova janela para mostrar os produtos encontrados
-        janela_selecao = tk.Toplevel(self)
-        janela_selecao.title("Selecionar Produto")
-        janela_selecao.geometry('800x600')
-        minha_fonte = font.Font(family='Helvetica', size=16, weight='bold')
-        janela_selecao.bind('<Escape>', lambda event: janela_selecao.destroy())
+                    self.destroy()
+                return
+        except queue.Empty:
+            pass
+        self.after(100, self.verificar_mensagens)
 
-        lista_produtos = tk.Listbox(janela_selecao, font=minha_fonte)
-        lista_produtos.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-        lista_produtos.bind('<Return>', lambda event: self.selecionar_produto(lista_produtos, janela_selecao))
-        lista_produtos.focus_set()
+    def fechar(self):
+        if self.exportando:
+            # Pede para a thread parar; a janela fecha quando ela confirmar o cancelamento
+            self.cancelado.set()
+            self.label_situacao.config(text="Cancelando...")
+        else:
+            self.destroy()
 
-        for produto in produtos:
-            lista_produtos.insert(tk.END, f"ID: {produto[0]} - Nome: {produto[1]} - Quantidade: {produto[2]}")
-        tk.Button(janela_selecao, text="Selecionar", command=lambda: self.selecionar_produto(lista_produtos, janela_selecao)).pack()
+class CampoBuscaProduto(tk.Frame):
+    # Campo de busca com sugestões enquanto se digita: a lista abaixo do campo é atualizada um pouco depois da
+    # última tecla (debounce), para não consultar o banco a cada letra de quem digita rápido
+    # Setas para cima e para baixo escolhem a sugestão sem tirar o foco do campo; Enter ou duplo clique
+    # confirmam e chamam ao_selecionar(produto), com produto = (id, nome, quantidade, preco_venda)
+    # As sugestões vêm por Aplicativo.consultar_estoque: no modo cliente chegam depois, e a geração da busca
+    # descarta a resposta de uma busca que outra tecla já substituiu
+    ATRASO_BUSCA_MS = 150
+    LIMITE_SUGESTOES = 10
 
-    def selecionar_produto(self, lista_produtos, janela_selecao):
-        selecionado = lista_produtos.curselection()
-        if selecionado:
-            produto_id = lista_produtos.get(selecionado).split(" - ")[0].replace("ID: ", "")
-            self.abrir_dialogo_quantidade_saida(produto_id, janela_selecao)
+    def __init__(self, parent, app, ao_selecionar, fonte=None):
+        super().__init__(parent)
+        self.app = app
+        self.ao_selecionar = ao_selecionar
+        self.sugestoes = []
+        self.busca_agendada = None
+        self.geracao_busca = 0
+        self.geracao_exibida = 0
+        self.confirmar_ao_receber = False
+
+        self.texto = tk.StringVar()
+        self.entrada = tk.Entry(self, textvariable=self.texto, font=fonte)
+        self.entrada.pack(fill=tk.X)
+        self.lista = tk.Listbox(self, height=self.LIMITE_SUGESTOES, font=fonte, activestyle='none', exportselection=False)
+        self.lista.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+
+        self.texto.trace_add('write', lambda *args: self.agendar_busca())
+        self.entrada.bind('<Down>', lambda event: self.mover_selecao(1))
+        self.entrada.bind('<Up>', lambda event: self.mover_selecao(-1))
+        self.entrada.bind('<Return>', lambda event: self.confirmar())
+        self.lista.bind('<Return>', lambda event: self.confirmar())
+        self.lista.bind('<Double-Button-1>', lambda event: self.confirmar())
+
+    def focus_set(self):
+        self.entrada.focus_set()
+
+    def limpar(self):
+        self.texto.set("")
+
+    def agendar_busca(self):
+        if self.busca_agendada:
+            self.after_cancel(self.busca_agendada)
+        self.busca_agendada = self.after(self.ATRASO_BUSCA_MS, self.buscar)
+
+    def buscar(self):
+        self.busca_agendada = None
+        self.geracao_busca += 1
+        geracao = self.geracao_busca
+        self.app.consultar_estoque('sugerir_produtos', self.texto.get(), self.LIMITE_SUGESTOES,
+                                   ao_concluir=lambda sugestoes: self.mostrar_sugestoes(geracao, sugestoes),
+                                   ao_falhar=lambda erro: self.falha_na_busca(geracao, erro))
+
+    def mostrar_sugestoes(self, geracao, sugestoes):
+        if geracao != self.geracao_busca or not self.winfo_exists():
+            return
+        self.geracao_exibida = geracao
+        self.sugestoes = sugestoes
+        self.lista.delete(0, tk.END)
+        for produto_id, nome, quantidade, preco_venda in self.sugestoes:
+            self.lista.insert(tk.END, f"ID: {produto_id} - {nome} - Quantidade: {quantidade} - {formatar_valor_para_exibicao(preco_venda)}")
+        if self.sugestoes:
+            self.lista.selection_set(0)
+        if self.confirmar_ao_receber:
+            self.confirmar_ao_receber = False
+            self.confirmar_selecao()
+
+    def falha_na_busca(self, geracao, erro):
+        if geracao != self.geracao_busca or not self.winfo_exists():
+            return
+        self.confirmar_ao_receber = False
+        messagebox.showerror("Erro", f"Não foi possível buscar os produtos: {erro}", parent=self)
+
+    def mover_selecao(self, passo):
+        if self.sugestoes:
+            selecionado = self.lista.curselection()
+            indice = min(max((selecionado[0] if selecionado else -1) + passo, 0), len(self.sugestoes) - 1)
+            self.lista.selection_clear(0, tk.END)
+            self.lista.selection_set(indice)
+            self.lista.see(indice)
+        return 'break'
+
+    def confirmar(self):
+        # Enter logo depois de digitar não espera o debounce: busca na hora e confirma quando as sugestões chegarem
+        if self.busca_agendada:
+            self.after_cancel(self.busca_agendada)
+            self.buscar()
+        if self.geracao_exibida != self.geracao_busca:
+            self.confirmar_ao_receber = True
         else:
-            messagebox.showinfo("Informação", "Por favor, selecione um produto.") 
-
-    def abrir_dialogo_quantidade_saida(self, produto_id, janela_selecao):
-        # Cria uma janela de diálogo para inserir a quantidade de saída
-        janela_quantidade = tk.Toplevel(janela_selecao)
-        janela_quantidade.title("Quantidade de Saída")
-        janela_quantidade.geometry('300x200')
-        janela_quantidade.bind('<Return>', lambda event: self.confirmar_saida(produto_id, quantidade_saida_var.get(), janela_quantidade))
+            self.confirmar_selecao()
+        return 'break'
+
+    def confirmar_selecao(self):
+        selecionado = self.lista.curselection()
+        if selecionado:
+            self.ao_selecionar(self.sugestoes[selecionado[0]])
+        elif self.texto.get().strip():
+            messagebox.showinfo("Informação", "Nenhum produto encontrado.", parent=self)
+
+class DialogoRegistrarSaida(tk.Toplevel):
+    # Produto e quantidade na mesma janela: digitar parte do nome ou o ID, Enter na sugestão,
+    # quantidade e Enter de novo. A janela continua aberta para a próxima saída
+    def __init__(self, parent, estoque, app_parent):
+        super().__init__(parent)
+        self.estoque = estoque
+        self.parent = app_parent
+        self.title("Registrar Saída de Produto")
         self.bind('<Escape>', lambda event: self.destroy())
+        self.geometry('700x450')
+        centralizar_janela(self)
+        self.produto_selecionado = None
+        minha_fonte = font.Font(family='Helvetica', size=12)
 
-        tk.Label(janela_quantidade, text="Quantidade de saída:").grid(row=0, column=0)
-        quantidade_saida_var = tk.StringVar()
-        entrada_quantidade_saida = tk.Entry(janela_quantidade, textvariable=quantidade_saida_var)
-        entrada_quantidade_saida.grid(row=0, column=1)
-        entrada_quantidade_saida.focus_set() 
+        tk.Label(self, text="Digite o Nome ou ID do produto:").grid(row=0, column=0, columnspan=3, sticky=tk.W, padx=10, pady=(10, 0))
+        self.campo_busca = CampoBuscaProduto(self, app_parent, self.selecionar_produto, fonte=minha_fonte)
+        self.campo_busca.grid(row=1, column=0, columnspan=3, sticky='nsew', padx=10, pady=5)
 
-        # Vincula a tecla Enter ao método confirmar_saida
-        entrada_quantidade_saida.bind('<Return>', lambda event: self.confirmar_saida(produto_id, quantidade_saida_var.get(), janela_quantidade))
-        tk.Button(janela_quantidade, text="Confirmar", command=lambda: self.confirmar_saida(produto_id, quantidade_saida_var.get(), janela_quantidade)).grid(row=1, column=0, columnspan=2)
-    
-    def confirmar_saida(self, produto_id, quantidade_saida_str, janela_saida, event=None):
+        self.label_produto = tk.Label(self, text="Nenhum produto selecionado.", anchor=tk.W)
+        self.label_produto.grid(row=2, column=0, columnspan=3, sticky='ew', padx=10)
+
+        tk.Label(self, text="Quantidade de saída:").grid(row=3, column=0, sticky=tk.W, padx=10, pady=10)
+        self.quantidade_saida_var = tk.StringVar(value="1")
+        self.entrada_quantidade_saida = tk.Entry(self, textvariable=self.quantidade_saida_var, font=minha_fonte, width=10)
+        self.entrada_quantidade_saida.grid(row=3, column=1, sticky=tk.W)
+        self.entrada_quantidade_saida.bind('<Return>', self.confirmar_saida)
+        tk.Button(self, text="Confirmar", command=self.confirmar_saida).grid(row=3, column=2, padx=10)
+
+        # Confirmação da última saída, sem caixa de mensagem para não custar mais um Enter no balcão
+        self.label_status = tk.Label(self, text="", fg='green', anchor=tk.W)
+        self.label_status.grid(row=4, column=0, columnspan=3, sticky='ew', padx=10, pady=(0, 10))
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+        self.campo_busca.focus_set()
+
+    def selecionar_produto(self, produto):
+        self.produto_selecionado = produto
+        produto_id, nome, quantidade, preco_venda = produto
+        self.label_produto.config(text=f"Produto: {nome} (ID {produto_id}) - Em estoque: {quantidade} - {formatar_valor_para_exibicao(preco_venda)}")
+        self.entrada_quantidade_saida.focus_set()
+        self.entrada_quantidade_saida.select_range(0, tk.END)
+
+    def confirmar_saida(self, event=None):
+      if self.produto_selecionado is None:
+          messagebox.showinfo("Informação", "Por favor, selecione um produto.", parent=self)
+          self.campo_busca.focus_set()
+          return
       try:
         # Converte a string de quantidade para um inteiro
-        quantidade_saida = int(quantidade_saida_str)
+        quantidade_saida = int(self.quantidade_saida_var.get())
       except ValueError:
         # Se a conversão falhar, mostra uma mensagem de erro e retorna
-        messagebox.showerror("Erro", "Por favor, insira um número válido.", parent=janela_saida)
+        messagebox.showerror("Erro", "Por favor, insira um número válido.", parent=self)
         return
 
       if quantidade_saida > 0:
-          try:
-            self.estoque.registrar_saida(produto_id, quantidade_saida)
-            messagebox.showinfo("Sucesso", "Saída de produto registrada com sucesso!", parent=janela_saida)
-            janela_saida.destroy()
-            self.parent.atualizar_area_atualizacoes()
-          except ValueError as e:
-            messagebox.showerror("Erro", str(e), parent=janela_saida)
-          except Exception as e:
-            messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {e}", parent=janela_saida)
+          produto_id, nome = self.produto_selecionado[:2]
+          # A gravação roda no trabalhador do banco; a janela já fica pronta para a próxima saída
+          self.parent.no_banco('registrar_saida', produto_id, quantidade_saida,
+                               ao_concluir=lambda resultado: self.saida_registrada(quantidade_saida, nome),
+                               ao_falhar=lambda erro: self.erro_na_saida(erro, nome))
+          self.produto_selecionado = None
+          self.label_produto.config(text="Nenhum produto selecionado.")
+          self.quantidade_saida_var.set("1")
+          self.campo_busca.limpar()
+          self.campo_busca.focus_set()
       else:
-        messagebox.showerror("Erro", "A quantidade de saída deve ser maior que zero.", parent=janela_saida)
+        messagebox.showerror("Erro", "A quantidade de saída deve ser maior que zero.", parent=self)
+
+    def saida_registrada(self, quantidade_saida, nome):
+        if self.winfo_exists():
+            self.label_status.config(text=f"Saída registrada: {quantidade_saida} x {nome}", fg='green')
+        self.parent.atualizar_area_atualizacoes()
+
+    def erro_na_saida(self, erro, nome):
+        if self.winfo_exists():
+            self.label_status.config(text=f"Saída não registrada: {nome}", fg='red')
+        janela = self if self.winfo_exists() else self.parent.master
+        if isinstance(erro, ValueError):
+            messagebox.showerror("Erro", f"{nome}: {erro}", parent=janela)
+        else:
+            messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {erro}", parent=janela)
+
+class DialogoVenda(tk.Toplevel):
+    # Carrinho de uma venda: os itens são escolhidos pela busca e a venda inteira é gravada de uma vez no
+    # final, com registrar_venda. Itens sem estoque suficiente ficam em vermelho no carrinho
+    def __init__(self, parent, estoque, app_parent):
+        super().__init__(parent)
+        self.estoque = estoque
+        self.parent = app_parent
+        self.title("Nova Venda")
+        self.bind('<Escape>', lambda event: self.destroy())
+        self.geometry('800x600')
+        centralizar_janela(self)
+        # produto_id -> [nome, quantidade, preco_venda, quantidade_em_estoque]
+        self.carrinho = {}
+        self.produto_selecionado = None
+        minha_fonte = font.Font(family='Helvetica', size=12)
+
+        tk.Label(self, text="Digite o Nome ou ID do produto:").grid(row=0, column=0, columnspan=4, sticky=tk.W, padx=10, pady=(10, 0))
+        self.campo_busca = CampoBuscaProduto(self, app_parent, self.selecionar_produto, fonte=minha_fonte)
+        self.campo_busca.grid(row=1, column=0, columnspan=4, sticky='nsew', padx=10, pady=5)
+
+        self.label_produto = tk.Label(self, text="Nenhum produto selecionado.", anchor=tk.W)
+        self.label_produto.grid(row=2, column=0, columnspan=4, sticky='ew', padx=10)
+
+        tk.Label(self, text="Quantidade:").grid(row=3, column=0, sticky=tk.W, padx=10, pady=10)
+        self.quantidade_var = tk.StringVar(value="1")
+        self.entrada_quantidade = tk.Entry(self, textvariable=self.quantidade_var, font=minha_fonte, width=10)
+        self.entrada_quantidade.grid(row=3, column=1, sticky=tk.W)
+        self.entrada_quantidade.bind('<Return>', self.adicionar_ao_carrinho)
+        tk.Button(self, text="Adicionar ao carrinho", command=self.adicionar_ao_carrinho).grid(row=3, column=2, padx=10, sticky=tk.W)
+
+        colunas = ('produto', 'quantidade', 'preco', 'subtotal', 'estoque')
+        self.tabela_carrinho = ttk.Treeview(self, columns=colunas, show='headings', height=10)
+        for coluna, titulo, largura in (('produto', "Produto", 300), ('quantidade', "Qtd.", 60), ('preco', "Preço", 100),
+                                        ('subtotal', "Subtotal", 100), ('estoque', "Em estoque", 90)):
+            self.tabela_carrinho.heading(coluna, text=titulo)
+            self.tabela_carrinho.column(coluna, width=largura, anchor=tk.W if coluna == 'produto' else tk.CENTER)
+        self.tabela_carrinho.tag_configure('sem_estoque', foreground='red')
+        self.tabela_carrinho.grid(row=4, column=0, columnspan=4, sticky='nsew', padx=10)
+        self.tabela_carrinho.bind('<Delete>', lambda event: self.remover_item())
+
+        self.label_total = tk.Label(self, font=minha_fonte, anchor=tk.W)
+        self.label_total.grid(row=5, column=0, columnspan=2, sticky='ew', padx=10, pady=10)
+        tk.Button(self, text="Remover item", command=self.remover_item).grid(row=5, column=2, padx=5)
+        self.botao_finalizar = tk.Button(self, text="Finalizar venda", command=self.finalizar_venda)
+        self.botao_finalizar.grid(row=5, column=3, padx=10)
+
+        # Resultado da última venda, sem caixa de mensagem quando tudo deu certo
+        self.label_status = tk.Label(self, text="", fg='green', anchor=tk.W)
+        self.label_status.grid(row=6, column=0, columnspan=4, sticky='ew', padx=10, pady=(0, 10))
+
+        self.grid_rowconfigure(4, weight=1)
+        self.grid_columnconfigure(3, weight=1)
+        self.atualizar_total()
+        self.campo_busca.focus_set()
+
+    def selecionar_produto(self, produto):
+        self.produto_selecionado = produto
+        produto_id, nome, quantidade, preco_venda = produto
+        self.label_produto.config(text=f"Produto: {nome} (ID {produto_id}) - Em estoque: {quantidade} - {formatar_valor_para_exibicao(preco_venda)}")
+        self.entrada_quantidade.focus_set()
+        self.entrada_quantidade.select_range(0, tk.END)
+
+    def adicionar_ao_carrinho(self, event=None):
+        if self.produto_selecionado is None:
+            messagebox.showinfo("Informação", "Por favor, selecione um produto.", parent=self)
+            self.campo_busca.focus_set()
+            return
+        try:
+            quantidade = int(self.quantidade_var.get())
+            if quantidade <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Erro", "A quantidade deve ser um número inteiro maior que zero.", parent=self)
+            return
+
+        produto_id, nome, quantidade_em_estoque, preco_venda = self.produto_selecionado
+        # O mesmo produto escolhido de novo soma na linha que já está no carrinho
+        item = self.carrinho.setdefault(produto_id, [nome, 0, preco_venda, quantidade_em_estoque])
+        item[1] += quantidade
+        item[3] = quantidade_em_estoque
+        self.mostrar_item(produto_id)
+        self.atualizar_total()
+
+        self.produto_selecionado = None
+        self.label_produto.config(text="Nenhum produto selecionado.")
+        self.quantidade_var.set("1")
+        self.campo_busca.limpar()
+        self.campo_busca.focus_set()
+
+    def mostrar_item(self, produto_id):
+        nome, quantidade, preco_venda, quantidade_em_estoque = self.carrinho[produto_id]
+        valores = (nome, quantidade, formatar_valor_para_exibicao(preco_venda), formatar_valor_para_exibicao(quantidade * preco_venda),
+                   quantidade_em_estoque)
+        # A conferência que vale é a da gravação; esta só adianta o aviso com a quantidade vista na busca
+        tags = ('sem_estoque',) if quantidade > quantidade_em_estoque else ()
+        iid = str(produto_id)
+        if self.tabela_carrinho.exists(iid):
+            self.tabela_carrinho.item(iid, values=valores, tags=tags)
+        else:
+            self.tabela_carrinho.insert('', tk.END, iid=iid, values=valores, tags=tags)
+        self.tabela_carrinho.see(iid)
+
+    def remover_item(self):
+        for iid in self.tabela_carrinho.selection():
+            self.tabela_carrinho.delete(iid)
+            self.carrinho.pop(int(iid), None)
+        self.atualizar_total()
+
+    def atualizar_total(self):
+        total = sum(quantidade * preco_venda for _, quantidade, preco_venda, _ in self.carrinho.values())
+        self.label_total.config(text=f"Itens: {len(self.carrinho)}    Total: {formatar_valor_para_exibicao(total)}")
+
+    def finalizar_venda(self):
+        if not self.carrinho:
+            messagebox.showinfo("Informação", "O carrinho está vazio.", parent=self)
+            return
+        itens = [(produto_id, item[1]) for produto_id, item in self.carrinho.items()]
+        # Evita gravar a mesma venda duas vezes enquanto a primeira ainda está no trabalhador do banco
+        self.botao_finalizar.config(state=tk.DISABLED)
+        self.parent.no_banco('registrar_venda', itens, ao_concluir=self.venda_registrada, ao_falhar=self.erro_na_venda,
+                             descricao="Registrando a venda...")
+
+    def venda_registrada(self, venda_id):
+        if self.winfo_exists():
+            self.botao_finalizar.config(state=tk.NORMAL)
+            total = sum(quantidade * preco_venda for _, quantidade, preco_venda, _ in self.carrinho.values())
+            self.label_status.config(text=f"Venda nº {venda_id} registrada: {len(self.carrinho)} itens, {formatar_valor_para_exibicao(total)}", fg='green')
+            self.carrinho.clear()
+            self.tabela_carrinho.delete(*self.tabela_carrinho.get_children())
+            self.atualizar_total()
+            self.campo_busca.focus_set()
+        self.parent.atualizar_area_atualizacoes()
+
+    def erro_na_venda(self, erro):
+        if not self.winfo_exists():
+            messagebox.showerror("Erro", f"A venda não foi registrada: {erro}", parent=self.parent.master)
+            return
+        self.botao_finalizar.config(state=tk.NORMAL)
+        self.label_status.config(text="A venda não foi registrada.", fg='red')
+        if isinstance(erro, EstoqueInsuficiente):
+            # Marca os itens recusados com a quantidade em estoque no momento da gravação
+            for produto_id, _, _, quantidade_disponivel in erro.itens_sem_estoque:
+                if produto_id in self.carrinho:
+                    self.carrinho[produto_id][3] = quantidade_disponivel
+                    self.mostrar_item(produto_id)
+            linhas = "\n".join(f"- {nome}: pedido {pedida}, em estoque {disponivel}" for _, nome, pedida, disponivel in erro.itens_sem_estoque)
+            messagebox.showerror("Estoque insuficiente", f"Não há estoque suficiente para:\n{linhas}", parent=self)
+        elif isinstance(erro, ValueError):
+            messagebox.showerror("Erro", str(erro), parent=self)
+        else:
+            messagebox.showerror("Erro", f"Um erro inesperado ocorreu: {erro}", parent=self)
+
+class JanelaModoLeitor(tk.Toplevel):
+    # Caixa com leitor de código de barras (que funciona como teclado: digita o código e um Enter)
+    # Um único campo fica sempre com o foco; cada leitura entra no cupom na hora e as saídas são gravadas em
+    # lotes pelo trabalhador do banco, sem caixas de mensagem que roubem o foco no meio de uma sequência de
+    # leituras. "3*código" registra 3 unidades
+
+    # Intervalo máximo, em milissegundos, entre uma leitura e a gravação do lote dela
+    INTERVALO_LOTE_MS = 250
+    # Um lote com esta quantidade de leituras é enviado sem esperar o intervalo
+    TAMANHO_LOTE = 25
+    SITUACOES = {'aguardando': "Gravando...", 'registrada': "OK", 'sem_estoque': "Sem estoque",
+                 'desconhecido': "Código não cadastrado", 'invalida': "Leitura inválida", 'erro': "Erro ao gravar"}
+
+    def __init__(self, parent, app_parent):
+        super().__init__(parent)
+        self.parent = app_parent
+        self.title("Modo Leitor - Caixa")
+        self.geometry('800x600')
+        self.protocol('WM_DELETE_WINDOW', self.fechar)
+        self.bind('<Escape>', lambda event: self.fechar())
+        # Leituras que ainda não foram enviadas: (item do cupom, codigo_barras, quantidade)
+        self.lote = []
+        self.envio_agendado = None
+        self.itens = 0
+        self.total = 0
+        fonte_leitura = font.Font(family='Helvetica', size=16)
+
+        tk.Label(self, text="Passe os produtos no leitor:").grid(row=0, column=0, sticky=tk.W, padx=10, pady=(10, 0))
+        self.entrada_codigo = tk.Entry(self, font=fonte_leitura)
+        self.entrada_codigo.grid(row=1, column=0, columnspan=2, sticky='ew', padx=10, pady=5)
+        # Alguns leitores terminam a leitura com Tab em vez de Enter
+        for sequencia in ('<Return>', '<KP_Enter>', '<Tab>'):
+            self.entrada_codigo.bind(sequencia, self.ler_codigo)
+
+        colunas = ('codigo', 'produto', 'quantidade', 'preco', 'subtotal', 'situacao')
+        self.cupom = ttk.Treeview(self, columns=colunas, show='headings', takefocus=False)
+        for coluna, titulo, largura in (('codigo', "Código", 130), ('produto', "Produto", 250), ('quantidade', "Qtd.", 50),
+                                        ('preco', "Preço", 90), ('subtotal', "Subtotal", 90), ('situacao', "Situação", 150)):
+            self.cupom.heading(coluna, text=titulo)
+            self.cupom.column(coluna, width=largura, anchor=tk.W if coluna in ('codigo', 'produto') else tk.CENTER)
+        self.cupom.tag_configure('recusada', foreground='red')
+        self.cupom.grid(row=2, column=0, columnspan=2, sticky='nsew', padx=10)
+
+        self.label_total = tk.Label(self, font=fonte_leitura, anchor=tk.W)
+        self.label_total.grid(row=3, column=0, sticky='ew', padx=10, pady=10)
+        tk.Button(self, text="Nova venda", command=self.nova_venda).grid(row=3, column=1, padx=10)
+
+        self.grid_rowconfigure(2, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        # Um clique no cupom ou em outro lugar da janela devolve o foco ao campo do leitor
+        self.bind('<FocusIn>', self.manter_foco)
+        self.atualizar_total()
+        centralizar_janela(self)
+        self.entrada_codigo.focus_force()
+
+    def manter_foco(self, event):
+        if event.widget is not self.entrada_codigo:
+            self.entrada_codigo.focus_set()
+
+    def ler_codigo(self, event=None):
+        # Lê e limpa o campo de uma vez; as teclas da próxima leitura ficam na fila de eventos do Tk até aqui
+        texto = self.entrada_codigo.get().strip()
+        self.entrada_codigo.delete(0, tk.END)
+        if not texto:
+            return 'break'
+        quantidade, _, codigo_barras = texto.rpartition('*')
+        quantidade = quantidade.strip() or '1'
+        codigo_barras = codigo_barras.strip()
+        if not quantidade.isdigit() or int(quantidade) <= 0 or not codigo_barras:
+            self.acrescentar_ao_cupom(texto, '', '', 'invalida')
+            self.bell()
+            return 'break'
+        item = self.acrescentar_ao_cupom(codigo_barras, '', quantidade, 'aguardando')
+        self.lote.append((item, codigo_barras, int(quantidade)))
+        if len(self.lote) >= self.TAMANHO_LOTE:
+            self.enviar_lote()
+        elif self.envio_agendado is None:
+            self.envio_agendado = self.after(self.INTERVALO_LOTE_MS, self.enviar_lote)
+        return 'break'
+
+    def acrescentar_ao_cupom(self, codigo_barras, produto, quantidade, situacao):
+        item = self.cupom.insert('', tk.END, values=(codigo_barras, produto, quantidade, '', '', self.SITUACOES[situacao]),
+                                 tags=('recusada',) if situacao == 'invalida' else ())
+        self.cupom.see(item)
+        return item
+
+    def enviar_lote(self):
+        if self.envio_agendado is not None:
+            self.after_cancel(self.envio_agendado)
+            self.envio_agendado = None
+        if not self.lote:
+            return
+        lote, self.lote = self.lote, []
+        self.parent.no_banco('registrar_saidas_por_codigo', [(codigo_barras, quantidade) for _, codigo_barras, quantidade in lote],
+                             ao_concluir=lambda resultados: self.lote_gravado(lote, resultados),
+                             ao_falhar=lambda erro: self.lote_recusado(lote, erro),
+                             descricao="Registrando as saídas...")
+
+    def lote_gravado(self, lote, resultados):
+        if self.winfo_exists():
+            recusadas = 0
+            for (item, codigo_barras, quantidade), (situacao, produto) in zip(lote, resultados):
+                # O item pode ter saído do cupom com "Nova venda" antes de o lote ser gravado
+                if not self.cupom.exists(item):
+                    continue
+                nome = produto[1] if produto else ''
+                if situacao == 'registrada':
+                    subtotal = quantidade * produto[3]
+                    self.itens += quantidade
+                    self.total += subtotal
+                    self.cupom.item(item, values=(codigo_barras, nome, quantidade, formatar_valor_para_exibicao(produto[3]),
+                                                  formatar_valor_para_exibicao(subtotal), self.SITUACOES[situacao]))
+                else:
+                    recusadas += 1
+                    self.cupom.item(item, values=(codigo_barras, nome, quantidade, '', '', self.SITUACOES[situacao]), tags=('recusada',))
+            self.atualizar_total()
+            if recusadas:
+                self.bell()
+        self.parent.atualizar_area_atualizacoes()
+
+    def lote_recusado(self, lote, erro):
+        # A transação do lote foi desfeita: nenhuma das leituras dele foi gravada
+        if not self.winfo_exists():
+            messagebox.showerror("Erro", f"As últimas leituras do modo leitor não foram gravadas: {erro}")
+            return
+        for item, codigo_barras, quantidade in lote:
+            if self.cupom.exists(item):
+                self.cupom.item(item, values=(codigo_barras, '', quantidade, '', '', self.SITUACOES['erro']), tags=('recusada',))
+        self.label_total.config(text=f"Erro ao gravar: {erro}", fg='red')
+        self.bell()
+
+    def atualizar_total(self):
+        self.label_total.config(text=f"Itens: {self.itens}    Total: {formatar_valor_para_exibicao(self.total)}", fg='black')
+
+    def nova_venda(self):
+        self.enviar_lote()
+        self.cupom.delete(*self.cupom.get_children())
+        self.itens = 0
+        self.total = 0
+        self.atualizar_total()
+        self.entrada_codigo.focus_set()
+
+    def fechar(self):
+        # As leituras ainda não enviadas são gravadas mesmo com a janela fechada
+        self.enviar_lote()
+        self.destroy()
+
+class DialogoAlertaEstoque(tk.Toplevel):
+    # Escolhe o produto pelas sugestões da busca, sem carregar o catálogo inteiro, e define o limite de alerta
+    # dele ou, de uma vez, de todos os produtos que a busca digitada encontra
+    def __init__(self, parent, estoque, app_parent):
+        super().__init__(parent)
+        self.estoque = estoque
+        self.parent = app_parent
+        self.title("Configurar Alerta de Estoque por Produto")
+        self.geometry('600x420')
+        centralizar_janela(self)
+        self.grab_set()
+        self.bind('<Escape>', lambda event: self.destroy())
+        self.produto_selecionado = None
+
+        tk.Label(self, text="Digite o Nome ou ID do produto:").grid(row=0, column=0, columnspan=3, sticky=tk.W, padx=10, pady=(10, 0))
+        self.campo_busca = CampoBuscaProduto(self, app_parent, self.selecionar_produto)
+        self.campo_busca.grid(row=1, column=0, columnspan=3, sticky='nsew', padx=10, pady=5)
+
+        self.label_produto = tk.Label(self, text="Nenhum produto selecionado.", anchor=tk.W)
+        self.label_produto.grid(row=2, column=0, columnspan=3, sticky='ew', padx=10)
+
+        tk.Label(self, text="Defina a quantidade mínima:").grid(row=3, column=0, sticky=tk.W, padx=10, pady=10)
+        self.spinbox_valor = tk.Spinbox(self, from_=0, to=1000, increment=1, wrap=True, width=10)
+        self.spinbox_valor.grid(row=3, column=1, sticky=tk.W)
+        self.spinbox_valor.bind('<Return>', lambda event: self.salvar_limite_alerta())
+
+        frame_botoes = tk.Frame(self)
+        frame_botoes.grid(row=4, column=0, columnspan=3, pady=(0, 10))
+        tk.Button(frame_botoes, text="Salvar", command=self.salvar_limite_alerta).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_botoes, text="Aplicar a todos os produtos da busca", command=self.salvar_limite_alerta_da_busca).pack(side=tk.LEFT, padx=5)
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+        self.campo_busca.focus_set()
+
+    def selecionar_produto(self, produto):
+        self.produto_selecionado = produto
+        produto_id, nome, quantidade = produto[:3]
+        limite_atual = self.estoque.buscar_limite_alerta(produto_id)
+        texto_limite = f"Limite atual: {limite_atual}" if limite_atual is not None else "Sem limite definido"
+        self.label_produto.config(text=f"Produto: {nome} (ID {produto_id}) - Em estoque: {quantidade} - {texto_limite}")
+        self.spinbox_valor.delete(0, tk.END)
+        self.spinbox_valor.insert(0, limite_atual if limite_atual is not None else 0)
+        self.spinbox_valor.focus_set()
+
+    def ler_valor(self):
+        try:
+            valor = int(self.spinbox_valor.get())
+        except ValueError:
+            valor = -1
+        if valor < 0:
+            messagebox.showerror("Erro", "Por favor, insira um número válido.", parent=self)
+            return None
+        return valor
+
+    def salvar_limite_alerta(self):
+        if self.produto_selecionado is None:
+            messagebox.showinfo("Informação", "Por favor, selecione um produto.", parent=self)
+            self.campo_busca.focus_set()
+            return
+        valor = self.ler_valor()
+        if valor is None:
+            return
+        produto_id, nome_produto = self.produto_selecionado[:2]
+        self.parent.no_banco('definir_limite_alerta', produto_id, valor, ao_concluir=lambda resultado: self.limite_salvo(
+            f"Alerta de estoque baixo configurado para o produto {nome_produto} com o valor: {valor}"))
+
+    def limite_salvo(self, mensagem):
+        messagebox.showinfo("Sucesso", mensagem, parent=self if self.winfo_exists() else self.parent.master)
+        if self.winfo_exists():
+            self.destroy()
+        self.parent.atualizar_area_atualizacoes()
+
+    def salvar_limite_alerta_da_busca(self):
+        texto = self.campo_busca.texto.get().strip()
+        quantidade_produtos = self.estoque.contar_produtos_por_nome(texto)
+        if quantidade_produtos == 0:
+            messagebox.showinfo("Informação", "Digite parte do nome dos produtos que devem receber o alerta.", parent=self)
+            self.campo_busca.focus_set()
+            return
+        valor = self.ler_valor()
+        if valor is None:
+            return
+        if not messagebox.askyesno("Confirmar", f"Definir o limite de alerta {valor} para os {quantidade_produtos} produtos encontrados por \"{texto}\"?", parent=self):
+            return
+        self.parent.no_banco('definir_limite_alerta_por_nome', texto, valor, ao_concluir=lambda alterados: self.limite_salvo(
+            f"Alerta de estoque baixo configurado para {alterados} produtos com o valor: {valor}"))
+
+class JanelaHistoricoMovimentacoes(tk.Toplevel):
+    # Quantidade de movimentações carregadas por vez
+    TAMANHO_PAGINA = 200
+
+    def __init__(self, parent, estoque):
+        super().__init__(parent)
+        self.estoque = estoque
+        self.title("Histórico de Movimentações")
+        self.geometry('900x600')
+        self.bind('<Escape>', lambda event: self.destroy())
+
+        # Estado da paginação: chave (data_hora, id) da última linha carregada e filtros em uso
+        self.ultima_chave = None
+        self.fim_do_historico = False
+        self.pagina_agendada = False
+        self.filtros = {}
+
+        frame_filtros = tk.Frame(self)
+        frame_filtros.grid(row=0, column=0, columnspan=2, sticky='ew', padx=10, pady=10)
+
+        tk.Label(frame_filtros, text="Produto (nome ou ID):").grid(row=0, column=0)
+        self.entrada_produto = tk.Entry(frame_filtros)
+        self.entrada_produto.grid(row=0, column=1, padx=5)
+
+        tk.Label(frame_filtros, text="De (dd/mm/aaaa):").grid(row=0, column=2)
+        self.entrada_data_inicio = tk.Entry(frame_filtros, width=12)
+        self.entrada_data_inicio.grid(row=0, column=3, padx=5)
+
+        tk.Label(frame_filtros, text="Até (dd/mm/aaaa):").grid(row=0, column=4)
+        self.entrada_data_fim = tk.Entry(frame_filtros, width=12)
+        self.entrada_data_fim.grid(row=0, column=5, padx=5)
+
+        tk.Button(frame_filtros, text="Filtrar", command=self.aplicar_filtros).grid(row=0, column=6, padx=5)
+        self.incluir_arquivadas = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_filtros, text="Incluir movimentações arquivadas", variable=self.incluir_arquivadas,
+                       command=self.aplicar_filtros).grid(row=1, column=0, columnspan=4, sticky=tk.W)
+        for entrada in (self.entrada_produto, self.entrada_data_inicio, self.entrada_data_fim):
+            entrada.bind('<Return>', lambda event: self.aplicar_filtros())
+
+        colunas = ('data_hora', 'tipo', 'produto_id', 'nome', 'quantidade')
+        self.tabela = ttk.Treeview(self, columns=colunas, show='headings')
+        for coluna, titulo, largura in (('data_hora', "Data e Hora", 150), ('tipo', "Tipo", 80), ('produto_id', "ID", 60),
+                                        ('nome', "Nome", 400), ('quantidade', "Quantidade", 100)):
+            self.tabela.heading(coluna, text=titulo)
+            self.tabela.column(coluna, width=largura, anchor=tk.W if coluna == 'nome' else tk.CENTER)
+        self.tabela.tag_configure('saida', foreground='red')
+        self.tabela.tag_configure('entrada', foreground='green')
+        self.tabela.grid(row=1, column=0, sticky='nsew', padx=(10, 0), pady=(0, 10))
+
+        self.barra_rolagem = tk.Scrollbar(self, orient='vertical', command=self.tabela.yview)
+        self.barra_rolagem.grid(row=1, column=1, sticky='ns', padx=(0, 10), pady=(0, 10))
+        # A próxima página só é buscada quando a rolagem chega perto do fim da lista
+        self.tabela['yscrollcommand'] = self.ao_rolar
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        centralizar_janela(self)
+        self.entrada_produto.focus_set()
+        self.carregar_proxima_pagina()
+
+    def aplicar_filtros(self):
+        filtros = {}
+        produto = self.entrada_produto.get().strip()
+        if produto:
+            if produto.isdigit():
+                filtros['produto_id'] = int(produto)
+            else:
+                produto_id = self.estoque.buscar_id_produto_por_nome(produto)
+                if produto_id == "Produto não encontrado":
+                    encontrados = self.estoque.buscar_produtos_por_nome(produto)
+                    if len(encontrados) != 1:
+                        messagebox.showinfo("Informação", "Nenhum produto encontrado." if not encontrados else
+                                            "Mais de um produto encontrado, digite o nome completo ou o ID.", parent=self)
+                        return
+                    produto_id = encontrados[0][0]
+                filtros['produto_id'] = produto_id
+        try:
+            data_inicio = self.entrada_data_inicio.get().strip()
+            if data_inicio:
+                filtros['data_inicio'] = converter_data_para_banco(data_inicio)
+            data_fim = self.entrada_data_fim.get().strip()
+            if data_fim:
+                # A data final é inclusiva: vai até o início do dia seguinte
+                filtros['data_fim'] = converter_data_para_banco(data_fim, fim_do_dia=True)
+        except ValueError:
+            messagebox.showerror("Erro", "Por favor, insira as datas no formato dd/mm/aaaa.", parent=self)
+            return
+
+        if self.incluir_arquivadas.get():
+            filtros['incluir_arquivadas'] = True
+        self.filtros = filtros
+        self.ultima_chave = None
+        self.fim_do_historico = False
+        self.tabela.delete(*self.tabela.get_children())
+        self.carregar_proxima_pagina()
+
+    def carregar_proxima_pagina(self):
+        self.pagina_agendada = False
+        if self.fim_do_historico:
+            return
+        movimentacoes = self.estoque.buscar_pagina_movimentacoes(self.TAMANHO_PAGINA, self.ultima_chave, **self.filtros)
+        for mov_id, produto_id, nome_produto, tipo, quantidade, data_hora in movimentacoes:
+            tipo_movimentacao = "Saída" if tipo.lower() == "saida" else "Entrada"
+            data_hora_formatada = formatar_data_hora(data_hora)
+            self.tabela.insert('', tk.END, values=(data_hora_formatada, tipo_movimentacao, produto_id, nome_produto, quantidade),
+                               tags=('saida' if tipo_movimentacao == "Saída" else 'entrada',))
+        if len(movimentacoes) < self.TAMANHO_PAGINA:
+            self.fim_do_historico = True
+        if movimentacoes:
+            self.ultima_chave = (movimentacoes[-1][5], movimentacoes[-1][0])
+
+    def ao_rolar(self, inicio, fim):
+        self.barra_rolagem.set(inicio, fim)
+        # Carrega mais uma página quando faltam menos de 10% da lista para chegar ao fim
+        if float(fim) > 0.9 and not self.fim_do_historico and not self.pagina_agendada:
+            self.pagina_agendada = True
+            self.after_idle(self.carregar_proxima_pagina)
+
+class JanelaAnaliseVendas(tk.Toplevel):
+    # Período mostrado ao abrir a janela
+    DIAS_PADRAO = 30
+
+    def __init__(self, parent, estoque):
+        super().__init__(parent)
+        self.analise = AnaliseVendas(estoque)
+        self.title("Análise de Vendas")
+        self.geometry('1000x700')
+        self.bind('<Escape>', lambda event: self.destroy())
+        self.vendas_por_dia = []
+
+        frame_periodo = tk.Frame(self)
+        frame_periodo.grid(row=0, column=0, columnspan=2, sticky='ew', padx=10, pady=10)
+
+        hoje = datetime.date.today()
+        tk.Label(frame_periodo, text="De (dd/mm/aaaa):").grid(row=0, column=0)
+        self.entrada_data_inicio = tk.Entry(frame_periodo, width=12)
+        self.entrada_data_inicio.insert(0, (hoje - datetime.timedelta(days=self.DIAS_PADRAO - 1)).strftime('%d/%m/%Y'))
+        self.entrada_data_inicio.grid(row=0, column=1, padx=5)
+
+        tk.Label(frame_periodo, text="Até (dd/mm/aaaa):").grid(row=0, column=2)
+        self.entrada_data_fim = tk.Entry(frame_periodo, width=12)
+        self.entrada_data_fim.insert(0, hoje.strftime('%d/%m/%Y'))
+        self.entrada_data_fim.grid(row=0, column=3, padx=5)
+
+        tk.Label(frame_periodo, text="Mostrar:").grid(row=0, column=4, padx=(15, 0))
+        self.medida = ttk.Combobox(frame_periodo, values=("Receita", "Quantidade"), state='readonly', width=12)
+        self.medida.current(0)
+        self.medida.grid(row=0, column=5, padx=5)
+        self.medida.bind('<<ComboboxSelected>>', lambda event: self.atualizar())
+
+        tk.Button(frame_periodo, text="Atualizar", command=self.atualizar).grid(row=0, column=6, padx=5)
+        for entrada in (self.entrada_data_inicio, self.entrada_data_fim):
+            entrada.bind('<Return>', lambda event: self.atualizar())
+
+        # Gráfico de barras das vendas por dia; é redesenhado quando a janela muda de tamanho
+        self.grafico = tk.Canvas(self, bg='white', height=300, highlightthickness=0)
+        self.grafico.grid(row=1, column=0, columnspan=2, sticky='nsew', padx=10)
+        self.grafico.bind('<Configure>', lambda event: self.desenhar_grafico())
+
+        colunas = ('nome', 'quantidade', 'receita')
+        self.tabelas = {}
+        for coluna_grid, (chave, titulo) in enumerate((('mais', "Mais vendidos"), ('menos', "Produtos parados"))):
+            frame = tk.LabelFrame(self, text=titulo)
+            frame.grid(row=2, column=coluna_grid, sticky='nsew', padx=10, pady=10)
+            tabela = ttk.Treeview(frame, columns=colunas, show='headings', height=10)
+            for coluna, titulo_coluna, largura in (('nome', "Nome", 250), ('quantidade', "Vendido", 80), ('receita', "Receita", 100)):
+                tabela.heading(coluna, text=titulo_coluna)
+                tabela.column(coluna, width=largura, anchor=tk.W if coluna == 'nome' else tk.CENTER)
+            tabela.pack(fill=tk.BOTH, expand=True)
+            self.tabelas[chave] = tabela
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+
+        centralizar_janela(self)
+        self.atualizar()
+
+    def atualizar(self):
+        try:
+            # Os totais são por dia ('%Y-%m-%d'), com a data final inclusiva
+            data_inicio = converter_data_para_dia(self.entrada_data_inicio.get().strip())
+            data_fim = converter_data_para_dia(self.entrada_data_fim.get().strip(), fim_do_dia=True)
+        except ValueError:
+            messagebox.showerror("Erro", "Por favor, insira as datas no formato dd/mm/aaaa.", parent=self)
+            return
+        if data_inicio >= data_fim:
+            messagebox.showerror("Erro", "A data inicial deve ser anterior à data final.", parent=self)
+            return
+
+        self.periodo = (data_inicio, data_fim)
+        self.vendas_por_dia = self.analise.vendas_por_dia(data_inicio, data_fim)
+        self.desenhar_grafico()
+
+        ordenar_por = 'receita' if self.medida.get() == "Receita" else 'quantidade'
+        mais_vendidos = self.analise.mais_vendidos(data_inicio, data_fim, ordenar_por=ordenar_por)
+        menos_vendidos = self.analise.menos_vendidos(data_inicio, data_fim)
+        for chave, linhas in (('mais', mais_vendidos), ('menos', [linha[:4] for linha in menos_vendidos])):
+            tabela = self.tabelas[chave]
+            tabela.delete(*tabela.get_children())
+            for produto_id, nome, quantidade, receita in linhas:
+                tabela.insert('', tk.END, values=(nome, quantidade, formatar_valor_para_exibicao(receita)))
+
+    def desenhar_grafico(self):
+        self.grafico.delete('all')
+        if not self.vendas_por_dia:
+            self.grafico.create_text(self.grafico.winfo_width() // 2, self.grafico.winfo_height() // 2,
+                                     text="Nenhuma venda no período.", fill='gray')
+            return
+
+        # Uma barra por dia do período, inclusive os dias sem vendas
+        indice_valor = 2 if self.medida.get() == "Receita" else 1
+        valores_por_dia = {linha[0]: linha[indice_valor] for linha in self.vendas_por_dia}
+        inicio = datetime.date.fromisoformat(self.periodo[0])
+        total_dias = (datetime.date.fromisoformat(self.periodo[1]) - inicio).days
+        dias = [inicio + datetime.timedelta(days=i) for i in range(total_dias)]
+        maior_valor = max(valores_por_dia.values()) or 1
+
+        largura = self.grafico.winfo_width()
+        altura = self.grafico.winfo_height()
+        margem_esquerda, margem_inferior, margem_superior = 70, 25, 15
+        largura_barra = (largura - margem_esquerda - 10) / len(dias)
+        altura_util = altura - margem_inferior - margem_superior
+
+        self.grafico.create_line(margem_esquerda, margem_superior, margem_esquerda, altura - margem_inferior)
+        self.grafico.create_line(margem_esquerda, altura - margem_inferior, largura - 10, altura - margem_inferior)
+        texto_maior_valor = formatar_valor_para_exibicao(maior_valor) if indice_valor == 2 else str(maior_valor)
+        self.grafico.create_text(margem_esquerda - 5, margem_superior, text=texto_maior_valor, anchor=tk.E)
+
+        # Rótulos de data espaçados para não se sobreporem
+        intervalo_rotulos = max(1, int(60 // max(largura_barra, 1)))
+        for i, dia in enumerate(dias):
+            valor = valores_por_dia.get(str(dia), 0)
+            x0 = margem_esquerda + i * largura_barra + 1
+            x1 = x0 + max(largura_barra - 2, 1)
+            y0 = altura - margem_inferior - altura_util * valor / maior_valor
+            if valor:
+                self.grafico.create_rectangle(x0, y0, x1, altura - margem_inferior, fill='#005b4f', outline='')
+            if i % intervalo_rotulos == 0:
+                self.grafico.create_text((x0 + x1) / 2, altura - margem_inferior + 12, text=dia.strftime('%d/%m'))
+
+class JanelaDiagnostico(tk.Toplevel):
+    # Mostra o que a instrumentação mediu: as consultas SQL que mais tomaram tempo e o histograma de cada operação
+    def __init__(self, parent, instrumentacao_ativa):
+        super().__init__(parent)
+        self.title("Diagnóstico de desempenho")
+        self.geometry('1100x650')
+        self.bind('<Escape>', lambda event: self.destroy())
+        self.instrumentacao_ativa = instrumentacao_ativa
+
+        frame_controles = tk.Frame(self)
+        frame_controles.grid(row=0, column=0, sticky='ew', padx=10, pady=10)
+        # A mesma variável do menu Diagnóstico, para as duas marcações ficarem iguais
+        tk.Checkbutton(frame_controles, text="Medir desempenho", variable=self.instrumentacao_ativa,
+                       command=lambda: instrumentacao.ativar(self.instrumentacao_ativa.get())).pack(side=tk.LEFT)
+        tk.Button(frame_controles, text="Atualizar", command=self.atualizar).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_controles, text="Zerar", command=self.zerar).pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_controles, text=f"Operações acima de {instrumentacao.limite_lento_ms} ms são gravadas em {instrumentacao.caminho_log()}",
+                 fg='gray').pack(side=tk.LEFT, padx=15)
+
+        frame_consultas = tk.LabelFrame(self, text="Consultas mais lentas (tempo total)")
+        frame_consultas.grid(row=1, column=0, sticky='nsew', padx=10, pady=5)
+        colunas = ('execucoes', 'total', 'media', 'maximo', 'sql')
+        self.tabela_consultas = ttk.Treeview(frame_consultas, columns=colunas, show='headings', height=10)
+        for coluna, titulo, largura in (('execucoes', "Execuções", 80), ('total', "Total (ms)", 90), ('media', "Média (ms)", 90),
+                                        ('maximo', "Máximo (ms)", 90), ('sql', "Consulta", 700)):
+            self.tabela_consultas.heading(coluna, text=titulo)
+            self.tabela_consultas.column(coluna, width=largura, anchor=tk.W if coluna == 'sql' else tk.CENTER, stretch=coluna == 'sql')
+        self.tabela_consultas.pack(fill=tk.BOTH, expand=True)
+
+        frame_operacoes = tk.LabelFrame(self, text="Operações (quantidade de chamadas por faixa de tempo)")
+        frame_operacoes.grid(row=2, column=0, sticky='nsew', padx=10, pady=(5, 10))
+        faixas = [f"< {limite} ms" for limite in FAIXAS_HISTOGRAMA_MS] + [f">= {FAIXAS_HISTOGRAMA_MS[-1]} ms"]
+        colunas = ('operacao', 'chamadas', 'media', 'maximo') + tuple(f"faixa_{i}" for i in range(len(faixas)))
+        self.tabela_operacoes = ttk.Treeview(frame_operacoes, columns=colunas, show='headings', height=10)
+        for coluna, titulo, largura in (('operacao', "Operação", 260), ('chamadas', "Chamadas", 70), ('media', "Média (ms)", 80),
+                                        ('maximo', "Máximo (ms)", 80)):
+            self.tabela_operacoes.heading(coluna, text=titulo)
+            self.tabela_operacoes.column(coluna, width=largura, anchor=tk.W if coluna == 'operacao' else tk.CENTER, stretch=coluna == 'operacao')
+        for i, titulo in enumerate(faixas):
+            self.tabela_operacoes.heading(f"faixa_{i}", text=titulo)
+            self.tabela_operacoes.column(f"faixa_{i}", width=65, anchor=tk.CENTER, stretch=False)
+        self.tabela_operacoes.pack(fill=tk.BOTH, expand=True)
+
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        centralizar_janela(self)
+        self.atualizar()
+
+    def atualizar(self):
+        self.tabela_consultas.delete(*self.tabela_consultas.get_children())
+        for sql, execucoes, total_ms, media_ms, max_ms in instrumentacao.consultas_mais_lentas():
+            self.tabela_consultas.insert('', tk.END, values=(execucoes, f"{total_ms:.1f}", f"{media_ms:.2f}", f"{max_ms:.1f}", sql))
+        self.tabela_operacoes.delete(*self.tabela_operacoes.get_children())
+        for nome, chamadas, media_ms, max_ms, faixas in instrumentacao.resumo_operacoes():
+            self.tabela_operacoes.insert('', tk.END, values=(nome, chamadas, f"{media_ms:.2f}", f"{max_ms:.1f}", *faixas))
+
+    def zerar(self):
+        instrumentacao.zerar()
+        self.atualizar()
+
+def importar_produtos_pela_linha_de_comando(caminho_csv):
+    estoque = Estoque()
+    try:
+        importados, rejeitados = estoque.importar_produtos_csv(
+            caminho_csv, ao_progredir=lambda fracao_lida, importados, quantidade_rejeitados: print(f"{fracao_lida:.0%} - {importados} linhas importadas"))
+    finally:
+        estoque.fechar()
+    for numero_linha, motivo in rejeitados:
+        print(f"Linha {numero_linha} rejeitada: {motivo}")
+    print(f"Importação concluída: {importados} linhas importadas, {len(rejeitados)} rejeitadas.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerenciador de Estoque")
+    parser.add_argument('--importar-csv', metavar='ARQUIVO', help="importa produtos e estoque inicial de um arquivo CSV e sai")
+    parser.add_argument('--diagnostico', action='store_true', help="abre com a medição de desempenho ligada (menu Diagnóstico)")
+    parser.add_argument('--servidor', action='store_true', help="atende os caixas da rede local pela API JSON, sem interface gráfica")
+    parser.add_argument('--host', default='0.0.0.0', help="endereço em que o servidor atende (padrão: todas as interfaces)")
+    parser.add_argument('--porta', type=int, default=PORTA_SERVIDOR, help=f"porta do servidor (padrão: {PORTA_SERVIDOR})")
+    parser.add_argument('--cliente', metavar='URL', help=f"usa o estoque de um servidor (ex.: http://192.168.0.10:{PORTA_SERVIDOR}) em vez do banco local")
+    argumentos = parser.parse_args()
+    instrumentacao.ativar(argumentos.diagnostico)
+
+    if argumentos.importar_csv:
+        importar_produtos_pela_linha_de_comando(argumentos.importar_csv)
+        sys.exit()
+    if argumentos.servidor:
+        executar_servidor(argumentos.host, argumentos.porta)
+        sys.exit()
+
+    tela_boas_vindas()
     janela = tk.Tk()
-    app = Aplicativo(janela)
+    app = Aplicativo(janela, argumentos.cliente)
     janela.mainloop()
\ No newline at end of file
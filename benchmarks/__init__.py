@@ -0,0 +1,19 @@
+# Copyright (c) 2023, Paulo Ricardo de Souza Feitosa
+# Licensed under the MIT License.
+
+# Benchmarks do Aplicativo de Estoque; rodam sem interface gráfica, a partir da pasta do projeto
+#
+#   python -m benchmarks.gerar_dados estoque_benchmark.db --tamanho pequeno
+#   python -m benchmarks.executar --tamanho pequeno --saida resultados.json
+#   python -m benchmarks.executar --tamanho pequeno --comparar resultados.json
+#   python -m benchmarks.benchmark_transacoes [quantidade_de_saidas]
+#   python -m benchmarks.benchmark_servidor [caixas] [requisicoes_por_caixa]
+
+import importlib.util
+from pathlib import Path
+
+# O aplicativo é um único arquivo com hífens no nome, então é carregado pelo caminho
+caminho_aplicativo = Path(__file__).resolve().parent.parent / 'Aplicativo-de-estoque.py'
+especificacao = importlib.util.spec_from_file_location('aplicativo_de_estoque', caminho_aplicativo)
+aplicativo = importlib.util.module_from_spec(especificacao)
+especificacao.loader.exec_module(aplicativo)
@@ -0,0 +1,88 @@
+# Copyright (c) 2023, Paulo Ricardo de Souza Feitosa
+# Licensed under the MIT License.
+
+# Mede a vazão do servidor de estoque (--servidor) com vários caixas ao mesmo tempo pela rede local (aqui,
+# localhost): cada caixa faz sugestões de busca, consulta produtos e registra saídas pelo código de barras
+#
+# Uso: python -m benchmarks.benchmark_servidor [caixas] [requisicoes_por_caixa]
+
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import aplicativo
+
+QUANTIDADE_PRODUTOS = 200
+
+def preparar_banco(caminho_banco):
+    estoque = aplicativo.Estoque(caminho_banco)
+    with estoque.transacao():
+        for i in range(1, QUANTIDADE_PRODUTOS + 1):
+            estoque.adicionar_ou_atualizar_produto(f"Produto de teste {i}", 1000000, 100, "", f"{i:013d}")
+    estoque.fechar()
+
+def iniciar_servidor(caminho_banco):
+    # Roda o servidor em outra thread, com o seu próprio loop; retorna (servidor, parar)
+    pronto = threading.Event()
+    estado = {}
+
+    async def servir():
+        servidor = aplicativo.ServidorEstoque(caminho_banco, '127.0.0.1', 0)
+        await servidor.iniciar()
+        estado['servidor'], estado['parar'] = servidor, asyncio.Event()
+        estado['loop'] = asyncio.get_running_loop()
+        pronto.set()
+        await estado['parar'].wait()
+        await servidor.fechar()
+
+    thread = threading.Thread(target=asyncio.run, args=(servir(),))
+    thread.start()
+    pronto.wait()
+
+    def parar():
+        estado['loop'].call_soon_threadsafe(estado['parar'].set)
+        thread.join()
+    return estado['servidor'], parar
+
+def caixa(url, numero, requisicoes):
+    # Retorna o tempo de cada requisição, em milissegundos
+    estoque = aplicativo.EstoqueRemoto(url)
+    tempos = []
+    try:
+        for i in range(requisicoes):
+            produto_id = (numero * requisicoes + i) % QUANTIDADE_PRODUTOS + 1
+            inicio = time.perf_counter()
+            if i % 3 == 0:
+                estoque.sugerir_produtos(f"produto {produto_id}")
+            elif i % 3 == 1:
+                estoque.buscar_produto_por_id(produto_id)
+            else:
+                estoque.registrar_saidas_por_codigo([(f"{produto_id:013d}", 1)])
+            tempos.append((time.perf_counter() - inicio) * 1000)
+    finally:
+        estoque.fechar()
+    return tempos
+
+if __name__ == "__main__":
+    caixas = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    requisicoes = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho_banco = Path(diretorio) / 'estoque_benchmark.db'
+        preparar_banco(caminho_banco)
+        servidor, parar = iniciar_servidor(caminho_banco)
+        url = f"http://127.0.0.1:{servidor.porta}"
+        try:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=caixas) as executor:
+                tempos = sorted(tempo for tempos_caixa in executor.map(caixa, [url] * caixas, range(caixas), [requisicoes] * caixas)
+                                for tempo in tempos_caixa)
+            duracao = time.perf_counter() - inicio
+        finally:
+            parar()
+    print(f"{caixas} caixas, {len(tempos)} requisições: {len(tempos) / duracao:,.0f} requisições/s")
+    print(f"Tempo por requisição: mediana {tempos[len(tempos) // 2]:.2f} ms, p99 {tempos[int(len(tempos) * 0.99)]:.2f} ms, "
+          f"máximo {tempos[-1]:.2f} ms")
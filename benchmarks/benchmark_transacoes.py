@@ -0,0 +1,78 @@
+# Copyright (c) 2023, Paulo Ricardo de Souza Feitosa
+# Licensed under the MIT License.
+
+# Compara a vazão de saídas de estoque com dois commits por operação (como era antes)
+# e com um único commit por operação usando Estoque.transacao(), com os mesmos comandos nos dois casos;
+# o registrar_saida atual, que faz mais trabalho por saída, aparece como referência
+# O ganho vem de um fsync a menos por saída, então a comparação roda com PRAGMA synchronous = FULL (um fsync
+# por commit) e com NORMAL, o padrão do aplicativo no modo WAL, em que o commit não espera o fsync e a
+# diferença quase some
+#
+# Uso: python -m benchmarks.benchmark_transacoes [quantidade_de_saidas]
+
+import sys
+import time
+import statistics
+import tempfile
+from pathlib import Path
+
+from benchmarks import aplicativo
+
+def saida_com_dois_commits(estoque, produto_id, quantidade_saida):
+    # Reproduz o registrar_saida antigo: um commit depois do UPDATE e outro depois do INSERT
+    estoque.cursor.execute("UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade - ? >= 0",
+                           (quantidade_saida, produto_id, quantidade_saida))
+    estoque.conexao.commit()
+    data_hora_atual = int(time.time())
+    estoque.cursor.execute("INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora) VALUES (?, 'saida', ?, ?)",
+                           (produto_id, quantidade_saida, data_hora_atual))
+    estoque.conexao.commit()
+
+def saida_com_um_commit(estoque, produto_id, quantidade_saida):
+    # Os mesmos comandos de saida_com_dois_commits, em uma única transação
+    with estoque.transacao():
+        estoque.cursor.execute("UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade - ? >= 0",
+                               (quantidade_saida, produto_id, quantidade_saida))
+        data_hora_atual = int(time.time())
+        estoque.cursor.execute("INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora) VALUES (?, 'saida', ?, ?)",
+                               (produto_id, quantidade_saida, data_hora_atual))
+
+# Cada variante roda várias vezes, alternando com as outras, e vale a mediana: em uma máquina com o disco
+# compartilhado, uma rodada só varia demais
+RODADAS = 5
+
+def medir_rodada(funcao, quantidade_de_saidas, sincronizacao):
+    with tempfile.TemporaryDirectory() as diretorio:
+        estoque = aplicativo.Estoque(Path(diretorio) / 'estoque_benchmark.db')
+        estoque.conexao.execute(f"PRAGMA synchronous = {sincronizacao}")
+        estoque.adicionar_ou_atualizar_produto("Produto de teste", quantidade_de_saidas, 100, "")
+        produto_id = estoque.buscar_id_produto_por_nome("Produto de teste")
+        inicio = time.perf_counter()
+        for _ in range(quantidade_de_saidas):
+            funcao(estoque, produto_id, 1)
+        duracao = time.perf_counter() - inicio
+        estoque.fechar()
+    return quantidade_de_saidas / duracao
+
+def medir(variantes, quantidade_de_saidas, sincronizacao):
+    # Retorna a mediana de saídas por segundo de cada variante, pelo nome
+    vazoes = {nome: [] for nome in variantes}
+    for _ in range(RODADAS):
+        for nome, funcao in variantes.items():
+            vazoes[nome].append(medir_rodada(funcao, quantidade_de_saidas, sincronizacao))
+    medianas = {nome: statistics.median(valores) for nome, valores in vazoes.items()}
+    for nome, vazao in medianas.items():
+        print(f"  {nome:<22}: {vazao:,.0f} saídas/s ({1000 / vazao:.3f} ms por saída)")
+    return medianas
+
+if __name__ == "__main__":
+    quantidade_de_saidas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    variantes = {
+        "Dois commits por saída": saida_com_dois_commits,
+        "Um commit por saída": saida_com_um_commit,
+        "registrar_saida": lambda estoque, produto_id, quantidade: estoque.registrar_saida(produto_id, quantidade),
+    }
+    for sincronizacao in ('FULL', 'NORMAL'):
+        print(f"PRAGMA synchronous = {sincronizacao}")
+        medianas = medir(variantes, quantidade_de_saidas, sincronizacao)
+        print(f"  Ganho: {medianas['Um commit por saída'] / medianas['Dois commits por saída']:.2f}x")
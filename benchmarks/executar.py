@@ -0,0 +1,336 @@
+# Copyright (c) 2023, Paulo Ricardo de Souza Feitosa
+# Licensed under the MIT License.
+
+# Mede os métodos do Estoque, a montagem da área de atualizações e os caminhos de pesquisa sobre um banco
+# sintético e grava os tempos em JSON, para comparar versões do aplicativo
+# O banco gerado fica guardado em benchmarks/dados e cada execução trabalha em uma cópia dele, porque
+# parte dos benchmarks grava no banco
+#
+# Uso: python -m benchmarks.executar [--tamanho pequeno|medio|grande] [--produtos N] [--movimentacoes N]
+#                                    [--banco ARQUIVO.db] [--repeticoes N] [--filtro TEXTO]
+#                                    [--saida resultados.json] [--comparar anteriores.json] [--tolerancia 0.2]
+#                                    [--diferenca-minima 0.05]
+# Com --comparar, sai com código 1 se alguma medição ficou mais lenta que o aceito
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+from benchmarks import aplicativo
+from benchmarks.gerar_dados import TAMANHOS, gerar_banco
+
+DIRETORIO_DADOS = Path(__file__).resolve().parent / 'dados'
+
+# Consultas que trazem todas as movimentações de uma vez só são medidas até este tamanho; acima dele
+# ficam marcadas como puladas no JSON em vez de esgotar a memória
+LIMITE_CONSULTA_COMPLETA = 1000000
+
+def medir(funcao, repeticoes, preparar=None):
+    # Executa funcao(*preparar()) 'repeticoes' vezes; só a chamada de funcao entra no tempo
+    # Retorna os tempos em milissegundos
+    tempos = []
+    for _ in range(repeticoes):
+        argumentos = preparar() if preparar else ()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+def resumir(tempos):
+    tempos_ordenados = sorted(tempos)
+    return {
+        'repeticoes': len(tempos),
+        'min_ms': round(tempos_ordenados[0], 4),
+        'mediana_ms': round(statistics.median(tempos_ordenados), 4),
+        'media_ms': round(statistics.fmean(tempos_ordenados), 4),
+        'p95_ms': round(tempos_ordenados[min(len(tempos_ordenados) - 1, int(len(tempos_ordenados) * 0.95))], 4),
+        'max_ms': round(tempos_ordenados[-1], 4),
+    }
+
+def consumir(iteravel):
+    for _ in iteravel:
+        pass
+
+def montar_casos(estoque, diretorio_temporario, repeticoes):
+    # Lista de (nome, funcao, repeticoes, preparar); os nomes são as chaves do JSON e não devem mudar entre versões
+    # Um caso com funcao None é registrado como pulado, com o motivo em preparar
+    leitura = estoque.conexao_leitura
+    quantidade_produtos = leitura.execute("SELECT COUNT(*) FROM produtos").fetchone()[0]
+    quantidade_movimentacoes = leitura.execute("SELECT COUNT(*) FROM movimentacoes").fetchone()[0]
+    ultimo_id_movimentacao = leitura.execute("SELECT COALESCE(MAX(id), 0) FROM movimentacoes").fetchone()[0]
+    produto_id, nome_produto = leitura.execute("SELECT id, nome FROM produtos ORDER BY id LIMIT 1").fetchone()
+    produto_id_final = leitura.execute("SELECT MAX(id) FROM produtos").fetchone()[0]
+    palavra_comum = nome_produto.split()[0]
+    chave_meio = leitura.execute("SELECT data_hora, id FROM movimentacoes ORDER BY data_hora DESC, id DESC LIMIT 1 OFFSET ?",
+                                 (quantidade_movimentacoes // 2,)).fetchone()
+    muitas_movimentacoes = quantidade_movimentacoes > LIMITE_CONSULTA_COMPLETA
+    motivo_pulo = f"mais de {LIMITE_CONSULTA_COMPLETA:,} movimentações"
+
+    hoje = datetime.date.today()
+    ontem = str(hoje - datetime.timedelta(days=1))
+    amanha = str(hoje + datetime.timedelta(days=1))
+    ha_30_dias = str(hoje - datetime.timedelta(days=30))
+    ha_um_ano = str(hoje - datetime.timedelta(days=365))
+    # Limites de data_hora (segundos desde 1970) à meia-noite no fuso local
+    inicio_30_dias = int(datetime.datetime.combine(hoje - datetime.timedelta(days=30), datetime.time()).timestamp())
+    inicio_um_ano = int(datetime.datetime.combine(hoje - datetime.timedelta(days=365), datetime.time()).timestamp())
+    fim_hoje = int(datetime.datetime.combine(hoje + datetime.timedelta(days=1), datetime.time()).timestamp())
+    analise = aplicativo.AnaliseVendas(estoque)
+
+    # Produtos com estoque de sobra para as saídas medidas, com códigos de barras de uso interno (prefixo 2),
+    # que não colidem com os do banco gerado
+    codigos_benchmark = [f"2{i:012d}" for i in range(15)]
+    estoque.adicionar_ou_atualizar_produto("Produto do benchmark", 10 ** 9, 990, "", codigos_benchmark[0])
+    for i, codigo_barras in enumerate(codigos_benchmark[1:], 1):
+        estoque.adicionar_ou_atualizar_produto(f"Produto do benchmark {i}", 10 ** 9, 990 + i * 100, "", codigo_barras)
+    produto_benchmark = estoque.buscar_id_produto_por_nome("Produto do benchmark")
+    # Uma venda de 15 linhas, uma por produto do benchmark; a venda gravada aqui é a lida pelo histórico
+    itens_venda = [(estoque.buscar_produto_por_codigo_barras(codigo_barras)[0], i % 3 + 1)
+                   for i, codigo_barras in enumerate(codigos_benchmark)]
+    venda_id = estoque.registrar_venda(itens_venda)
+    novos_produtos = iter(range(10 ** 9))
+    # Um lote do modo leitor, como a janela envia: TAMANHO_LOTE leituras alternando entre os produtos
+    leituras_lote = [(codigos_benchmark[i % len(codigos_benchmark)], 1)
+                     for i in range(aplicativo.JanelaModoLeitor.TAMANHO_LOTE)]
+    # Bancos gerados antes dos códigos de barras não os têm; nesse caso a busca usa o do produto do benchmark
+    codigo_produto = leitura.execute("SELECT codigo_barras FROM produtos WHERE id = ?", (produto_id,)).fetchone()[0]
+    codigo_produto = codigo_produto or codigos_benchmark[0]
+
+    def produto_para_apagar():
+        estoque.adicionar_ou_atualizar_produto(f"Produto a apagar {next(novos_produtos)}", 1, 100, "")
+        return (estoque.cursor.execute("SELECT MAX(id) FROM produtos").fetchone()[0],)
+
+    caminho_csv = Path(diretorio_temporario) / 'importacao.csv'
+    with open(caminho_csv, 'w', encoding='utf-8', newline='') as arquivo:
+        arquivo.write("nome;quantidade;preco_venda\n")
+        for i in range(1000):
+            arquivo.write(f"Produto importado {i};{i % 50 + 1};{i % 90 + 1},90\n")
+
+    def sem_cache(*argumentos):
+        # Esvazia o cache do catálogo antes da chamada, para medir a consulta ao banco
+        def preparar():
+            estoque.invalidar_catalogo()
+            return argumentos
+        return preparar
+
+    def feed_completo():
+        alertas, movimentacoes = estoque.buscar_feed_atualizacoes(0)
+        aplicativo.montar_linhas_feed(alertas, movimentacoes)
+
+    def feed_inicial():
+        # O que a área de atualizações busca ao abrir: só as movimentações mais recentes
+        alertas, movimentacoes = estoque.buscar_feed_atualizacoes(0, aplicativo.Aplicativo.LIMITE_FEED)
+        aplicativo.montar_linhas_feed(alertas, movimentacoes)
+
+    def feed_incremental():
+        alertas, movimentacoes = estoque.buscar_feed_atualizacoes(max(ultimo_id_movimentacao - 20, 0))
+        aplicativo.montar_linhas_feed(alertas, movimentacoes)
+
+    r = repeticoes
+    poucas = max(3, repeticoes // 10)
+    casos = [
+        # Pesquisa
+        ('pesquisa.consultar_produto.palavra_comum', estoque.consultar_produto, r, lambda: (palavra_comum,)),
+        ('pesquisa.consultar_produto.nome_completo', estoque.consultar_produto, r, lambda: (nome_produto,)),
+        ('pesquisa.pesquisar_produtos.por_id', aplicativo.pesquisar_produtos, r, lambda: (estoque, str(produto_id))),
+        ('pesquisa.buscar_produtos_por_nome', estoque.buscar_produtos_por_nome, r, lambda: (palavra_comum,)),
+        ('pesquisa.sugerir_produtos.uma_letra', estoque.sugerir_produtos, r, lambda: (palavra_comum[0],)),
+        ('pesquisa.sugerir_produtos.palavra', estoque.sugerir_produtos, r, lambda: (palavra_comum[:4],)),
+        ('pesquisa.sugerir_produtos.id', estoque.sugerir_produtos, r, lambda: (str(produto_id_final),)),
+        ('pesquisa.contar_produtos_por_nome', estoque.contar_produtos_por_nome, r, lambda: (palavra_comum,)),
+        ('pesquisa.buscar_todos_os_produtos', estoque.buscar_todos_os_produtos, poucas, None),
+
+        # Buscas pontuais, com e sem o cache do catálogo
+        ('catalogo.buscar_produto_por_id.sem_cache', estoque.buscar_produto_por_id, r, sem_cache(produto_id)),
+        ('catalogo.buscar_produto_por_id.com_cache', estoque.buscar_produto_por_id, r, lambda: (produto_id,)),
+        ('catalogo.buscar_nome_produto_por_id.sem_cache', estoque.buscar_nome_produto_por_id, r, sem_cache(produto_id)),
+        ('catalogo.buscar_id_produto_por_nome.sem_cache', estoque.buscar_id_produto_por_nome, r, sem_cache(nome_produto)),
+        ('catalogo.buscar_id_produto_por_nome.com_cache', estoque.buscar_id_produto_por_nome, r, lambda: (nome_produto,)),
+        ('catalogo.buscar_produto_por_codigo_barras.sem_cache', estoque.buscar_produto_por_codigo_barras, r,
+         sem_cache(codigo_produto)),
+        ('catalogo.buscar_produto_por_codigo_barras.com_cache', estoque.buscar_produto_por_codigo_barras, r,
+         lambda: (codigo_produto,)),
+        ('catalogo.buscar_quantidade_atual_por_id.sem_cache', estoque.buscar_quantidade_atual_por_id, r, sem_cache(produto_id)),
+        ('catalogo.buscar_limite_alerta', estoque.buscar_limite_alerta, r, lambda: (produto_id,)),
+        ('catalogo.obter_configuracao', estoque.obter_configuracao, r, lambda: ('horizonte_compactacao_dias', 365)),
+
+        # Área de atualizações (consulta + montagem dos textos, sem o Tk) e alertas
+        ('feed.completo', None if muitas_movimentacoes else feed_completo, poucas, motivo_pulo if muitas_movimentacoes else None),
+        ('feed.inicial', feed_inicial, r, None),
+        ('feed.incremental', feed_incremental, r, None),
+        ('alertas.buscar_alertas_estoque_baixo', estoque.buscar_alertas_estoque_baixo, r, None),
+        ('alertas.contar_alertas_estoque_baixo', estoque.contar_alertas_estoque_baixo, r, None),
+
+        # Histórico
+        ('historico.buscar_pagina_movimentacoes.primeira', estoque.buscar_pagina_movimentacoes, r, None),
+        ('historico.buscar_pagina_movimentacoes.meio', estoque.buscar_pagina_movimentacoes, r, lambda: (200, chave_meio)),
+        ('historico.buscar_pagina_movimentacoes.produto', estoque.buscar_pagina_movimentacoes, r,
+         lambda: (200, None, produto_id)),
+        ('historico.buscar_pagina_movimentacoes.periodo', estoque.buscar_pagina_movimentacoes, r,
+         lambda: (200, None, None, inicio_30_dias, fim_hoje)),
+        ('historico.buscar_resumo_diario_movimentacoes', estoque.buscar_resumo_diario_movimentacoes, r,
+         lambda: (produto_id, ha_um_ano, amanha)),
+        ('historico.buscar_venda.15_itens', estoque.buscar_venda, r, lambda: (venda_id,)),
+        ('historico.quantidade_em.um_ano', estoque.quantidade_em, r, lambda: (produto_id, inicio_um_ano)),
+        ('historico.estoque_em.um_ano', estoque.estoque_em, poucas, lambda: (inicio_um_ano,)),
+
+        # Análise de vendas
+        ('vendas.vendas_por_dia.loja_um_ano', analise.vendas_por_dia, r, lambda: (ha_um_ano, amanha)),
+        ('vendas.vendas_por_dia.produto_um_ano', analise.vendas_por_dia, r, lambda: (ha_um_ano, amanha, produto_id)),
+        ('vendas.vendas_por_produto.um_ano', analise.vendas_por_produto, r, lambda: (ha_um_ano, amanha, produto_id)),
+        ('vendas.mais_vendidos.um_ano', analise.mais_vendidos, poucas, lambda: (ha_um_ano, amanha)),
+        ('vendas.menos_vendidos.um_ano', analise.menos_vendidos, poucas, lambda: (ha_um_ano, amanha)),
+        ('vendas.mais_vendidos.ontem', analise.mais_vendidos, r, lambda: (ontem, str(hoje))),
+
+        # Relatórios
+        ('relatorios.iterar_relatorio.valorizacao', lambda: consumir(estoque.iterar_relatorio('valorizacao')), poucas, None),
+        ('relatorios.iterar_relatorio.movimentacoes_30_dias',
+         lambda: consumir(estoque.iterar_relatorio('movimentacoes', inicio_30_dias, fim_hoje)), poucas, None),
+        ('relatorios.iterar_relatorio.estoque_baixo', lambda: consumir(estoque.iterar_relatorio('estoque_baixo')), poucas, None),
+        ('relatorios.exportar_relatorio.valorizacao_csv', estoque.exportar_relatorio, poucas,
+         lambda: ('valorizacao', Path(diretorio_temporario) / 'valorizacao.csv')),
+
+        # Gravações
+        ('gravacao.registrar_saida', estoque.registrar_saida, r, lambda: (produto_benchmark, 1)),
+        ('gravacao.registrar_saidas_por_codigo', estoque.registrar_saidas_por_codigo, r, lambda: (leituras_lote,)),
+        ('gravacao.registrar_venda.15_itens', estoque.registrar_venda, r, lambda: (itens_venda,)),
+        ('gravacao.registrar_entrada', estoque.registrar_entrada, r,
+         lambda: (aplicativo.Produto(f"Produto novo {next(novos_produtos)}", 10, 500, ""), 10)),
+        ('gravacao.adicionar_ou_atualizar_produto', estoque.adicionar_ou_atualizar_produto, r,
+         lambda: ("Produto do benchmark", 1, 990, "")),
+        ('gravacao.atualizar_quantidade_produto', estoque.atualizar_quantidade_produto, r, lambda: (produto_benchmark, 1)),
+        ('gravacao.definir_limite_alerta', estoque.definir_limite_alerta, r, lambda: (produto_benchmark, 5)),
+        ('gravacao.definir_limite_alerta_por_nome', estoque.definir_limite_alerta_por_nome, poucas,
+         lambda: (nome_produto, 5)),
+        ('gravacao.definir_configuracao', estoque.definir_configuracao, r, lambda: ('benchmark', 1)),
+        ('gravacao.importar_produtos_csv.1000_linhas', estoque.importar_produtos_csv, poucas, lambda: (caminho_csv,)),
+        ('gravacao.apagar_produto', estoque.apagar_produto, poucas, produto_para_apagar),
+        ('gravacao.atualizar_pontos_controle', estoque.atualizar_pontos_controle, poucas, None),
+        # Por último, porque muda o banco: arquiva o que tem mais de um ano
+        ('gravacao.compactar_movimentacoes', estoque.compactar_movimentacoes, 1, lambda: (365,)),
+    ]
+    dados = {'produtos': quantidade_produtos, 'movimentacoes': quantidade_movimentacoes}
+    return casos, dados
+
+def executar_benchmarks(caminho_banco, repeticoes=50, filtro=None, ao_medir=None):
+    # Copia o banco para uma pasta temporária e mede todos os casos nela; devolve o dicionário gravado no JSON
+    with tempfile.TemporaryDirectory() as diretorio_temporario:
+        copia = Path(diretorio_temporario) / 'estoque_benchmark.db'
+        shutil.copyfile(caminho_banco, copia)
+        estoque = aplicativo.Estoque(copia)
+        try:
+            casos, dados = montar_casos(estoque, diretorio_temporario, repeticoes)
+            resultados = {}
+            for nome, funcao, repeticoes_caso, preparar in casos:
+                if filtro and filtro not in nome:
+                    continue
+                if funcao is None:
+                    resultados[nome] = {'pulado': preparar}
+                else:
+                    resultados[nome] = resumir(medir(funcao, repeticoes_caso, preparar))
+                if ao_medir:
+                    ao_medir(nome, resultados[nome])
+        finally:
+            estoque.fechar()
+    return {
+        'data_hora': datetime.datetime.now().isoformat(timespec='seconds'),
+        'versao': versao_do_codigo(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'dados': dados,
+        'resultados': resultados,
+    }
+
+def versao_do_codigo():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(anteriores, atuais, tolerancia=0.2, diferenca_minima_ms=0.05):
+    # Compara as medianas de duas execuções; devolve a lista de (nome, antes_ms, depois_ms, razao) que ficaram
+    # mais de 'tolerancia' mais lentas e pelo menos diferenca_minima_ms mais lentas (medições de poucos
+    # microssegundos variam demais entre execuções para serem comparadas só pela razão)
+    regressoes = []
+    for nome, atual in atuais['resultados'].items():
+        anterior = anteriores['resultados'].get(nome)
+        if not anterior or 'mediana_ms' not in anterior or 'mediana_ms' not in atual:
+            continue
+        razao = atual['mediana_ms'] / anterior['mediana_ms'] if anterior['mediana_ms'] else float('inf')
+        mais_lento = razao > 1 + tolerancia and atual['mediana_ms'] - anterior['mediana_ms'] >= diferenca_minima_ms
+        marca = "  <-- mais lento" if mais_lento else ""
+        print(f"{nome:60} {anterior['mediana_ms']:10.3f} ms -> {atual['mediana_ms']:10.3f} ms ({razao:5.2f}x){marca}")
+        if marca:
+            regressoes.append((nome, anterior['mediana_ms'], atual['mediana_ms'], razao))
+    return regressoes
+
+def banco_de_dados(produtos, movimentacoes, semente=42):
+    # Gera o banco sintético na primeira vez e o reaproveita depois
+    caminho = DIRETORIO_DADOS / f"estoque_{produtos}_{movimentacoes}_{semente}.db"
+    if not caminho.exists():
+        DIRETORIO_DADOS.mkdir(exist_ok=True)
+        print(f"Gerando {caminho.name} ({produtos:,} produtos, {movimentacoes:,} movimentações)...", file=sys.stderr)
+        temporario = caminho.with_suffix('.gerando')
+        if temporario.exists():
+            os.remove(temporario)
+        gerar_banco(temporario, produtos, movimentacoes, semente=semente)
+        os.replace(temporario, caminho)
+    return caminho
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do Aplicativo de Estoque")
+    parser.add_argument('--tamanho', choices=TAMANHOS, default='pequeno')
+    parser.add_argument('--produtos', type=int, help="quantidade de produtos (substitui a do tamanho)")
+    parser.add_argument('--movimentacoes', type=int, help="quantidade de movimentações (substitui a do tamanho)")
+    parser.add_argument('--banco', help="usa este banco (gerado por benchmarks.gerar_dados) em vez de gerar um")
+    parser.add_argument('--repeticoes', type=int, default=50, help="repetições das medições rápidas")
+    parser.add_argument('--filtro', help="mede só os casos cujo nome contém este texto")
+    parser.add_argument('--saida', help="arquivo JSON onde gravar os resultados")
+    parser.add_argument('--comparar', metavar='JSON', help="resultados anteriores para comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="aumento da mediana aceito na comparação (0.2 = 20%%)")
+    parser.add_argument('--diferenca-minima', type=float, default=0.05, metavar='MS',
+                        help="aumento da mediana, em ms, abaixo do qual a comparação ignora a diferença")
+    argumentos = parser.parse_args(argumentos)
+
+    if argumentos.banco:
+        caminho_banco = Path(argumentos.banco)
+    else:
+        produtos, movimentacoes = TAMANHOS[argumentos.tamanho]
+        produtos = argumentos.produtos or produtos
+        movimentacoes = argumentos.movimentacoes if argumentos.movimentacoes is not None else movimentacoes
+        caminho_banco = banco_de_dados(produtos, movimentacoes)
+
+    def mostrar(nome, resultado):
+        if 'pulado' in resultado:
+            print(f"{nome:60} pulado ({resultado['pulado']})")
+        else:
+            print(f"{nome:60} mediana {resultado['mediana_ms']:10.3f} ms   p95 {resultado['p95_ms']:10.3f} ms")
+
+    resultados = executar_benchmarks(caminho_banco, argumentos.repeticoes, argumentos.filtro, mostrar)
+    if argumentos.saida:
+        with open(argumentos.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {argumentos.saida}")
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as arquivo:
+            anteriores = json.load(arquivo)
+        regressoes = comparar(anteriores, resultados, argumentos.tolerancia, argumentos.diferenca_minima)
+        if regressoes:
+            print(f"{len(regressoes)} medições ficaram mais lentas que o aceito.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
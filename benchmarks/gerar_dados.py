@@ -0,0 +1,142 @@
+# Copyright (c) 2023, Paulo Ricardo de Souza Feitosa
+# Licensed under the MIT License.
+
+# Gera um banco de estoque sintético, no mesmo esquema do estoque_local.db (criado pelas migrações do
+# aplicativo), com produtos, códigos de barras, limites de alerta, caminhos de imagem e movimentações espalhadas
+# no tempo
+# A geração é determinística: a mesma semente gera sempre o mesmo banco
+#
+# Uso: python -m benchmarks.gerar_dados ARQUIVO.db [--tamanho pequeno|medio|grande] [--produtos N]
+#                                       [--movimentacoes N] [--dias N] [--semente N] [--imagens PASTA]
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+from benchmarks import aplicativo
+
+# Tamanhos prontos: (produtos, movimentações)
+TAMANHOS = {
+    'pequeno': (1000, 100000),
+    'medio': (10000, 1000000),
+    'grande': (100000, 10000000),
+}
+
+TIPOS_PRODUTO = ["Arroz", "Feijão", "Açúcar", "Café", "Leite", "Óleo", "Sabão", "Detergente", "Biscoito", "Macarrão",
+                 "Farinha", "Sal", "Molho de Tomate", "Cerveja", "Refrigerante", "Água Mineral", "Suco", "Queijo",
+                 "Presunto", "Manteiga", "Iogurte", "Achocolatado", "Papel Higiênico", "Shampoo", "Sabonete"]
+MARCAS = ["Tio João", "Camil", "União", "Pilão", "Italac", "Soya", "Omo", "Ypê", "Nestlé", "Vitarella",
+          "Dona Benta", "Qualy", "Sadia", "Piracanjuba", "Elefante"]
+UNIDADES = ["g", "kg", "ml", "L", "un"]
+
+# Quantidade de movimentações gravadas por transação durante a geração
+TAMANHO_LOTE = 100000
+
+def gerar_imagens(diretorio, quantidade, aleatorio):
+    # Gera algumas fotos JPEG de tamanho realista, reaproveitadas pelos produtos
+    from PIL import Image
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    caminhos = []
+    for i in range(quantidade):
+        caminho = diretorio / f"produto_{i}.jpg"
+        if not caminho.exists():
+            cor = tuple(aleatorio.randrange(256) for _ in range(3))
+            Image.new('RGB', (1200, 900), cor).save(caminho, quality=85)
+        caminhos.append(str(caminho))
+    return caminhos
+
+def gerar_produtos(quantidade, aleatorio, caminhos_imagem, fracao_com_imagem=0.5):
+    for i in range(quantidade):
+        nome = f"{aleatorio.choice(TIPOS_PRODUTO)} {aleatorio.choice(MARCAS)} {aleatorio.randint(1, 999)}{aleatorio.choice(UNIDADES)} #{i + 1}"
+        if aleatorio.random() < fracao_com_imagem:
+            caminho_imagem = aleatorio.choice(caminhos_imagem) if caminhos_imagem else f"C:/Imagens/Produtos/produto_{i + 1}.jpg"
+        else:
+            caminho_imagem = ""
+        # Código de barras de 13 dígitos, único por produto
+        yield nome, aleatorio.randint(0, 500), aleatorio.randint(50, 15000), caminho_imagem, f"789{i + 1:010d}"
+
+def gerar_movimentacoes(quantidade, quantidade_produtos, dias, aleatorio):
+    # Movimentações em ordem cronológica nos últimos 'dias' dias, como acontece na loja
+    # Como no varejo, 20% dos produtos concentram 80% das saídas; 30% das movimentações são entradas
+    inicio = time.time() - dias * 86400
+    intervalo = dias * 86400 / max(quantidade, 1)
+    produtos_populares = max(1, quantidade_produtos // 5)
+    segundos = 0.0
+    for _ in range(quantidade):
+        segundos += aleatorio.uniform(0, 2 * intervalo)
+        if aleatorio.random() < 0.3:
+            tipo = 'entrada'
+            produto_id = aleatorio.randint(1, quantidade_produtos)
+            quantidade_movimentada = aleatorio.randint(10, 200)
+        else:
+            tipo = 'saida'
+            if aleatorio.random() < 0.8:
+                produto_id = aleatorio.randint(1, produtos_populares)
+            else:
+                produto_id = aleatorio.randint(1, quantidade_produtos)
+            quantidade_movimentada = aleatorio.randint(1, 10)
+        yield produto_id, tipo, quantidade_movimentada, int(inicio + segundos)
+
+def gerar_banco(caminho_banco, produtos=1000, movimentacoes=100000, dias=730, semente=42, diretorio_imagens=None,
+                fracao_com_alerta=0.2, ao_progredir=None):
+    # Cria o banco em caminho_banco (que não deve existir) e o preenche; ao_progredir(movimentacoes_gravadas)
+    # é chamada a cada lote
+    caminho_banco = Path(caminho_banco)
+    if caminho_banco.exists():
+        raise FileExistsError(f"O banco {caminho_banco} já existe.")
+    aleatorio = random.Random(semente)
+    caminhos_imagem = gerar_imagens(diretorio_imagens, min(produtos, 50), aleatorio) if diretorio_imagens else []
+
+    # O Estoque cria o esquema completo pelas migrações, com índices e gatilhos
+    estoque = aplicativo.Estoque(caminho_banco)
+    try:
+        with estoque.transacao():
+            estoque.cursor.executemany("INSERT INTO produtos (nome, quantidade, preco_venda, caminho_imagem, codigo_barras) VALUES (?, ?, ?, ?, ?)",
+                                       gerar_produtos(produtos, aleatorio, caminhos_imagem))
+            estoque.cursor.executemany("INSERT INTO alertas (produto_id, valor) VALUES (?, ?)",
+                                       [(produto_id, aleatorio.randint(5, 50)) for produto_id in range(1, produtos + 1)
+                                        if aleatorio.random() < fracao_com_alerta])
+
+        # As movimentações passam pelos gatilhos (vendas por dia e por mês), como no uso normal
+        geradas = gerar_movimentacoes(movimentacoes, produtos, dias, aleatorio)
+        gravadas = 0
+        while gravadas < movimentacoes:
+            tamanho = min(TAMANHO_LOTE, movimentacoes - gravadas)
+            with estoque.transacao():
+                estoque.cursor.executemany("INSERT INTO movimentacoes (produto_id, tipo, quantidade, data_hora) VALUES (?, ?, ?, ?)",
+                                           (next(geradas) for _ in range(tamanho)))
+            gravadas += tamanho
+            if ao_progredir:
+                ao_progredir(gravadas)
+        # Os pontos de controle do estoque, como a migração os criaria para um banco com este histórico
+        estoque.reconstruir_pontos_controle()
+        estoque.cursor.execute("ANALYZE")
+    finally:
+        estoque.fechar()
+    return caminho_banco
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Gera um banco de estoque sintético para os benchmarks")
+    parser.add_argument('banco', help="arquivo .db a ser criado")
+    parser.add_argument('--tamanho', choices=TAMANHOS, default='pequeno')
+    parser.add_argument('--produtos', type=int, help="quantidade de produtos (substitui a do tamanho)")
+    parser.add_argument('--movimentacoes', type=int, help="quantidade de movimentações (substitui a do tamanho)")
+    parser.add_argument('--dias', type=int, default=730, help="período coberto pelas movimentações")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--imagens', metavar='PASTA', help="gera fotos JPEG de verdade nesta pasta para os produtos")
+    argumentos = parser.parse_args(argumentos)
+
+    produtos, movimentacoes = TAMANHOS[argumentos.tamanho]
+    produtos = argumentos.produtos or produtos
+    movimentacoes = argumentos.movimentacoes if argumentos.movimentacoes is not None else movimentacoes
+    inicio = time.perf_counter()
+    gerar_banco(argumentos.banco, produtos, movimentacoes, argumentos.dias, argumentos.semente, argumentos.imagens,
+                ao_progredir=lambda gravadas: print(f"{gravadas:,} de {movimentacoes:,} movimentações", file=sys.stderr))
+    print(f"Banco {argumentos.banco} gerado em {time.perf_counter() - inicio:.1f} s: "
+          f"{produtos:,} produtos e {movimentacoes:,} movimentações.")
+
+if __name__ == "__main__":
+    main()